@@ -2,20 +2,17 @@ from __future__ import annotations
 
 import os
 import uuid
-import json
-from collections import defaultdict
+import logging
 from pathlib import Path
 import sys
-from typing import Any, DefaultDict, Dict, List, Optional, Set
+from typing import List, Optional
 
 import uvicorn
 from dotenv import load_dotenv
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Header, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
 from starlette.responses import Response
 
@@ -23,31 +20,25 @@ ROOT_DIR = Path(__file__).resolve().parent.parent
 if str(ROOT_DIR) not in sys.path:
     sys.path.insert(0, str(ROOT_DIR))
 
-from healthcare_lab.agents.healthcare_handoff import Agent
-from database import get_db, init_db
-from auth import hash_password, verify_password, create_token, decode_token
+from healthcare_lab.agents.healthcare_handoff import AGENT_POOL, Agent
+from database import ConnectionPool, init_db
+from repository import CarePathRepository, InvalidCursor, SessionNotFound, SessionPage, UnsupportedEvent, decode_cursor
+from write_queue import EventWriteQueue, SessionEventSink
+from streaming import ConnectionManager
+from event_bus import create_event_bus
+from state_store import SessionState, StateConflictError, create_state_store
+from scheduler import SchedulerSaturated, TurnScheduler
+from middleware import SecurityHeadersMiddleware
+from static_assets import StaticAssets
+from auth import PASSWORD_HASHER, PasswordHasherBusy, create_token, decode_token
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI()
 
 # ─── Security Headers Middleware ───
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next) -> Response:
-        response = await call_next(request)
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-        response.headers["Content-Security-Policy"] = (
-            "default-src 'self'; "
-            "script-src 'self'; "
-            "style-src 'self' 'unsafe-inline' https://fonts.googleapis.com; "
-            "font-src 'self' https://fonts.gstatic.com; "
-            "img-src 'self' data:; "
-            "connect-src 'self' ws: wss:;"
-        )
-        return response
-
 app.add_middleware(SecurityHeadersMiddleware)
 
 app.add_middleware(
@@ -59,11 +50,53 @@ app.add_middleware(
 )
 
 UI_ROOT = ROOT_DIR / "ui"
-if UI_ROOT.exists():
-    app.mount("/ui", StaticFiles(directory=str(UI_ROOT)), name="ui")
+UI_ASSETS = StaticAssets(UI_ROOT) if UI_ROOT.exists() else None
+if UI_ASSETS is not None:
+    app.mount("/ui", UI_ASSETS, name="ui")
+
+
+DB_POOL = ConnectionPool()
+REPO = CarePathRepository(DB_POOL)
+
 
+async def _rehydrate_state(session_id: str) -> Optional[SessionState]:
+    """Rebuild session state from the persisted conversation when no spilled state exists."""
+    messages = await REPO.load_conversation(session_id)
+    if not messages:
+        return None
+    return {
+        f"{session_id}_chat_history": messages,
+        f"{session_id}_healthcare_turn": sum(1 for m in messages if m["role"] == "user"),
+    }
 
-STATE_STORE: Dict[str, Any] = {}
+
+STATE_STORE = create_state_store(DB_POOL, loader=_rehydrate_state)
+STATE_CONFLICT_MESSAGE = "This session was updated by another request. Please retry your message."
+
+
+async def _claim_turn(session_id: str, state: SessionState) -> bool:
+    try:
+        await STATE_STORE.claim(session_id, state)
+        return True
+    except StateConflictError:
+        logger.warning("Rejected turn for session %s; another turn is running or finished first.", session_id)
+        return False
+
+
+async def _save_state(session_id: str, state: SessionState) -> bool:
+    try:
+        await STATE_STORE.save(session_id, state)
+        return True
+    except StateConflictError:
+        logger.warning("Discarded stale state for session %s after a concurrent turn.", session_id)
+        return False
+
+
+# Serializes turns per session and caps concurrent workflows across sessions.
+SCHEDULER = TurnScheduler()
+WRITE_QUEUE = EventWriteQueue(DB_POOL)
+MAX_EVENTS_PER_BATCH = 500
+MAX_HISTORY_PAGE = 500
 
 
 # ─── Pydantic Models ───
@@ -109,6 +142,10 @@ class SessionEventRequest(BaseModel):
     payload: dict
 
 
+class SessionEventBatchRequest(BaseModel):
+    events: List[SessionEventRequest]
+
+
 # ─── Auth Dependency ───
 
 def get_current_user(authorization: str = Header(...)) -> dict:
@@ -130,27 +167,28 @@ def error_response(status: int, code: str, message: str):
 
 # ─── Auth Endpoints ───
 
+def _client_ip(request: Request) -> Optional[str]:
+    return request.client.host if request.client else None
+
+
 @app.post("/api/register")
-async def register(req: RegisterRequest):
+async def register(req: RegisterRequest, request: Request):
     if not req.email or "@" not in req.email:
         return error_response(400, "invalid_email", "Please provide a valid email address.")
     if len(req.password) < 8:
         return error_response(400, "weak_password", "Password must be at least 8 characters long.")
 
-    db = get_db()
-    existing = db.execute("SELECT id FROM users WHERE email=?", (req.email.lower().strip(),)).fetchone()
-    if existing:
-        db.close()
+    email = req.email.lower().strip()
+    if await REPO.email_in_use(email):
         return error_response(409, "email_exists", "An account with this email already exists.")
 
+    try:
+        password_hash = await PASSWORD_HASHER.hash(req.password, client=_client_ip(request), account=email)
+    except PasswordHasherBusy as exc:
+        return error_response(429, "too_many_requests", str(exc))
+
     user_id = str(uuid.uuid4())
-    email = req.email.lower().strip()
-    db.execute(
-        "INSERT INTO users (id, email, password, display_name) VALUES (?,?,?,?)",
-        (user_id, email, hash_password(req.password), req.display_name.strip()),
-    )
-    db.commit()
-    db.close()
+    await REPO.create_user(user_id, email, password_hash, req.display_name.strip())
     token = create_token(user_id, email)
     return TokenResponse(
         access_token=token,
@@ -159,12 +197,24 @@ async def register(req: RegisterRequest):
 
 
 @app.post("/api/login")
-async def login(req: LoginRequest):
-    db = get_db()
-    row = db.execute("SELECT * FROM users WHERE email=?", (req.email.lower().strip(),)).fetchone()
-    db.close()
-    if not row or not verify_password(req.password, row["password"]):
+async def login(req: LoginRequest, request: Request):
+    email = req.email.lower().strip()
+    row = await REPO.get_user_by_email(email)
+    if not row:
         return error_response(401, "invalid_credentials", "Invalid email or password.")
+    client = _client_ip(request)
+    try:
+        valid = await PASSWORD_HASHER.verify(req.password, row["password"], client=client, account=email)
+    except PasswordHasherBusy as exc:
+        return error_response(429, "too_many_requests", str(exc))
+    if not valid:
+        return error_response(401, "invalid_credentials", "Invalid email or password.")
+    # Upgrade hashes made with an older work factor while the password is at hand.
+    if PASSWORD_HASHER.needs_rehash(row["password"]):
+        try:
+            await REPO.update_password(row["id"], await PASSWORD_HASHER.hash(req.password, client=client))
+        except PasswordHasherBusy:
+            logger.info("Deferred password rehash for user %s; hasher busy.", row["id"])
     token = create_token(row["id"], row["email"])
     return TokenResponse(
         access_token=token,
@@ -174,264 +224,231 @@ async def login(req: LoginRequest):
 
 @app.get("/api/me")
 async def me(user: dict = Depends(get_current_user)):
-    db = get_db()
-    row = db.execute("SELECT id, email, display_name, created_at, updated_at FROM users WHERE id=?", (user["sub"],)).fetchone()
-    db.close()
+    row = await REPO.get_profile(user["sub"])
     if not row:
         return error_response(404, "user_not_found", "User not found.")
-    return dict(row)
+    return row
 
 
 @app.put("/api/settings")
 async def update_settings(req: UpdateProfileRequest, user: dict = Depends(get_current_user)):
-    db = get_db()
-
+    email = None
     if req.email is not None:
         email = req.email.lower().strip()
         if not email or "@" not in email:
-            db.close()
             return error_response(400, "invalid_email", "Please provide a valid email address.")
-        existing = db.execute("SELECT id FROM users WHERE email=? AND id!=?", (email, user["sub"])).fetchone()
-        if existing:
-            db.close()
+        if await REPO.email_in_use(email, exclude_user_id=user["sub"]):
             return error_response(409, "email_exists", "This email is already in use by another account.")
-        db.execute("UPDATE users SET email=?, updated_at=strftime('%Y-%m-%dT%H:%M:%SZ', 'now') WHERE id=?", (email, user["sub"]))
-
-    if req.display_name is not None:
-        db.execute("UPDATE users SET display_name=?, updated_at=strftime('%Y-%m-%dT%H:%M:%SZ', 'now') WHERE id=?", (req.display_name.strip(), user["sub"]))
-
-    db.commit()
-    row = db.execute("SELECT id, email, display_name, created_at, updated_at FROM users WHERE id=?", (user["sub"],)).fetchone()
-    db.close()
-    return dict(row)
 
-
-# ─── Session helpers ───
-
-def _get_latest_session(db, user_id: str):
-    return db.execute(
-        "SELECT id, title, summary, created_at, updated_at FROM sessions WHERE user_id=? ORDER BY updated_at DESC LIMIT 1",
-        (user_id,),
-    ).fetchone()
-
-
-def _build_light_summary(messages: list[dict]) -> str:
-    if not messages:
-        return ""
-    trimmed = messages[-6:]
-    lines = []
-    for item in trimmed:
-        role = item.get("role", "assistant")
-        content = item.get("content", "")
-        content = content.replace("\n", " ").strip()
-        if len(content) > 160:
-            content = content[:157] + "..."
-        lines.append(f"{role}: {content}")
-    return " | ".join(lines)
+    display_name = req.display_name.strip() if req.display_name is not None else None
+    return await REPO.update_profile(user["sub"], email, display_name)
 
 
 # ─── Sessions API ───
 
 @app.post("/api/sessions")
 async def create_session(req: SessionCreateRequest, user: dict = Depends(get_current_user)):
-    db = get_db()
     session_id = str(uuid.uuid4())
     title = req.title.strip() if req.title else ""
-    db.execute(
-        "INSERT INTO sessions (id, user_id, title) VALUES (?,?,?)",
-        (session_id, user["sub"], title),
-    )
-    db.commit()
-    db.close()
+    await REPO.create_session(session_id, user["sub"], title)
     return {"id": session_id, "title": title}
 
 
-@app.get("/api/sessions/latest")
-async def get_latest_session(user: dict = Depends(get_current_user)):
-    db = get_db()
-    session = _get_latest_session(db, user["sub"])
-    if not session:
-        db.close()
-        return error_response(404, "no_session", "No session found.")
+def _page_options(
+    limit: Optional[int], before: Optional[str], since: Optional[str], if_none_match: Optional[str]
+) -> dict:
+    """Validate history paging query parameters; raises ValueError with a client message."""
+    if limit is not None and not 1 <= limit <= MAX_HISTORY_PAGE:
+        raise ValueError(f"limit must be between 1 and {MAX_HISTORY_PAGE}.")
+    if before and since:
+        raise ValueError("Use either before or since, not both.")
+    try:
+        return {
+            "limit": limit,
+            "before": decode_cursor(before) if before else None,
+            "since": decode_cursor(since) if since else None,
+            "if_none_match": if_none_match,
+        }
+    except InvalidCursor:
+        raise ValueError("Invalid cursor.") from None
 
-    messages = db.execute(
-        "SELECT role, content, ts FROM messages WHERE session_id=? ORDER BY ts ASC",
-        (session["id"],),
-    ).fetchall()
-    artifacts = db.execute(
-        "SELECT artifact_type, payload_json, ts FROM artifacts WHERE session_id=? ORDER BY ts ASC",
-        (session["id"],),
-    ).fetchall()
-    handoffs = db.execute(
-        "SELECT kind, content, ts FROM handoffs WHERE session_id=? ORDER BY ts ASC",
-        (session["id"],),
-    ).fetchall()
-    db.close()
 
-    return {
-        "session": dict(session),
-        "messages": [dict(row) for row in messages],
-        "artifacts": [dict(row) for row in artifacts],
-        "handoffs": [dict(row) for row in handoffs],
-    }
+def _page_response(page: SessionPage):
+    headers = {"ETag": page.etag, "Cache-Control": "private, no-cache"}
+    if page.history is None:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(page.history, headers=headers)
 
 
-@app.get("/api/sessions/{session_id}")
-async def get_session_by_id(session_id: str, user: dict = Depends(get_current_user)):
-    db = get_db()
-    session = db.execute(
-        "SELECT id, title, summary, created_at, updated_at FROM sessions WHERE id=? AND user_id=?",
-        (session_id, user["sub"]),
-    ).fetchone()
-    if not session:
-        db.close()
-        return error_response(404, "session_not_found", "Session not found.")
+@app.get("/api/sessions/latest")
+async def get_latest_session(
+    limit: Optional[int] = None,
+    before: Optional[str] = None,
+    since: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    user: dict = Depends(get_current_user),
+):
+    try:
+        options = _page_options(limit, before, since, if_none_match)
+    except ValueError as exc:
+        return error_response(400, "invalid_page", str(exc))
+    page = await REPO.get_latest_session(user["sub"], **options)
+    if not page:
+        return error_response(404, "no_session", "No session found.")
+    return _page_response(page)
 
-    messages = db.execute(
-        "SELECT role, content, ts FROM messages WHERE session_id=? ORDER BY ts ASC",
-        (session_id,),
-    ).fetchall()
-    artifacts = db.execute(
-        "SELECT artifact_type, payload_json, ts FROM artifacts WHERE session_id=? ORDER BY ts ASC",
-        (session_id,),
-    ).fetchall()
-    handoffs = db.execute(
-        "SELECT kind, content, ts FROM handoffs WHERE session_id=? ORDER BY ts ASC",
-        (session_id,),
-    ).fetchall()
-    db.close()
 
-    return {
-        "session": dict(session),
-        "messages": [dict(row) for row in messages],
-        "artifacts": [dict(row) for row in artifacts],
-        "handoffs": [dict(row) for row in handoffs],
-    }
+@app.get("/api/sessions/{session_id}")
+async def get_session_by_id(
+    session_id: str,
+    limit: Optional[int] = None,
+    before: Optional[str] = None,
+    since: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    user: dict = Depends(get_current_user),
+):
+    try:
+        options = _page_options(limit, before, since, if_none_match)
+    except ValueError as exc:
+        return error_response(400, "invalid_page", str(exc))
+    page = await REPO.get_session(session_id, user["sub"], **options)
+    if not page:
+        return error_response(404, "session_not_found", "Session not found.")
+    return _page_response(page)
 
 
 @app.get("/api/sessions")
 async def list_sessions(user: dict = Depends(get_current_user)):
-    db = get_db()
-    rows = db.execute(
-        "SELECT id, title, summary, created_at, updated_at FROM sessions WHERE user_id=? ORDER BY updated_at DESC",
-        (user["sub"],),
-    ).fetchall()
-    db.close()
-    return {"sessions": [dict(r) for r in rows]}
+    return {"sessions": await REPO.list_sessions(user["sub"])}
+
+
+async def _persist_events(session_id: str, user_id: str, events: List[tuple[str, dict]]):
+    try:
+        await WRITE_QUEUE.submit(session_id, user_id, events)
+    except SessionNotFound:
+        return error_response(404, "session_not_found", "Session not found.")
+    except UnsupportedEvent:
+        return error_response(400, "invalid_event", "Unsupported event_type.")
+    return None
 
 
 @app.post("/api/sessions/{session_id}/events")
 async def append_session_event(
     session_id: str, req: SessionEventRequest, user: dict = Depends(get_current_user)
 ):
-    db = get_db()
-    owned = db.execute("SELECT id FROM sessions WHERE id=? AND user_id=?", (session_id, user["sub"])).fetchone()
-    if not owned:
-        db.close()
-        return error_response(404, "session_not_found", "Session not found.")
+    error = await _persist_events(session_id, user["sub"], [(req.event_type, req.payload or {})])
+    return error or {"status": "ok"}
 
-    event_type = req.event_type
-    payload = req.payload or {}
-    now_update = "strftime('%Y-%m-%dT%H:%M:%SZ', 'now')"
 
-    if event_type == "message":
-        msg_id = str(uuid.uuid4())
-        db.execute(
-            "INSERT INTO messages (id, session_id, role, content) VALUES (?,?,?,?)",
-            (msg_id, session_id, payload.get("role", "assistant"), payload.get("content", "")),
-        )
-        # update summary
-        rows = db.execute(
-            "SELECT role, content FROM messages WHERE session_id=? ORDER BY ts ASC",
-            (session_id,),
-        ).fetchall()
-        summary = _build_light_summary([dict(r) for r in rows])
-        db.execute(
-            f"UPDATE sessions SET summary=?, updated_at={now_update} WHERE id=?",
-            (summary, session_id),
-        )
-    elif event_type == "artifact":
-        art_id = str(uuid.uuid4())
-        db.execute(
-            "INSERT INTO artifacts (id, session_id, artifact_type, payload_json) VALUES (?,?,?,?)",
-            (art_id, session_id, payload.get("artifact_type", "unknown"), json.dumps(payload.get("data", {}))),
-        )
-        db.execute(f"UPDATE sessions SET updated_at={now_update} WHERE id=?", (session_id,))
-    elif event_type == "handoff":
-        handoff_id = str(uuid.uuid4())
-        db.execute(
-            "INSERT INTO handoffs (id, session_id, kind, content) VALUES (?,?,?,?)",
-            (handoff_id, session_id, payload.get("kind", "info"), payload.get("content", "")),
-        )
-        db.execute(f"UPDATE sessions SET updated_at={now_update} WHERE id=?", (session_id,))
-    else:
-        db.close()
-        return error_response(400, "invalid_event", "Unsupported event_type.")
-
-    db.commit()
-    db.close()
-    return {"status": "ok"}
+@app.post("/api/sessions/{session_id}/events/batch")
+async def append_session_events(
+    session_id: str, req: SessionEventBatchRequest, user: dict = Depends(get_current_user)
+):
+    if len(req.events) > MAX_EVENTS_PER_BATCH:
+        return error_response(413, "batch_too_large", f"At most {MAX_EVENTS_PER_BATCH} events per batch.")
+    events = [(event.event_type, event.payload or {}) for event in req.events]
+    # Events are applied in order inside one transaction; the response is sent after commit.
+    error = await _persist_events(session_id, user["sub"], events)
+    return error or {"status": "ok", "persisted": len(events)}
 
 
 # ─── Startup ───
 
 @app.on_event("startup")
-def startup():
+async def startup():
     init_db()
+    WRITE_QUEUE.start()
+    # Warm the shared agent pool so the first chat turn does not pay client setup.
+    if AGENT_POOL.is_configured:
+        try:
+            await AGENT_POOL.warm_up()
+        except Exception:
+            logger.exception("Agent pool warm-up failed; agents will be created on first use.")
 
 
-# ─── Connection Manager ───
-
-class ConnectionManager:
-    def __init__(self) -> None:
-        self.sessions: DefaultDict[str, Set[WebSocket]] = defaultdict(set)
-
-    async def connect(self, session_id: str, ws: WebSocket) -> None:
-        self.sessions[session_id].add(ws)
+@app.on_event("shutdown")
+async def shutdown():
+    await AGENT_POOL.close()
+    await WRITE_QUEUE.close()
+    await MANAGER.bus.close()
+    await STATE_STORE.close()
+    PASSWORD_HASHER.close()
+    DB_POOL.close()
 
-    def disconnect(self, session_id: str, ws: WebSocket) -> None:
-        if session_id in self.sessions:
-            self.sessions[session_id].discard(ws)
-            if not self.sessions[session_id]:
-                self.sessions.pop(session_id, None)
-
-    async def broadcast(self, session_id: str, message: dict) -> None:
-        dead: List[WebSocket] = []
-        for ws in list(self.sessions.get(session_id, [])):
-            try:
-                await ws.send_json(message)
-            except Exception:
-                dead.append(ws)
-        for ws in dead:
-            self.disconnect(session_id, ws)
 
+# ─── Connection Manager ───
 
-MANAGER = ConnectionManager()
+MANAGER = ConnectionManager(bus=create_event_bus())
 
 
 # ─── REST Chat ───
 
 @app.post("/chat", response_model=ChatResponse)
 async def chat(req: ChatRequest) -> ChatResponse:
-    if req.pattern:
-        STATE_STORE[f"{req.session_id}_pattern"] = req.pattern
-    agent = Agent(STATE_STORE, req.session_id)
-    answer = await agent.chat_async(req.prompt)
+    try:
+        async with SCHEDULER.turn(req.session_id):
+            state = await STATE_STORE.load(req.session_id)
+            if not await _claim_turn(req.session_id, state):
+                return error_response(409, "state_conflict", STATE_CONFLICT_MESSAGE)
+            if req.pattern:
+                state[f"{req.session_id}_pattern"] = req.pattern
+            agent = Agent(state, req.session_id, pool=AGENT_POOL)
+            try:
+                answer = await agent.chat_async(req.prompt)
+            except Exception:
+                await _save_state(req.session_id, state)
+                raise
+            if not await _save_state(req.session_id, state):
+                return error_response(409, "state_conflict", STATE_CONFLICT_MESSAGE)
+    except SchedulerSaturated as exc:
+        return error_response(503, "busy", str(exc))
     return ChatResponse(response=answer)
 
 
 @app.get("/")
-async def serve_ui() -> FileResponse:
-    return FileResponse(str(UI_ROOT / "index.html"))
+async def serve_ui(request: Request) -> Response:
+    if UI_ASSETS is None:
+        return FileResponse(str(UI_ROOT / "index.html"))
+    return UI_ASSETS.index_response(request.headers)
 
 
 # ─── WebSocket Chat ───
 
+async def _run_ws_turn(session_id: str, user_id: str, prompt: str, pattern: Optional[str]) -> None:
+    state = await STATE_STORE.load(session_id)
+    # Reserve the turn up front: a conflict found after the run would come after its result was sent and persisted.
+    if not await _claim_turn(session_id, state):
+        await MANAGER.broadcast(session_id, {"type": "error", "message": STATE_CONFLICT_MESSAGE})
+        return
+    if pattern:
+        state[f"{session_id}_pattern"] = pattern
+
+    agent = Agent(state, session_id, pool=AGENT_POOL)
+    if hasattr(agent, "set_websocket_manager"):
+        agent.set_websocket_manager(MANAGER)
+    sink = SessionEventSink(WRITE_QUEUE, session_id, user_id)
+    agent.set_event_sink(sink)
+
+    try:
+        await agent.chat_async(prompt)
+    except Exception as exc:
+        await _save_state(session_id, state)
+        sink.record("message", {"role": "error", "content": str(exc)})
+        await MANAGER.broadcast(session_id, {"type": "error", "message": str(exc)})
+        return
+
+    if await _save_state(session_id, state):
+        await MANAGER.broadcast(session_id, {"type": "done"})
+    else:
+        await MANAGER.broadcast(session_id, {"type": "error", "message": STATE_CONFLICT_MESSAGE})
+
+
 @app.websocket("/ws/chat")
 async def ws_chat(ws: WebSocket):
     await ws.accept()
     connected_session: Optional[str] = None
-    authenticated = False
+    owned_session: Optional[str] = None
+    user_id: Optional[str] = None
 
     try:
         while True:
@@ -446,7 +463,7 @@ async def ws_chat(ws: WebSocket):
                 continue
 
             # Authenticate on first message
-            if not authenticated:
+            if user_id is None:
                 if not access_token:
                     await ws.send_json({"type": "auth_error", "message": "Authentication required. Please log in."})
                     await ws.close(1008)
@@ -456,27 +473,33 @@ async def ws_chat(ws: WebSocket):
                     await ws.send_json({"type": "auth_error", "message": "Session expired. Please log in again."})
                     await ws.close(1008)
                     return
-                authenticated = True
+                user_id = payload["sub"]
+
+            # Checked before the socket joins the session's stream or gets its replay log.
+            if session_id != owned_session:
+                if not await REPO.owns_session(session_id, user_id):
+                    await ws.send_json({"type": "error", "message": "Session not found."})
+                    await ws.close(1008)
+                    return
+                owned_session = session_id
 
             if connected_session is None:
-                await MANAGER.connect(session_id, ws)
+                # A reconnecting client sends the last seq it saw to get the frames it missed.
+                resume_from = data.get("resume_from")
+                await MANAGER.connect(session_id, ws, resume_from=resume_from if isinstance(resume_from, int) else None)
                 connected_session = session_id
                 await ws.send_json({"type": "info", "message": f"Registered session {session_id}"})
 
             if not prompt:
                 continue
 
-            if pattern:
-                STATE_STORE[f"{session_id}_pattern"] = pattern
-
-            agent = Agent(STATE_STORE, session_id)
-            if hasattr(agent, "set_websocket_manager"):
-                agent.set_websocket_manager(MANAGER)
+            async def announce_queue(ahead: int, depth: int) -> None:
+                await MANAGER.broadcast(session_id, {"type": "queue", "position": ahead, "depth": depth})
 
             try:
-                await agent.chat_async(prompt)
-                await MANAGER.broadcast(session_id, {"type": "done"})
-            except Exception as exc:
+                async with SCHEDULER.turn(session_id, on_queued=announce_queue):
+                    await _run_ws_turn(session_id, user_id, prompt, pattern)
+            except SchedulerSaturated as exc:
                 await MANAGER.broadcast(session_id, {"type": "error", "message": str(exc)})
 
     except WebSocketDisconnect:
@@ -2,26 +2,119 @@
 
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Dict, Iterator, Optional, Tuple
 
 import bcrypt
 from jose import jwt, JWTError
 
 SECRET_KEY = os.getenv("CAREPATH_JWT_SECRET", "carepath-demo-secret-change-in-production")
+# Keys retired by a rotation, still accepted for verification until their tokens have expired.
+PREVIOUS_SECRET_KEYS = [key for key in os.getenv("CAREPATH_JWT_PREVIOUS_SECRETS", "").split(",") if key]
 ALGORITHM = "HS256"
 TOKEN_EXPIRE_MINUTES = 1440  # 24 hours
 
+BCRYPT_ROUNDS = int(os.getenv("CAREPATH_BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("CAREPATH_HASH_WORKERS", "2"))
+MAX_PENDING_HASHES = int(os.getenv("CAREPATH_MAX_PENDING_HASHES", "32"))
+MAX_HASHES_PER_CLIENT = int(os.getenv("CAREPATH_MAX_HASHES_PER_CLIENT", "2"))
+MAX_HASHES_PER_ACCOUNT = int(os.getenv("CAREPATH_MAX_HASHES_PER_ACCOUNT", "1"))
+TOKEN_CACHE_SIZE = int(os.getenv("CAREPATH_TOKEN_CACHE_SIZE", "4096"))
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+
+def hash_password(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=rounds)).decode()
 
 
 def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode(), hashed.encode())
 
 
+class PasswordHasherBusy(RuntimeError):
+    """Too many password hashes are already running for this client, account, or server."""
+
+
+class PasswordHasher:
+    """Runs bcrypt on a small dedicated thread pool instead of the event loop.
+
+    bcrypt releases the GIL while hashing, so threads give real parallelism
+    without blocking agent streams. Work is capped in total and per client IP
+    and per account; requests over a cap fail fast with PasswordHasherBusy.
+    """
+
+    def __init__(
+        self,
+        workers: int = HASH_WORKERS,
+        rounds: int = BCRYPT_ROUNDS,
+        max_pending: int = MAX_PENDING_HASHES,
+        max_per_client: int = MAX_HASHES_PER_CLIENT,
+        max_per_account: int = MAX_HASHES_PER_ACCOUNT,
+    ) -> None:
+        self.rounds = rounds
+        self.max_pending = max_pending
+        self.max_per_client = max_per_client
+        self.max_per_account = max_per_account
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="carepath-bcrypt")
+        self._pending = 0
+        self._per_client: Counter = Counter()
+        self._per_account: Counter = Counter()
+
+    @contextmanager
+    def _slot(self, client: Optional[str], account: Optional[str]) -> Iterator[None]:
+        if self._pending >= self.max_pending:
+            raise PasswordHasherBusy("The server is busy. Please try again in a moment.")
+        if client and self._per_client[client] >= self.max_per_client:
+            raise PasswordHasherBusy("Too many sign-in attempts from this address. Please wait a moment.")
+        if account and self._per_account[account] >= self.max_per_account:
+            raise PasswordHasherBusy("A sign-in for this account is already in progress. Please wait a moment.")
+        # Requests without a client address or account only count toward the global cap.
+        keyed = [(counter, key) for counter, key in ((self._per_client, client), (self._per_account, account)) if key]
+        self._pending += 1
+        for counter, key in keyed:
+            counter[key] += 1
+        try:
+            yield
+        finally:
+            self._pending -= 1
+            for counter, key in keyed:
+                counter[key] -= 1
+                if counter[key] <= 0:
+                    del counter[key]
+
+    async def hash(self, password: str, client: Optional[str] = None, account: Optional[str] = None) -> str:
+        with self._slot(client, account):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, hash_password, password, self.rounds)
+
+    async def verify(
+        self, password: str, hashed: str, client: Optional[str] = None, account: Optional[str] = None
+    ) -> bool:
+        with self._slot(client, account):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, verify_password, password, hashed)
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """True when ``hashed`` was made with a different work factor than configured."""
+        try:
+            return int(hashed.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+PASSWORD_HASHER = PasswordHasher()
+
+
 def create_token(user_id: str, email: str) -> str:
     payload = {
         "sub": user_id,
@@ -31,8 +124,64 @@ def create_token(user_id: str, email: str) -> str:
     return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
 
+class VerifiedTokenCache:
+    """Bounded LRU of verified JWT claims, keyed by a SHA-256 of the token.
+
+    Only successfully verified tokens are cached, and an entry is served only
+    until the token's ``exp``. Raw tokens are never kept in memory. Sync
+    FastAPI dependencies call it from threadpool threads, so access is locked.
+    """
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self._entries: "OrderedDict[bytes, Tuple[Dict, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            claims, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        return dict(claims)
+
+    def put(self, token: str, claims: dict) -> None:
+        if not self.max_size or "exp" not in claims:
+            return
+        key = self._key(token)
+        entry = (dict(claims), float(claims["exp"]))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+TOKEN_CACHE = VerifiedTokenCache()
+
+
 def decode_token(token: str) -> Optional[dict]:
-    try:
-        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-    except JWTError:
-        return None
+    claims = TOKEN_CACHE.get(token)
+    if claims is not None:
+        return claims
+    for key in (SECRET_KEY, *PREVIOUS_SECRET_KEYS):
+        try:
+            claims = jwt.decode(token, key, algorithms=[ALGORITHM])
+        except JWTError:
+            continue
+        TOKEN_CACHE.put(token, claims)
+        return claims
+    return None
@@ -0,0 +1,91 @@
+"""Benchmark authenticated request throughput with and without the verified-token cache.
+
+Issues a pool of tokens, then measures:
+
+- raw ``decode_token`` calls per second;
+- requests per second against a minimal FastAPI app whose route depends on the
+  same ``Authorization`` header handling as ``get_current_user`` in ``app.py``.
+
+Each is run with the cache disabled (every call re-verifies the JWT) and enabled.
+
+    python backend/benchmarks/bench_auth.py --tokens 50 --calls 200000 --requests 5000
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+import uuid
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from fastapi import Depends, FastAPI, Header, HTTPException  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from auth import TOKEN_CACHE, create_token, decode_token  # noqa: E402
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+
+    def current_user(authorization: str = Header(...)) -> dict:
+        token = authorization.replace("Bearer ", "") if authorization.startswith("Bearer ") else authorization
+        payload = decode_token(token)
+        if not payload:
+            raise HTTPException(status_code=401)
+        return payload
+
+    @app.get("/api/me")
+    async def me(user: dict = Depends(current_user)):
+        return {"id": user["sub"], "email": user["email"]}
+
+    return app
+
+
+def bench_decode(tokens: list[str], calls: int) -> float:
+    start = time.perf_counter()
+    for i in range(calls):
+        decode_token(tokens[i % len(tokens)])
+    return calls / (time.perf_counter() - start)
+
+
+def bench_requests(client: TestClient, tokens: list[str], requests: int) -> float:
+    headers = [{"Authorization": f"Bearer {token}"} for token in tokens]
+    start = time.perf_counter()
+    for i in range(requests):
+        response = client.get("/api/me", headers=headers[i % len(headers)])
+        assert response.status_code == 200
+    return requests / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=50, help="distinct users/tokens in rotation")
+    parser.add_argument("--calls", type=int, default=200_000, help="decode_token calls per run")
+    parser.add_argument("--requests", type=int, default=5_000, help="HTTP requests per run")
+    args = parser.parse_args()
+
+    tokens = [create_token(str(uuid.uuid4()), f"user{i}@example.com") for i in range(args.tokens)]
+    client = TestClient(build_app())
+    cache_size = TOKEN_CACHE.max_size or 4096
+
+    results = {}
+    for label, size in (("no cache", 0), ("cache", cache_size)):
+        TOKEN_CACHE.max_size = size
+        TOKEN_CACHE.clear()
+        results[label] = (bench_decode(tokens, args.calls), bench_requests(client, tokens, args.requests))
+
+    print(f"{'':>10} {'decode/s':>14} {'requests/s':>12}")
+    for label, (decodes, requests) in results.items():
+        print(f"{label:>10} {decodes:>14,.0f} {requests:>12,.0f}")
+    base_decodes, base_requests = results["no cache"]
+    cached_decodes, cached_requests = results["cache"]
+    print(f"{'speedup':>10} {cached_decodes / base_decodes:>13.1f}x {cached_requests / base_requests:>11.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Benchmark request throughput with the old and new SecurityHeadersMiddleware.
+
+Builds two minimal apps that mirror the CarePath middleware stack (security
+headers + CORS) with a JSON route standing in for ``/api/me`` and the real
+``ui/`` directory mounted at ``/ui``. One uses the previous
+``BaseHTTPMiddleware`` implementation, the other the pure ASGI
+``middleware.SecurityHeadersMiddleware``. Requests are driven in-process
+through ``httpx.ASGITransport`` so the numbers reflect server-side overhead.
+
+    python backend/benchmarks/bench_middleware.py --requests 5000 --concurrency 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from fastapi.middleware.cors import CORSMiddleware  # noqa: E402
+from fastapi.staticfiles import StaticFiles  # noqa: E402
+from starlette.middleware.base import BaseHTTPMiddleware  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+from starlette.responses import Response  # noqa: E402
+
+from middleware import DEFAULT_CSP, SecurityHeadersMiddleware  # noqa: E402
+
+UI_ROOT = BACKEND_DIR.parent / "ui"
+PATHS = ("/api/me", "/ui/app.js", "/ui/styles.css")
+
+
+class LegacySecurityHeadersMiddleware(BaseHTTPMiddleware):
+    """The BaseHTTPMiddleware version that app.py used before."""
+
+    async def dispatch(self, request: Request, call_next) -> Response:
+        response = await call_next(request)
+        response.headers["X-Content-Type-Options"] = "nosniff"
+        response.headers["X-Frame-Options"] = "DENY"
+        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
+        response.headers["Content-Security-Policy"] = DEFAULT_CSP
+        return response
+
+
+def build_app(middleware_class) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(middleware_class)
+    app.add_middleware(
+        CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"]
+    )
+
+    @app.get("/api/me")
+    async def me():
+        return {"id": "bench-user", "email": "bench@example.com", "display_name": "Bench"}
+
+    app.mount("/ui", StaticFiles(directory=str(UI_ROOT)), name="ui")
+    return app
+
+
+async def run(app: FastAPI, path: str, requests: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.get(path)
+        assert response.status_code == 200 and response.headers["x-frame-options"] == "DENY"
+
+        async def worker(count: int) -> None:
+            for _ in range(count):
+                await client.get(path)
+
+        per_worker = requests // concurrency
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(per_worker) for _ in range(concurrency)))
+        return per_worker * concurrency / (time.perf_counter() - start)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5_000, help="requests per path and middleware")
+    parser.add_argument("--concurrency", type=int, default=20, help="concurrent in-flight requests")
+    args = parser.parse_args()
+
+    apps = {"BaseHTTP": build_app(LegacySecurityHeadersMiddleware), "ASGI": build_app(SecurityHeadersMiddleware)}
+    print(f"{'path':<16} {'BaseHTTP req/s':>15} {'ASGI req/s':>12} {'speedup':>8}")
+    for path in PATHS:
+        legacy = await run(apps["BaseHTTP"], path, args.requests, args.concurrency)
+        current = await run(apps["ASGI"], path, args.requests, args.concurrency)
+        print(f"{path:<16} {legacy:>15,.0f} {current:>12,.0f} {current / legacy:>7.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,118 @@
+"""Benchmark the session list/detail queries before and after the index migration.
+
+Seeds a scratch database with synthetic users, sessions and messages, then
+times the repository calls behind ``GET /api/sessions`` and
+``GET /api/sessions/{id}`` on the unindexed schema and again after
+``run_migrations``.
+
+    python backend/benchmarks/bench_session_queries.py --messages 1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from database import ConnectionPool, connect, init_db  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+from repository import CarePathRepository  # noqa: E402
+
+
+def seed(path: Path, users: int, sessions_per_user: int, messages: int) -> tuple[list[str], list[tuple[str, str]]]:
+    conn = connect(path)
+    base = datetime(2026, 1, 1)
+    user_ids = [str(uuid.uuid4()) for _ in range(users)]
+    conn.executemany(
+        "INSERT INTO users (id, email, password, display_name) VALUES (?,?,?,?)",
+        ((uid, f"{uid}@example.com", "x", "") for uid in user_ids),
+    )
+
+    sessions: list[tuple[str, str]] = []
+    for uid in user_ids:
+        for _ in range(sessions_per_user):
+            sessions.append((str(uuid.uuid4()), uid))
+    conn.executemany(
+        "INSERT INTO sessions (id, user_id, title, updated_at) VALUES (?,?,?,?)",
+        (
+            (sid, uid, "", (base + timedelta(minutes=i)).strftime("%Y-%m-%dT%H:%M:%SZ"))
+            for i, (sid, uid) in enumerate(sessions)
+        ),
+    )
+
+    def _messages():
+        for i in range(messages):
+            sid, _ = sessions[i % len(sessions)]
+            ts = (base + timedelta(seconds=i)).strftime("%Y-%m-%dT%H:%M:%SZ")
+            yield (str(uuid.uuid4()), sid, "user" if i % 2 else "assistant", f"message {i}", ts)
+
+    conn.executemany("INSERT INTO messages (id, session_id, role, content, ts) VALUES (?,?,?,?,?)", _messages())
+    conn.commit()
+    conn.close()
+    return user_ids, sessions
+
+
+async def time_queries(path: Path, user_ids: list[str], sessions: list[tuple[str, str]], samples: int) -> dict:
+    pool = ConnectionPool(path, size=1)
+    repo = CarePathRepository(pool)
+    rng = random.Random(7)
+    results: dict[str, list[float]] = {"GET /api/sessions": [], "GET /api/sessions/{id}": []}
+    try:
+        for _ in range(samples):
+            uid = rng.choice(user_ids)
+            start = time.perf_counter()
+            await repo.list_sessions(uid)
+            results["GET /api/sessions"].append((time.perf_counter() - start) * 1000)
+
+            sid, owner = rng.choice(sessions)
+            start = time.perf_counter()
+            await repo.get_session(sid, owner)
+            results["GET /api/sessions/{id}"].append((time.perf_counter() - start) * 1000)
+    finally:
+        pool.close()
+    return {name: statistics.median(values) for name, values in results.items()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--sessions-per-user", type=int, default=10)
+    parser.add_argument("--samples", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench.db"
+        init_db(path, target_version=0)
+        print(f"Seeding {args.messages:,} messages across {args.users * args.sessions_per_user:,} sessions...")
+        user_ids, sessions = seed(path, args.users, args.sessions_per_user, args.messages)
+
+        before = asyncio.run(time_queries(path, user_ids, sessions, args.samples))
+
+        conn = connect(path)
+        start = time.perf_counter()
+        version = run_migrations(conn)
+        conn.close()
+        print(f"Migrated to schema v{version} in {time.perf_counter() - start:.1f}s")
+
+        after = asyncio.run(time_queries(path, user_ids, sessions, args.samples))
+
+    print(f"{'endpoint':<26}{'before (ms)':>14}{'after (ms)':>14}{'speedup':>10}")
+    for name in before:
+        speedup = before[name] / after[name] if after[name] else float("inf")
+        print(f"{name:<26}{before[name]:>14.2f}{after[name]:>14.2f}{speedup:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
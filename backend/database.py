@@ -2,21 +2,113 @@
 
 from __future__ import annotations
 
+import asyncio
+import os
+import queue
 import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Any, Callable, List, Optional, Sequence, TypeVar
+
+from migrations import run_migrations
 
 DB_PATH = Path(__file__).parent / "carepath.db"
+POOL_SIZE = int(os.getenv("CAREPATH_DB_POOL_SIZE", "4"))
+STATEMENT_CACHE_SIZE = 256
 
+# Applied once when a connection is opened, not per request.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=134217728",
+    "PRAGMA busy_timeout=5000",
+)
 
-def get_db() -> sqlite3.Connection:
-    conn = sqlite3.connect(str(DB_PATH))
+T = TypeVar("T")
+
+
+def connect(path: Path = DB_PATH) -> sqlite3.Connection:
+    conn = sqlite3.connect(str(path), check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
     conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA journal_mode=WAL")
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
     return conn
 
 
-def init_db() -> None:
-    conn = get_db()
+def get_db() -> sqlite3.Connection:
+    return connect(DB_PATH)
+
+
+class ConnectionPool:
+    """Bounded set of SQLite connections used from a dedicated thread executor.
+
+    Every call runs as one transaction on a worker thread, so request handlers
+    never block the event loop on disk I/O. There is one connection per worker
+    thread, which keeps each connection's prepared-statement cache warm.
+    """
+
+    def __init__(self, path: Path = DB_PATH, size: int = POOL_SIZE) -> None:
+        self.path = path
+        self.size = size
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="carepath-db")
+        self._idle: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        self._opened: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._opened) < self.size:
+                conn = connect(self.path)
+                self._opened.append(conn)
+                return conn
+        return self._idle.get()
+
+    def _run_sync(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        conn = self._acquire()
+        try:
+            result = fn(conn)
+            conn.commit()
+            return result
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self._idle.put(conn)
+
+    async def run(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        """Run ``fn(conn)`` in a single transaction off the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._run_sync, fn)
+
+    async def fetchone(self, sql: str, params: Sequence[Any] = ()) -> Optional[dict]:
+        def _query(conn: sqlite3.Connection) -> Optional[dict]:
+            row = conn.execute(sql, params).fetchone()
+            return dict(row) if row else None
+
+        return await self.run(_query)
+
+    async def fetchall(self, sql: str, params: Sequence[Any] = ()) -> List[dict]:
+        return await self.run(lambda conn: [dict(row) for row in conn.execute(sql, params).fetchall()])
+
+    async def execute(self, sql: str, params: Sequence[Any] = ()) -> int:
+        return await self.run(lambda conn: conn.execute(sql, params).rowcount)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for conn in self._opened:
+                conn.close()
+            self._opened.clear()
+
+
+def init_db(path: Path = DB_PATH, target_version: int | None = None) -> None:
+    conn = connect(path)
     conn.execute(
         """CREATE TABLE IF NOT EXISTS users (
             id TEXT PRIMARY KEY,
@@ -69,4 +161,5 @@ def init_db() -> None:
         )"""
     )
     conn.commit()
+    run_migrations(conn, target=target_version)
     conn.close()
@@ -0,0 +1,236 @@
+"""Event buses that route session broadcasts between app workers.
+
+``ConnectionManager`` publishes every encoded frame to a bus and receives the
+frames it must deliver to its own sockets back from it. The in-process bus is a
+direct call; the Redis bus also forwards frames to the other workers that have
+sockets for the same session.
+
+The bus also numbers frames. Each frame's per-session ``seq`` is allocated
+by the bus, so clients can resume from the last one they saw. The Redis bus
+allocates it from a counter shared by all workers, so a session whose turns
+run on different workers still gets one increasing sequence.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import uuid
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+EVENT_BUS_BACKEND = os.getenv("CAREPATH_EVENT_BUS", "memory").lower()
+REDIS_URL = os.getenv("CAREPATH_REDIS_URL", "redis://localhost:6379/0")
+SEQ_TTL_SECONDS = int(os.getenv("CAREPATH_EVENT_SEQ_TTL_SECONDS", "86400"))
+
+# Called with (session_id, encoded frame, seq, agent_id for token frames or None).
+Deliver = Callable[[str, str, int, Optional[str]], None]
+# Returns the next worker-local seq for a session.
+NextSeq = Callable[[str], int]
+
+
+def stamp_seq(body: str, seq: int) -> str:
+    """Add ``seq`` to an encoded JSON object without encoding it again."""
+    separator = ", " if body != "{}" else ""
+    return f'{body[:-1]}{separator}"seq": {seq}}}'
+
+
+class EventBus(ABC):
+    """Interface between a worker's ConnectionManager and its peers."""
+
+    def __init__(self) -> None:
+        self._deliver: Optional[Deliver] = None
+        self._next_seq: Optional[NextSeq] = None
+
+    def bind(self, deliver: Deliver, next_seq: NextSeq) -> None:
+        """Register the callbacks that hand frames to this worker's sockets and number them locally."""
+        self._deliver = deliver
+        self._next_seq = next_seq
+
+    @abstractmethod
+    def publish(self, session_id: str, body: str, token_agent: Optional[str] = None) -> None:
+        """Number the encoded frame ``body`` and deliver it locally and to every other subscribed worker."""
+
+    async def last_seq(self, session_id: str) -> Optional[int]:
+        """Latest seq allocated for ``session_id`` by any worker; None if only this worker allocates."""
+        return None
+
+    async def subscribe(self, session_id: str) -> None:
+        """Start receiving other workers' frames for ``session_id``."""
+
+    def unsubscribe(self, session_id: str) -> None:
+        """Stop receiving frames for ``session_id`` once it has no local sockets."""
+
+    async def close(self) -> None:
+        """Release broker connections."""
+
+
+class InProcessEventBus(EventBus):
+    """Single-worker bus: frames go straight to the local sockets."""
+
+    def publish(self, session_id: str, body: str, token_agent: Optional[str] = None) -> None:
+        if self._deliver is not None and self._next_seq is not None:
+            seq = self._next_seq(session_id)
+            self._deliver(session_id, stamp_seq(body, seq), seq, token_agent)
+
+
+class RedisEventBus(EventBus):
+    """Bus over Redis pub/sub with one channel per session.
+
+    A worker subscribes to a session's channel only while it has sockets for
+    that session, so Redis forwards frames just to the workers that need them.
+    A background task takes the queued frames in order, allocates their seqs
+    from a per-session Redis counter (one INCRBY per session per batch),
+    delivers them to local sockets and publishes them. Each message carries
+    the sender's worker id so the sender skips its own frames when they come
+    back.
+
+    ``client`` accepts any ``redis.asyncio``-compatible client, e.g. a local
+    fake for tests.
+    """
+
+    CHANNEL_PREFIX = "carepath:events:"
+    SEQ_PREFIX = "carepath:seq:"
+
+    def __init__(self, url: str = REDIS_URL, client=None) -> None:
+        super().__init__()
+        if client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError as exc:
+                raise RuntimeError("RedisEventBus requires the 'redis' package (pip install redis).") from exc
+            client = redis.from_url(url)
+        self._redis = client
+        self._pubsub = client.pubsub()
+        self.worker_id = uuid.uuid4().hex[:12]
+        self._wanted: Set[str] = set()
+        self._outbox: "asyncio.Queue[Tuple[str, str, Optional[str]]]" = asyncio.Queue()
+        self._publisher: Optional[asyncio.Task] = None
+        self._reader: Optional[asyncio.Task] = None
+
+    def _channel(self, session_id: str) -> str:
+        return f"{self.CHANNEL_PREFIX}{session_id}"
+
+    def _seq_key(self, session_id: str) -> str:
+        return f"{self.SEQ_PREFIX}{session_id}"
+
+    def publish(self, session_id: str, body: str, token_agent: Optional[str] = None) -> None:
+        self._outbox.put_nowait((session_id, body, token_agent))
+        if self._publisher is None:
+            self._publisher = asyncio.create_task(self._publish_loop())
+
+    async def last_seq(self, session_id: str) -> Optional[int]:
+        try:
+            value = await self._redis.get(self._seq_key(session_id))
+        except Exception:
+            logger.exception("Failed to read the event seq for session %s", session_id)
+            return None
+        return int(value or 0)
+
+    async def _allocate(self, batch: List[Tuple[str, str, Optional[str]]]) -> List[int]:
+        counts: Dict[str, int] = {}
+        for session_id, _, _ in batch:
+            counts[session_id] = counts.get(session_id, 0) + 1
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for session_id, count in counts.items():
+                    pipe.incrby(self._seq_key(session_id), count)
+                    pipe.expire(self._seq_key(session_id), SEQ_TTL_SECONDS)
+                results = await pipe.execute()
+        except Exception:
+            # Keep streaming on local numbers; a resuming client may be asked to resync.
+            logger.exception("Failed to allocate event seqs; numbering locally")
+            return [self._next_seq(session_id) if self._next_seq else 0 for session_id, _, _ in batch]
+        next_seq = {
+            session_id: int(last) - counts[session_id] + 1 for session_id, last in zip(counts, results[::2])
+        }
+        seqs = []
+        for session_id, _, _ in batch:
+            seqs.append(next_seq[session_id])
+            next_seq[session_id] += 1
+        return seqs
+
+    async def _publish_loop(self) -> None:
+        while True:
+            batch = [await self._outbox.get()]
+            while not self._outbox.empty():
+                batch.append(self._outbox.get_nowait())
+            messages = []
+            for (session_id, body, token_agent), seq in zip(batch, await self._allocate(batch)):
+                text = stamp_seq(body, seq)
+                if self._deliver is not None:
+                    self._deliver(session_id, text, seq, token_agent)
+                # Header lines: origin worker, seq, token agent (empty for other frames).
+                messages.append((self._channel(session_id), f"{self.worker_id}\n{seq}\n{token_agent or ''}\n{text}"))
+            try:
+                async with self._redis.pipeline(transaction=False) as pipe:
+                    for channel, message in messages:
+                        pipe.publish(channel, message)
+                    await pipe.execute()
+            except Exception:
+                logger.exception("Failed to publish %d event(s)", len(messages))
+            for _ in batch:
+                self._outbox.task_done()
+
+    async def subscribe(self, session_id: str) -> None:
+        self._wanted.add(session_id)
+        await self._pubsub.subscribe(self._channel(session_id))
+        if self._reader is None:
+            self._reader = asyncio.create_task(self._read_loop())
+
+    def unsubscribe(self, session_id: str) -> None:
+        self._wanted.discard(session_id)
+        asyncio.ensure_future(self._drop(session_id))
+
+    async def _drop(self, session_id: str) -> None:
+        # A socket for the session may have connected again in the meantime.
+        if session_id not in self._wanted:
+            await self._pubsub.unsubscribe(self._channel(session_id))
+
+    async def _read_loop(self) -> None:
+        prefix_len = len(self.CHANNEL_PREFIX)
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Event bus read failed; retrying")
+                await asyncio.sleep(1.0)
+                continue
+            if not message or message.get("type") != "message":
+                continue
+            channel, data = message["channel"], message["data"]
+            if isinstance(channel, bytes):
+                channel = channel.decode()
+            if isinstance(data, bytes):
+                data = data.decode()
+            origin, seq, token_agent, text = data.split("\n", 3)
+            session_id = channel[prefix_len:]
+            if origin == self.worker_id or session_id not in self._wanted or self._deliver is None:
+                continue
+            self._deliver(session_id, text, int(seq), token_agent or None)
+
+    async def close(self) -> None:
+        # Let frames already queued reach the broker before disconnecting.
+        if self._publisher is not None:
+            await self._outbox.join()
+        for task in (self._publisher, self._reader):
+            if task is not None:
+                task.cancel()
+        self._publisher = self._reader = None
+        try:
+            await self._pubsub.aclose()
+            await self._redis.aclose()
+        except Exception:
+            logger.debug("Error while closing the Redis event bus", exc_info=True)
+
+
+def create_event_bus() -> EventBus:
+    """Build the bus selected by CAREPATH_EVENT_BUS (memory or redis)."""
+    if EVENT_BUS_BACKEND == "redis":
+        return RedisEventBus()
+    return InProcessEventBus()
@@ -0,0 +1,59 @@
+"""ASGI middleware shared by the CarePath app."""
+
+from __future__ import annotations
+
+import os
+from typing import Iterable, List, Optional, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+DEFAULT_CSP = (
+    "default-src 'self'; "
+    "script-src 'self'; "
+    "style-src 'self' 'unsafe-inline' https://fonts.googleapis.com; "
+    "font-src 'self' https://fonts.gstatic.com; "
+    "img-src 'self' data:; "
+    "connect-src 'self' ws: wss:;"
+)
+CONTENT_SECURITY_POLICY = os.getenv("CAREPATH_CSP", DEFAULT_CSP)
+
+HeaderPair = Tuple[bytes, bytes]
+
+
+def security_headers(csp: str = CONTENT_SECURITY_POLICY) -> List[HeaderPair]:
+    headers = [
+        (b"x-content-type-options", b"nosniff"),
+        (b"x-frame-options", b"DENY"),
+        (b"referrer-policy", b"strict-origin-when-cross-origin"),
+    ]
+    if csp:
+        headers.append((b"content-security-policy", csp.encode("latin-1")))
+    return headers
+
+
+class SecurityHeadersMiddleware:
+    """Adds security headers to every HTTP response.
+
+    A plain ASGI middleware: the header pairs are encoded once, and the only
+    per-request work is rewriting the ``http.response.start`` message, so
+    static files and streaming responses pass through untouched.
+    """
+
+    def __init__(self, app: ASGIApp, headers: Optional[Iterable[HeaderPair]] = None) -> None:
+        self.app = app
+        self.headers = list(headers) if headers is not None else security_headers()
+        self._names = {name for name, _ in self.headers}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                # Ours win over any the route set, matching the previous behaviour.
+                existing = [pair for pair in message.get("headers", ()) if pair[0].lower() not in self._names]
+                message["headers"] = existing + self.headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -0,0 +1,75 @@
+"""Versioned schema migrations for the CarePath SQLite database."""
+
+from __future__ import annotations
+
+import logging
+import sqlite3
+from typing import List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+Migration = Tuple[int, str, Sequence[str]]
+
+# Append new migrations to the end; never edit one that has shipped.
+MIGRATIONS: List[Migration] = [
+    (
+        1,
+        "session history indexes",
+        (
+            "CREATE INDEX IF NOT EXISTS idx_sessions_user_updated ON sessions(user_id, updated_at)",
+            "CREATE INDEX IF NOT EXISTS idx_messages_session_ts ON messages(session_id, ts)",
+            "CREATE INDEX IF NOT EXISTS idx_artifacts_session_ts ON artifacts(session_id, ts)",
+            "CREATE INDEX IF NOT EXISTS idx_handoffs_session_ts ON handoffs(session_id, ts)",
+            "ANALYZE",
+        ),
+    ),
+    (
+        2,
+        "shared agent state",
+        (
+            """CREATE TABLE IF NOT EXISTS agent_state (
+                session_id TEXT PRIMARY KEY,
+                turn INTEGER NOT NULL DEFAULT 0,
+                payload TEXT NOT NULL,
+                updated_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%SZ', 'now'))
+            )""",
+        ),
+    ),
+]
+
+
+def _ensure_version_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%SZ', 'now'))
+        )"""
+    )
+    conn.commit()
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    _ensure_version_table(conn)
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def run_migrations(conn: sqlite3.Connection, target: int | None = None) -> int:
+    """Apply pending migrations up to ``target`` (default: latest) and return the new version."""
+    version = current_version(conn)
+    for number, name, statements in MIGRATIONS:
+        if number <= version or (target is not None and number > target):
+            continue
+        conn.execute("BEGIN")
+        try:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute("INSERT INTO schema_version (version, name) VALUES (?,?)", (number, name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info("Applied schema migration %s: %s", number, name)
+        version = number
+    return version
@@ -0,0 +1,352 @@
+"""Async data-access layer for CarePath users and sessions."""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import sqlite3
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from database import ConnectionPool
+
+NOW_SQL = "strftime('%Y-%m-%dT%H:%M:%SZ', 'now')"
+PROFILE_COLUMNS = "id, email, display_name, created_at, updated_at"
+SESSION_COLUMNS = "id, title, summary, created_at, updated_at"
+SUMMARY_WINDOW = 6
+
+
+class SessionNotFound(LookupError):
+    pass
+
+
+class UnsupportedEvent(ValueError):
+    pass
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _build_light_summary(messages: list[dict]) -> str:
+    if not messages:
+        return ""
+    trimmed = messages[-SUMMARY_WINDOW:]
+    lines = []
+    for item in trimmed:
+        role = item.get("role", "assistant")
+        content = item.get("content", "")
+        content = content.replace("\n", " ").strip()
+        if len(content) > 160:
+            content = content[:157] + "..."
+        lines.append(f"{role}: {content}")
+    return " | ".join(lines)
+
+
+# History streams: response key -> (table, columns returned to clients).
+HISTORY_STREAMS = {
+    "messages": ("messages", "role, content, ts"),
+    "artifacts": ("artifacts", "artifact_type, payload_json, ts"),
+    "handoffs": ("handoffs", "kind, content, ts"),
+}
+
+# Position of a row in a stream, (ts, rowid); None for a stream with nothing older.
+Position = Optional[Tuple[str, int]]
+Cursor = Dict[str, Position]
+
+
+def encode_cursor(cursor: Cursor) -> str:
+    raw = json.dumps({key: list(pos) if pos else None for key, pos in cursor.items()}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Cursor:
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        return {key: (str(raw[key][0]), int(raw[key][1])) if raw[key] else None for key in HISTORY_STREAMS}
+    except (ValueError, TypeError, KeyError, IndexError) as exc:
+        raise InvalidCursor(token) from exc
+
+
+@dataclass
+class SessionPage:
+    etag: str
+    # None when the client's copy (If-None-Match) is still current.
+    history: Optional[Dict[str, Any]]
+
+
+def _latest_positions(conn: sqlite3.Connection, session_id: str) -> Cursor:
+    positions: Cursor = {}
+    for key, (table, _) in HISTORY_STREAMS.items():
+        row = conn.execute(
+            f"SELECT ts, rowid FROM {table} WHERE session_id=? ORDER BY ts DESC, rowid DESC LIMIT 1",
+            (session_id,),
+        ).fetchone()
+        positions[key] = (row[0], row[1]) if row else ("", 0)
+    return positions
+
+
+def _fetch_stream(
+    conn: sqlite3.Connection,
+    session_id: str,
+    key: str,
+    limit: Optional[int],
+    before: Position,
+    since: Position,
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """Rows of one stream in ascending order, and whether the page was cut short."""
+    table, columns = HISTORY_STREAMS[key]
+    sql = f"SELECT rowid AS _rowid, {columns} FROM {table} WHERE session_id=?"
+    params: List[Any] = [session_id]
+    if since is not None:
+        sql += " AND (ts, rowid) > (?, ?) ORDER BY ts ASC, rowid ASC"
+        params += list(since)
+    else:
+        if before is not None:
+            sql += " AND (ts, rowid) < (?, ?)"
+            params += list(before)
+        # Without a `since`, pages are taken from the newest end.
+        sql += " ORDER BY ts DESC, rowid DESC" if limit is not None else " ORDER BY ts ASC, rowid ASC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+
+    rows = [dict(row) for row in conn.execute(sql, params).fetchall()]
+    more = limit is not None and len(rows) > limit
+    rows = rows[:limit] if limit is not None else rows
+    if since is None and limit is not None:
+        rows.reverse()
+    return rows, more
+
+
+def _session_history(
+    conn: sqlite3.Connection,
+    session: sqlite3.Row,
+    limit: Optional[int] = None,
+    before: Optional[Cursor] = None,
+    since: Optional[Cursor] = None,
+    if_none_match: Optional[str] = None,
+) -> SessionPage:
+    """Load a session's history, all of it or one keyset page.
+
+    - no cursor: everything, or with ``limit`` the newest ``limit`` rows per stream;
+    - ``before``: the ``limit`` rows per stream preceding that cursor (older pages);
+    - ``since``: rows added after that cursor (deltas), oldest first.
+
+    The response carries ``cursor`` (pass as ``since`` for the next delta) and
+    ``before`` (pass as ``before`` for the next older page, null when there is none).
+    """
+    session_id = session["id"]
+    latest = _latest_positions(conn, session_id)
+    # The ETag names the session's version, not the query: a client revisiting with
+    # ``since`` sends the tag of whichever page it loaded last, and 304 means nothing changed since.
+    version = json.dumps([dict(session), latest], sort_keys=True, separators=(",", ":"))
+    etag = '"' + hashlib.sha1(version.encode()).hexdigest()[:20] + '"'
+    if if_none_match and etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+        return SessionPage(etag, None)
+
+    history: Dict[str, Any] = {"session": dict(session)}
+    newest: Cursor = {}
+    oldest: Cursor = {}
+    has_more = False
+    for key in HISTORY_STREAMS:
+        if before is not None and before[key] is None:
+            rows, more = [], False
+        else:
+            rows, more = _fetch_stream(
+                conn, session_id, key, limit, before[key] if before else None, since[key] if since else None
+            )
+        has_more = has_more or more
+        newest[key] = (rows[-1]["ts"], rows[-1]["_rowid"]) if rows else (since[key] if since else latest[key])
+        oldest[key] = (rows[0]["ts"], rows[0]["_rowid"]) if rows and more and since is None else None
+        for row in rows:
+            del row["_rowid"]
+        history[key] = rows
+
+    if before is None:
+        history["cursor"] = encode_cursor(newest)
+    history["before"] = encode_cursor(oldest) if any(oldest.values()) else None
+    history["has_more"] = has_more
+    return SessionPage(etag, history)
+
+
+def _check_owner(conn: sqlite3.Connection, session_id: str, user_id: str) -> None:
+    owned = conn.execute("SELECT id FROM sessions WHERE id=? AND user_id=?", (session_id, user_id)).fetchone()
+    if not owned:
+        raise SessionNotFound(session_id)
+
+
+def _insert_event(conn: sqlite3.Connection, session_id: str, event_type: str, payload: Dict[str, Any]) -> None:
+    if event_type == "message":
+        conn.execute(
+            "INSERT INTO messages (id, session_id, role, content) VALUES (?,?,?,?)",
+            (str(uuid.uuid4()), session_id, payload.get("role", "assistant"), payload.get("content", "")),
+        )
+    elif event_type == "artifact":
+        conn.execute(
+            "INSERT INTO artifacts (id, session_id, artifact_type, payload_json) VALUES (?,?,?,?)",
+            (
+                str(uuid.uuid4()),
+                session_id,
+                payload.get("artifact_type", "unknown"),
+                json.dumps(payload.get("data", {})),
+            ),
+        )
+    elif event_type == "handoff":
+        conn.execute(
+            "INSERT INTO handoffs (id, session_id, kind, content) VALUES (?,?,?,?)",
+            (str(uuid.uuid4()), session_id, payload.get("kind", "info"), payload.get("content", "")),
+        )
+    else:
+        raise UnsupportedEvent(event_type)
+
+
+def _write_events(conn: sqlite3.Connection, session_id: str, events: List[Tuple[str, Dict[str, Any]]]) -> None:
+    for event_type, payload in events:
+        _insert_event(conn, session_id, event_type, payload)
+
+    if any(event_type == "message" for event_type, _ in events):
+        # Only the last SUMMARY_WINDOW messages feed the summary, so read just that
+        # tail off the (session_id, ts) index instead of the whole conversation.
+        tail = conn.execute(
+            "SELECT role, content FROM messages WHERE session_id=? ORDER BY ts DESC, rowid DESC LIMIT ?",
+            (session_id, SUMMARY_WINDOW),
+        ).fetchall()
+        summary = _build_light_summary([dict(r) for r in reversed(tail)])
+        conn.execute(f"UPDATE sessions SET summary=?, updated_at={NOW_SQL} WHERE id=?", (summary, session_id))
+    elif events:
+        conn.execute(f"UPDATE sessions SET updated_at={NOW_SQL} WHERE id=?", (session_id,))
+
+
+EventGroup = Tuple[str, str, List[Tuple[str, Dict[str, Any]]]]
+
+
+def write_event_groups(conn: sqlite3.Connection, groups: List[EventGroup]) -> List[Optional[Exception]]:
+    """Write many (session_id, user_id, events) groups in one transaction.
+
+    Each group is isolated by a savepoint, so a group that fails its ownership
+    or event-type check is rolled back on its own while the rest commit together.
+    """
+    results: List[Optional[Exception]] = []
+    conn.execute("BEGIN")
+    for session_id, user_id, events in groups:
+        conn.execute("SAVEPOINT event_group")
+        try:
+            _check_owner(conn, session_id, user_id)
+            _write_events(conn, session_id, events)
+        except (SessionNotFound, UnsupportedEvent) as exc:
+            conn.execute("ROLLBACK TO event_group")
+            results.append(exc)
+        else:
+            results.append(None)
+        conn.execute("RELEASE event_group")
+    return results
+
+
+class CarePathRepository:
+    """Queries used by the API, each run as one transaction on the connection pool."""
+
+    def __init__(self, pool: ConnectionPool) -> None:
+        self.pool = pool
+
+    # ─── Users ───
+
+    async def get_user_by_email(self, email: str) -> Optional[dict]:
+        return await self.pool.fetchone("SELECT * FROM users WHERE email=?", (email,))
+
+    async def get_profile(self, user_id: str) -> Optional[dict]:
+        return await self.pool.fetchone(f"SELECT {PROFILE_COLUMNS} FROM users WHERE id=?", (user_id,))
+
+    async def email_in_use(self, email: str, exclude_user_id: str | None = None) -> bool:
+        if exclude_user_id is None:
+            row = await self.pool.fetchone("SELECT id FROM users WHERE email=?", (email,))
+        else:
+            row = await self.pool.fetchone("SELECT id FROM users WHERE email=? AND id!=?", (email, exclude_user_id))
+        return row is not None
+
+    async def create_user(self, user_id: str, email: str, password_hash: str, display_name: str) -> None:
+        await self.pool.execute(
+            "INSERT INTO users (id, email, password, display_name) VALUES (?,?,?,?)",
+            (user_id, email, password_hash, display_name),
+        )
+
+    async def update_password(self, user_id: str, password_hash: str) -> None:
+        await self.pool.execute("UPDATE users SET password=? WHERE id=?", (password_hash, user_id))
+
+    async def update_profile(self, user_id: str, email: str | None, display_name: str | None) -> Optional[dict]:
+        def _update(conn: sqlite3.Connection) -> Optional[dict]:
+            if email is not None:
+                conn.execute(f"UPDATE users SET email=?, updated_at={NOW_SQL} WHERE id=?", (email, user_id))
+            if display_name is not None:
+                conn.execute(f"UPDATE users SET display_name=?, updated_at={NOW_SQL} WHERE id=?", (display_name, user_id))
+            row = conn.execute(f"SELECT {PROFILE_COLUMNS} FROM users WHERE id=?", (user_id,)).fetchone()
+            return dict(row) if row else None
+
+        return await self.pool.run(_update)
+
+    # ─── Sessions ───
+
+    async def create_session(self, session_id: str, user_id: str, title: str) -> None:
+        await self.pool.execute(
+            "INSERT INTO sessions (id, user_id, title) VALUES (?,?,?)",
+            (session_id, user_id, title),
+        )
+
+    async def list_sessions(self, user_id: str) -> List[dict]:
+        return await self.pool.fetchall(
+            f"SELECT {SESSION_COLUMNS} FROM sessions WHERE user_id=? ORDER BY updated_at DESC",
+            (user_id,),
+        )
+
+    async def get_latest_session(self, user_id: str, **page: Any) -> Optional[SessionPage]:
+        """The most recently updated session; ``page`` takes the _session_history options."""
+
+        def _load(conn: sqlite3.Connection) -> Optional[SessionPage]:
+            session = conn.execute(
+                f"SELECT {SESSION_COLUMNS} FROM sessions WHERE user_id=? ORDER BY updated_at DESC LIMIT 1",
+                (user_id,),
+            ).fetchone()
+            return _session_history(conn, session, **page) if session else None
+
+        return await self.pool.run(_load)
+
+    async def owns_session(self, session_id: str, user_id: str) -> bool:
+        row = await self.pool.fetchone("SELECT id FROM sessions WHERE id=? AND user_id=?", (session_id, user_id))
+        return row is not None
+
+    async def get_session(self, session_id: str, user_id: str, **page: Any) -> Optional[SessionPage]:
+        """One of the user's sessions; ``page`` takes the _session_history options."""
+
+        def _load(conn: sqlite3.Connection) -> Optional[SessionPage]:
+            session = conn.execute(
+                f"SELECT {SESSION_COLUMNS} FROM sessions WHERE id=? AND user_id=?",
+                (session_id, user_id),
+            ).fetchone()
+            return _session_history(conn, session, **page) if session else None
+
+        return await self.pool.run(_load)
+
+    async def append_event(self, session_id: str, user_id: str, event_type: str, payload: Dict[str, Any]) -> None:
+        """Persist one session event; raises SessionNotFound or UnsupportedEvent."""
+        await self.append_events(session_id, user_id, [(event_type, payload)])
+
+    async def append_events(
+        self, session_id: str, user_id: str, events: List[Tuple[str, Dict[str, Any]]]
+    ) -> None:
+        """Persist several events in one transaction with a single summary refresh."""
+
+        def _append(conn: sqlite3.Connection) -> None:
+            _check_owner(conn, session_id, user_id)
+            _write_events(conn, session_id, events)
+
+        await self.pool.run(_append)
+
+    async def load_conversation(self, session_id: str) -> List[dict]:
+        """User and assistant messages of a session in order, for state rehydration."""
+        return await self.pool.fetchall(
+            "SELECT role, content FROM messages WHERE session_id=? AND role IN ('user', 'assistant') "
+            "ORDER BY ts ASC, rowid ASC",
+            (session_id,),
+        )
@@ -0,0 +1,120 @@
+"""Turn scheduling for agent workflows.
+
+Turns of one session run strictly one after another, in arrival order, so two
+tabs or a double submit can never interleave their updates to the session's
+state. Across sessions at most ``max_concurrent`` turns run at once; waiting
+turns get a free slot in FIFO order, and because a session only ever has one
+turn waiting for a slot, busy sessions cannot starve quiet ones. When too many
+turns are already waiting, new ones are rejected instead of queueing forever.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, Optional
+
+MAX_CONCURRENT_TURNS = int(os.getenv("CAREPATH_MAX_CONCURRENT_TURNS", "8"))
+MAX_QUEUED_TURNS = int(os.getenv("CAREPATH_MAX_QUEUED_TURNS", "64"))
+MAX_TURNS_PER_SESSION = int(os.getenv("CAREPATH_MAX_TURNS_PER_SESSION", "3"))
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("CAREPATH_TURN_QUEUE_TIMEOUT", "120"))
+
+# Called with (turns ahead of this one, total turns waiting) when a turn has to wait.
+QueueListener = Callable[[int, int], Awaitable[None]]
+
+
+class SchedulerSaturated(RuntimeError):
+    """The turn was rejected because too many turns are already waiting."""
+
+
+class TurnScheduler:
+    """Per-session FIFO turn queues behind a fair global concurrency limit."""
+
+    def __init__(
+        self,
+        max_concurrent: int = MAX_CONCURRENT_TURNS,
+        max_queued: int = MAX_QUEUED_TURNS,
+        max_per_session: int = MAX_TURNS_PER_SESSION,
+        queue_timeout: float = QUEUE_TIMEOUT_SECONDS,
+    ) -> None:
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.max_per_session = max_per_session
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        self.waiting = 0
+        # Per session: the running turn's ticket first, then waiting tickets.
+        self._sessions: Dict[str, Deque[asyncio.Future]] = {}
+        self._slot_waiters: Deque[asyncio.Future] = deque()
+
+    @asynccontextmanager
+    async def turn(self, session_id: str, on_queued: Optional[QueueListener] = None) -> AsyncIterator[None]:
+        """Hold the session's turn and a global slot for the duration of the block."""
+        if self.waiting >= self.max_queued:
+            raise SchedulerSaturated("The care team is at capacity. Please try again in a moment.")
+        queue = self._sessions.setdefault(session_id, deque())
+        if len(queue) >= self.max_per_session:
+            raise SchedulerSaturated("This session already has messages waiting. Please wait for them to finish.")
+
+        ticket = asyncio.get_running_loop().create_future()
+        queue.append(ticket)
+        self.waiting += 1
+        waiting = True
+        holds_slot = False
+        try:
+            ahead = len(queue) - 1
+            if self.running >= self.max_concurrent:
+                ahead += len(self._slot_waiters) + 1
+            if ahead and on_queued is not None:
+                await on_queued(ahead, self.waiting)
+            try:
+                await asyncio.wait_for(self._acquire(queue, ticket), self.queue_timeout or None)
+            except asyncio.TimeoutError as exc:
+                raise SchedulerSaturated("Timed out waiting for a free workflow slot. Please try again.") from exc
+            holds_slot = True
+            self.waiting -= 1
+            waiting = False
+            yield
+        finally:
+            if waiting:
+                self.waiting -= 1
+            if holds_slot:
+                self._release_slot()
+            self._leave(session_id, queue, ticket)
+
+    async def _acquire(self, queue: Deque[asyncio.Future], ticket: asyncio.Future) -> None:
+        if queue[0] is not ticket:
+            await ticket
+        if self.running < self.max_concurrent and not self._slot_waiters:
+            self.running += 1
+            return
+        slot = asyncio.get_running_loop().create_future()
+        self._slot_waiters.append(slot)
+        try:
+            await slot
+        except asyncio.CancelledError:
+            if slot.done() and not slot.cancelled():
+                # The slot was handed over just as this turn gave up; pass it on.
+                self._release_slot()
+            elif slot in self._slot_waiters:
+                self._slot_waiters.remove(slot)
+            raise
+
+    def _release_slot(self) -> None:
+        # Hand the slot straight to the oldest waiter so it cannot be overtaken.
+        while self._slot_waiters:
+            slot = self._slot_waiters.popleft()
+            if not slot.done():
+                slot.set_result(None)
+                return
+        self.running -= 1
+
+    def _leave(self, session_id: str, queue: Deque[asyncio.Future], ticket: asyncio.Future) -> None:
+        was_head = bool(queue) and queue[0] is ticket
+        queue.remove(ticket)
+        if was_head and queue and not queue[0].done():
+            queue[0].set_result(None)
+        if not queue and self._sessions.get(session_id) is queue:
+            del self._sessions[session_id]
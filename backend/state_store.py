@@ -0,0 +1,395 @@
+"""Session state stores for agent workflow state.
+
+Agents read and write a plain dict of session-prefixed keys
+(``{session_id}_chat_history``, ``{session_id}_thread_{agent_id}``, ...).
+A store hands out that dict per session at the start of a turn and takes it
+back at the end, so the backing implementation can evict, persist, or share
+it without the agents knowing.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from database import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+SessionState = Dict[str, Any]
+StateLoader = Callable[[str], Awaitable[Optional[SessionState]]]
+
+MAX_SESSIONS = int(os.getenv("CAREPATH_STATE_MAX_SESSIONS", "1000"))
+MAX_BYTES = int(os.getenv("CAREPATH_STATE_MAX_BYTES", str(256 * 1024 * 1024)))
+TTL_SECONDS = float(os.getenv("CAREPATH_STATE_TTL_SECONDS", "3600"))
+STATE_BACKEND = os.getenv("CAREPATH_STATE_BACKEND", "memory").lower()
+REDIS_URL = os.getenv("CAREPATH_REDIS_URL", "redis://localhost:6379/0")
+# A claimed turn that was never saved (its worker died) can be taken over after this long.
+CLAIM_TTL_SECONDS = int(os.getenv("CAREPATH_STATE_CLAIM_TTL_SECONDS", "600"))
+
+
+class StateConflictError(RuntimeError):
+    """Another worker advanced the session's turn counter since this state was loaded."""
+
+
+class VersionedState(dict):
+    """Session state remembering the turn counter it was loaded at."""
+
+    def __init__(self, data: Optional[SessionState] = None, version: int = 0) -> None:
+        super().__init__(data or {})
+        self.version = version
+
+
+def _turn_of(session_id: str, state: SessionState) -> int:
+    return int(state.get(f"{session_id}_healthcare_turn", 0))
+
+
+class StateStore(ABC):
+    """Interface for per-session agent state."""
+
+    @abstractmethod
+    async def load(self, session_id: str) -> SessionState:
+        """Return the state dict for ``session_id`` (empty for a new session)."""
+
+    @abstractmethod
+    async def save(self, session_id: str, state: SessionState) -> None:
+        """Store the state dict after a turn has mutated it."""
+
+    @abstractmethod
+    async def evict(self, session_id: str) -> None:
+        """Drop any cached state for ``session_id``."""
+
+    async def claim(self, session_id: str, state: SessionState) -> None:
+        """Reserve the next turn for ``state`` before it runs; raise StateConflictError if it is taken.
+
+        Shared stores advance the stored turn counter here, so a concurrent
+        turn is rejected before it persists or broadcasts anything. Stores
+        owned by a single process rely on the scheduler and do nothing.
+        """
+
+    async def close(self) -> None:
+        """Flush anything held only in this process before shutdown."""
+
+
+@dataclass
+class _Entry:
+    state: SessionState
+    touched_at: float
+    size: int
+
+
+class InMemoryStateStore(StateStore):
+    """Process-local store with LRU eviction by session count and serialized size, and an idle TTL.
+
+    With a ``pool``, evicted sessions are spilled whole (agent threads, last
+    case, prompt-context and codec tables) to the ``agent_state`` table and
+    read back on their next ``load``; a spilled row is removed once the
+    session is resident again. Sessions without a spilled row are rebuilt
+    through ``loader`` from whatever durable storage the backend has.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = MAX_SESSIONS,
+        ttl_seconds: float = TTL_SECONDS,
+        loader: Optional[StateLoader] = None,
+        pool: Optional[ConnectionPool] = None,
+        max_bytes: int = MAX_BYTES,
+    ) -> None:
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.loader = loader
+        self.pool = pool
+        self._sessions: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    async def load(self, session_id: str) -> SessionState:
+        await self._spill(self._expire())
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            state, size = await self._unspill(session_id)
+            if state is None and self.loader:
+                state = await self.loader(session_id)
+                size = len(json.dumps(state)) if state else 0
+            # Another turn may have loaded the session while the loader awaited.
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = self._put(session_id, state or {}, size)
+                await self._spill(self._evict_overflow())
+        entry.touched_at = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return entry.state
+
+    async def save(self, session_id: str, state: SessionState) -> None:
+        resident = session_id in self._sessions
+        self._put(session_id, state, len(json.dumps(state)))
+        if not resident:
+            # Evicted mid-turn: the row spilled then is older than this state.
+            await self._drop_spilled(session_id)
+        await self._spill(self._evict_overflow())
+
+    async def evict(self, session_id: str) -> None:
+        entry = self._sessions.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    async def close(self) -> None:
+        resident = list(self._sessions.items())
+        self._sessions.clear()
+        self._bytes = 0
+        await self._spill([(session_id, entry.state) for session_id, entry in resident])
+
+    def _put(self, session_id: str, state: SessionState, size: int) -> _Entry:
+        previous = self._sessions.pop(session_id, None)
+        if previous is not None:
+            self._bytes -= previous.size
+        entry = self._sessions[session_id] = _Entry(state, time.monotonic(), size)
+        self._bytes += size
+        return entry
+
+    def _pop_oldest(self) -> Tuple[str, SessionState]:
+        session_id, entry = self._sessions.popitem(last=False)
+        self._bytes -= entry.size
+        return session_id, entry.state
+
+    def _expire(self) -> List[Tuple[str, SessionState]]:
+        expired: List[Tuple[str, SessionState]] = []
+        if not self.ttl_seconds:
+            return expired
+        cutoff = time.monotonic() - self.ttl_seconds
+        # Entries are kept in access order, so expired ones are at the front.
+        while self._sessions:
+            session_id, entry = next(iter(self._sessions.items()))
+            if entry.touched_at >= cutoff:
+                break
+            expired.append(self._pop_oldest())
+            logger.debug("Expired idle state for session %s", session_id)
+        return expired
+
+    def _evict_overflow(self) -> List[Tuple[str, SessionState]]:
+        evicted: List[Tuple[str, SessionState]] = []
+        # The most recent session always stays resident, however large it is.
+        while len(self._sessions) > 1 and (len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes):
+            evicted.append(self._pop_oldest())
+            logger.debug("Evicted state for session %s", evicted[-1][0])
+        return evicted
+
+    async def _spill(self, sessions: List[Tuple[str, SessionState]]) -> None:
+        if not sessions or self.pool is None:
+            return
+        rows = [(session_id, _turn_of(session_id, state), json.dumps(state)) for session_id, state in sessions]
+
+        def _write(conn: sqlite3.Connection) -> None:
+            conn.executemany(
+                "INSERT INTO agent_state (session_id, turn, payload) VALUES (?,?,?) "
+                "ON CONFLICT(session_id) DO UPDATE SET turn=excluded.turn, payload=excluded.payload, "
+                "updated_at=strftime('%Y-%m-%dT%H:%M:%SZ', 'now')",
+                rows,
+            )
+
+        try:
+            await self.pool.run(_write)
+        except Exception:
+            logger.exception("Could not spill state for %d session(s); they will be rebuilt from messages", len(rows))
+
+    async def _drop_spilled(self, session_id: str) -> None:
+        if self.pool is None:
+            return
+        try:
+            await self.pool.execute("DELETE FROM agent_state WHERE session_id=?", (session_id,))
+        except Exception:
+            logger.exception("Could not drop spilled state for session %s", session_id)
+
+    async def _unspill(self, session_id: str) -> Tuple[Optional[SessionState], int]:
+        if self.pool is None:
+            return None, 0
+
+        def _take(conn: sqlite3.Connection) -> Optional[str]:
+            row = conn.execute("SELECT payload FROM agent_state WHERE session_id=?", (session_id,)).fetchone()
+            if row is None:
+                return None
+            # Resident state supersedes the row; dropping it keeps a crash from restoring stale threads.
+            conn.execute("DELETE FROM agent_state WHERE session_id=?", (session_id,))
+            return row[0]
+
+        payload = await self.pool.run(_take)
+        if payload is None:
+            return None, 0
+        return json.loads(payload), len(payload)
+
+
+class SQLiteStateStore(StateStore):
+    """Shared store in the CarePath SQLite file, usable by several local workers.
+
+    ``claim`` and ``save`` are compare-and-sets on the stored turn counter.
+    ``claim`` moves it one past the payload's turn, so while a turn is running
+    the counter is ahead of the payload and other workers' claims fail.
+    """
+
+    def __init__(self, pool: ConnectionPool, loader: Optional[StateLoader] = None) -> None:
+        self.pool = pool
+        self.loader = loader
+
+    async def load(self, session_id: str) -> SessionState:
+        row = await self.pool.fetchone("SELECT payload FROM agent_state WHERE session_id=?", (session_id,))
+        if row is not None:
+            state = json.loads(row["payload"])
+            return VersionedState(state, _turn_of(session_id, state))
+        state = await self.loader(session_id) if self.loader else None
+        return VersionedState(state, 0)
+
+    async def claim(self, session_id: str, state: SessionState) -> None:
+        expected = getattr(state, "version", 0)
+        claimed = expected + 1
+        payload = json.dumps(state)
+
+        def _claim(conn: sqlite3.Connection) -> bool:
+            updated = conn.execute(
+                "UPDATE agent_state SET turn=?, updated_at=strftime('%Y-%m-%dT%H:%M:%SZ', 'now') "
+                "WHERE session_id=? AND (turn=? OR (turn=? AND updated_at < strftime('%Y-%m-%dT%H:%M:%SZ', 'now', ?)))",
+                (claimed, session_id, expected, claimed, f"-{CLAIM_TTL_SECONDS} seconds"),
+            ).rowcount
+            if updated:
+                return True
+            inserted = conn.execute(
+                "INSERT INTO agent_state (session_id, turn, payload) VALUES (?,?,?) ON CONFLICT(session_id) DO NOTHING",
+                (session_id, claimed, payload),
+            ).rowcount
+            return bool(inserted)
+
+        if not await self.pool.run(_claim):
+            raise StateConflictError(session_id)
+        if isinstance(state, VersionedState):
+            state.version = claimed
+
+    async def save(self, session_id: str, state: SessionState) -> None:
+        expected = getattr(state, "version", 0)
+        turn = _turn_of(session_id, state)
+        payload = json.dumps(state)
+
+        def _compare_and_set(conn: sqlite3.Connection) -> bool:
+            updated = conn.execute(
+                "UPDATE agent_state SET turn=?, payload=?, updated_at=strftime('%Y-%m-%dT%H:%M:%SZ', 'now') "
+                "WHERE session_id=? AND turn=?",
+                (turn, payload, session_id, expected),
+            ).rowcount
+            if updated:
+                return True
+            inserted = conn.execute(
+                "INSERT INTO agent_state (session_id, turn, payload) VALUES (?,?,?) ON CONFLICT(session_id) DO NOTHING",
+                (session_id, turn, payload),
+            ).rowcount
+            return bool(inserted)
+
+        if not await self.pool.run(_compare_and_set):
+            raise StateConflictError(session_id)
+        if isinstance(state, VersionedState):
+            state.version = turn
+
+    async def evict(self, session_id: str) -> None:
+        await self.pool.execute("DELETE FROM agent_state WHERE session_id=?", (session_id,))
+
+
+class RedisStateStore(StateStore):
+    """Network store for multi-node deployments, using WATCH/MULTI for the turn claim and CAS."""
+
+    KEY_PREFIX = "carepath:state:"
+
+    def __init__(
+        self, url: str = REDIS_URL, ttl_seconds: float = TTL_SECONDS, loader: Optional[StateLoader] = None
+    ) -> None:
+        try:
+            import redis.asyncio as redis
+        except ImportError as exc:
+            raise RuntimeError("RedisStateStore requires the 'redis' package (pip install redis).") from exc
+        self._redis = redis.from_url(url)
+        self._watch_error = redis.WatchError
+        self.ttl_seconds = ttl_seconds
+        self.loader = loader
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.KEY_PREFIX}{session_id}"
+
+    async def _read(self, session_id: str) -> Tuple[Optional[int], Optional[bytes]]:
+        turn, payload = await self._redis.hmget(self._key(session_id), "turn", "payload")
+        return (int(turn) if turn is not None else None), payload
+
+    async def load(self, session_id: str) -> SessionState:
+        turn, payload = await self._read(session_id)
+        if turn is not None and payload is not None:
+            state = json.loads(payload)
+            return VersionedState(state, _turn_of(session_id, state))
+        state = await self.loader(session_id) if self.loader else None
+        return VersionedState(state, 0)
+
+    async def claim(self, session_id: str, state: SessionState) -> None:
+        key = self._key(session_id)
+        expected = getattr(state, "version", 0)
+        claimed = expected + 1
+        try:
+            async with self._redis.pipeline(transaction=True) as pipe:
+                await pipe.watch(key)
+                current, claimed_at, payload = await pipe.hmget(key, "turn", "claimed_at", "payload")
+                current = int(current or 0)
+                stale = current == claimed and float(claimed_at or 0) < time.time() - CLAIM_TTL_SECONDS
+                if current != expected and not stale:
+                    raise StateConflictError(session_id)
+                pipe.multi()
+                mapping = {"turn": claimed, "claimed_at": time.time()}
+                if payload is None:
+                    mapping["payload"] = json.dumps(state)
+                pipe.hset(key, mapping=mapping)
+                if self.ttl_seconds:
+                    pipe.expire(key, int(self.ttl_seconds))
+                await pipe.execute()
+        except self._watch_error as exc:
+            raise StateConflictError(session_id) from exc
+        if isinstance(state, VersionedState):
+            state.version = claimed
+
+    async def save(self, session_id: str, state: SessionState) -> None:
+        key = self._key(session_id)
+        expected = getattr(state, "version", 0)
+        turn = _turn_of(session_id, state)
+        try:
+            async with self._redis.pipeline(transaction=True) as pipe:
+                await pipe.watch(key)
+                current = await pipe.hget(key, "turn")
+                if int(current or 0) != expected:
+                    raise StateConflictError(session_id)
+                pipe.multi()
+                pipe.hset(key, mapping={"turn": turn, "payload": json.dumps(state)})
+                if self.ttl_seconds:
+                    pipe.expire(key, int(self.ttl_seconds))
+                await pipe.execute()
+        except self._watch_error as exc:
+            raise StateConflictError(session_id) from exc
+        if isinstance(state, VersionedState):
+            state.version = turn
+
+    async def evict(self, session_id: str) -> None:
+        await self._redis.delete(self._key(session_id))
+
+
+def create_state_store(pool: ConnectionPool, loader: Optional[StateLoader] = None) -> StateStore:
+    """Build the store selected by CAREPATH_STATE_BACKEND (memory, sqlite, or redis)."""
+    if STATE_BACKEND == "sqlite":
+        return SQLiteStateStore(pool, loader=loader)
+    if STATE_BACKEND == "redis":
+        return RedisStateStore(loader=loader)
+    return InMemoryStateStore(loader=loader, pool=pool)
@@ -0,0 +1,161 @@
+"""In-memory, precompressed serving of the UI's static files.
+
+At startup every file under ``ui/`` is read once and given a content-hashed
+name (``app.js`` -> ``app.3f2a9c1b4d5e.js``). Text assets are precompressed with
+gzip and, when the optional ``brotli`` package is installed, brotli. Hashed
+URLs are served with an immutable year-long Cache-Control; the plain names and
+``index.html`` stay available with ``no-cache`` so they are revalidated through
+their strong ETag. ``index.html`` is rewritten to point at the hashed names, so
+a deploy changes the URLs of exactly the files that changed.
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Mapping, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import PlainTextResponse, Response
+from starlette.types import Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+MIN_COMPRESS_BYTES = 1024
+_HASH_CHARS = 12
+
+# Matches /ui/<file> references in HTML, dropping any ?v= cache-buster.
+_UI_REFERENCE = re.compile(r"""/ui/([\w./-]+?)(?:\?v=[^"'\s>]*)?(?=["'\s>])""")
+
+
+@dataclass
+class StaticAsset:
+    name: str
+    hashed_name: str
+    media_type: str
+    # Encoding ("identity", "gzip", "br") -> (body, strong ETag).
+    variants: Dict[str, Tuple[bytes, str]] = field(default_factory=dict)
+
+    def select(self, accept_encoding: str) -> Tuple[str, bytes, str]:
+        accepted = {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and encoding in accepted:
+                return (encoding, *self.variants[encoding])
+        return ("identity", *self.variants["identity"])
+
+
+def _build_asset(name: str, body: bytes) -> StaticAsset:
+    digest = hashlib.sha256(body).hexdigest()
+    stem, dot, suffix = name.rpartition(".")
+    hashed_name = f"{stem}.{digest[:_HASH_CHARS]}.{suffix}" if dot else f"{name}.{digest[:_HASH_CHARS]}"
+    media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if media_type.startswith("text/") or media_type == "application/javascript":
+        media_type += "; charset=utf-8"
+
+    asset = StaticAsset(name, hashed_name, media_type)
+    etag = digest[:_HASH_CHARS * 2]
+    asset.variants["identity"] = (body, f'"{etag}"')
+    if len(body) >= MIN_COMPRESS_BYTES and media_type.startswith(COMPRESSIBLE_TYPES):
+        compressed = gzip.compress(body, compresslevel=9, mtime=0)
+        if len(compressed) < len(body):
+            asset.variants["gzip"] = (compressed, f'"{etag}-gz"')
+        if brotli is not None:
+            compressed = brotli.compress(body, quality=11)
+            if len(compressed) < len(body):
+                asset.variants["br"] = (compressed, f'"{etag}-br"')
+    return asset
+
+
+class StaticAssets:
+    """ASGI app serving a directory from memory; mount it at ``url_prefix``."""
+
+    def __init__(self, root: Path, url_prefix: str = "/ui", index: str = "index.html") -> None:
+        self.root = root
+        self.url_prefix = url_prefix.rstrip("/")
+        self.index_name = index
+        self.assets: Dict[str, StaticAsset] = {}
+        self._routes: Dict[str, Tuple[StaticAsset, str]] = {}
+        self.index: Optional[StaticAsset] = None
+        self.build()
+
+    def build(self) -> None:
+        """(Re)read the directory and rebuild hashed names and compressed variants."""
+        assets: Dict[str, StaticAsset] = {}
+        for path in sorted(self.root.rglob("*")):
+            if not path.is_file() or path.name.startswith("."):
+                continue
+            name = path.relative_to(self.root).as_posix()
+            if name != self.index_name:
+                assets[name] = _build_asset(name, path.read_bytes())
+
+        routes: Dict[str, Tuple[StaticAsset, str]] = {}
+        for asset in assets.values():
+            routes[asset.name] = (asset, REVALIDATE)
+            routes[asset.hashed_name] = (asset, IMMUTABLE)
+
+        index_path = self.root / self.index_name
+        self.index = None
+        if index_path.is_file():
+            html = self._rewrite(index_path.read_text(encoding="utf-8"), assets)
+            self.index = _build_asset(self.index_name, html.encode("utf-8"))
+            routes[self.index_name] = (self.index, REVALIDATE)
+
+        self.assets, self._routes = assets, routes
+        logger.info("Loaded %s static assets from %s", len(assets), self.root)
+
+    def _rewrite(self, html: str, assets: Mapping[str, StaticAsset]) -> str:
+        def _replace(match: re.Match) -> str:
+            asset = assets.get(match.group(1))
+            if asset is None:
+                return match.group(0)
+            return f"{self.url_prefix}/{asset.hashed_name}"
+
+        return _UI_REFERENCE.sub(_replace, html)
+
+    def response(self, name: str, headers: Headers) -> Response:
+        route = self._routes.get(name)
+        if route is None:
+            return PlainTextResponse("Not Found", status_code=404)
+        asset, cache_control = route
+        encoding, body, etag = asset.select(headers.get("accept-encoding", ""))
+        response_headers = {"Cache-Control": cache_control, "ETag": etag, "Vary": "Accept-Encoding"}
+
+        if_none_match = headers.get("if-none-match")
+        if if_none_match and (
+            if_none_match.strip() == "*"
+            or etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+        ):
+            return Response(status_code=304, headers=response_headers)
+        if encoding != "identity":
+            response_headers["Content-Encoding"] = encoding
+        return Response(body, media_type=asset.media_type, headers=response_headers)
+
+    def index_response(self, headers: Headers) -> Response:
+        return self.response(self.index_name, headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            return
+        if scope["method"] not in ("GET", "HEAD"):
+            response: Response = PlainTextResponse("Method Not Allowed", status_code=405)
+        else:
+            path = scope["path"]
+            root_path = scope.get("root_path", "")
+            # Newer Starlette keeps the mount prefix in "path" and records it in "root_path".
+            if root_path and path.startswith(root_path):
+                path = path[len(root_path):]
+            response = self.response(path.lstrip("/"), Headers(scope=scope))
+        await response(scope, receive, send)
@@ -0,0 +1,323 @@
+"""WebSocket fan-out for agent workflow events."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict, defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Deque, DefaultDict, Dict, List, Optional
+
+from fastapi import WebSocket
+
+from event_bus import EventBus, InProcessEventBus, stamp_seq
+
+logger = logging.getLogger(__name__)
+
+TOKEN_FLUSH_MS = float(os.getenv("CAREPATH_TOKEN_FLUSH_MS", "30"))
+TOKEN_FLUSH_BYTES = int(os.getenv("CAREPATH_TOKEN_FLUSH_BYTES", "1024"))
+OUTBOUND_QUEUE_SIZE = int(os.getenv("CAREPATH_WS_QUEUE_SIZE", "256"))
+SLOW_CONSUMER_POLICY = os.getenv("CAREPATH_WS_SLOW_POLICY", "merge").lower()
+STUCK_TIMEOUT_SECONDS = float(os.getenv("CAREPATH_WS_STUCK_SECONDS", "10"))
+REPLAY_FRAMES = int(os.getenv("CAREPATH_WS_REPLAY_FRAMES", "512"))
+REPLAY_SESSIONS = int(os.getenv("CAREPATH_WS_REPLAY_SESSIONS", "1000"))
+
+# Close code sent to a consumer that cannot keep up ("try again later").
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+@dataclass
+class _TokenBuffer:
+    parts: List[str] = field(default_factory=list)
+    size: int = 0
+    timer: Optional[asyncio.TimerHandle] = None
+
+
+@dataclass
+class _Frame:
+    text: str
+    seq: int = 0
+    # Set for agent_token frames, the only frames that may be merged or dropped.
+    token_agent: Optional[str] = None
+    token_content: Optional[str] = None
+
+    @staticmethod
+    def token_body(agent_id: str, content: str) -> str:
+        return json.dumps({"type": "agent_token", "agent_id": agent_id, "content": content})
+
+    @classmethod
+    def tokens(cls, agent_id: str, content: str, seq: int) -> "_Frame":
+        return cls(stamp_seq(cls.token_body(agent_id, content), seq), seq, agent_id, content)
+
+    def content(self) -> str:
+        # Frames received from the event bus only carry the encoded text.
+        if self.token_content is None:
+            self.token_content = json.loads(self.text).get("content", "")
+        return self.token_content
+
+
+class _Subscriber:
+    """One socket with its own bounded outbound queue and writer task.
+
+    When the queue is full, token frames are merged into the newest pending
+    frame for the same agent ("merge") or dropped ("drop"); the agent_message
+    that ends each step still carries the full text. Other frames are never
+    dropped: room is made by shedding the oldest pending token frame, and a
+    consumer that stays full or blocks a send for ``stuck_timeout`` is closed.
+    """
+
+    def __init__(
+        self,
+        manager: "ConnectionManager",
+        session_id: str,
+        ws: WebSocket,
+        max_queue: int,
+        policy: str,
+        stuck_timeout: float,
+    ) -> None:
+        self.manager = manager
+        self.session_id = session_id
+        self.ws = ws
+        self.max_queue = max_queue
+        self.policy = policy
+        self.stuck_timeout = stuck_timeout
+        self.frames: Deque[_Frame] = deque()
+        self.full_since: Optional[float] = None
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._write_loop())
+
+    def offer(self, frame: _Frame) -> bool:
+        """Queue ``frame``; returns False when the consumer should be disconnected."""
+        if len(self.frames) < self.max_queue:
+            self.full_since = None
+            self._enqueue(frame)
+            return True
+
+        now = time.monotonic()
+        if self.full_since is None:
+            self.full_since = now
+        elif now - self.full_since > self.stuck_timeout:
+            return False
+
+        if frame.token_agent is not None:
+            if self.policy == "merge":
+                self._merge_tokens(frame)
+            return True
+
+        if self._shed_oldest_tokens():
+            self._enqueue(frame)
+            return True
+        return False
+
+    def _enqueue(self, frame: _Frame) -> None:
+        self.frames.append(frame)
+        self._wakeup.set()
+
+    def _merge_tokens(self, frame: _Frame) -> None:
+        # Only merge across other agents' token frames, never past a control frame.
+        for index in range(len(self.frames) - 1, -1, -1):
+            pending = self.frames[index]
+            if pending.token_agent is None:
+                break
+            if pending.token_agent == frame.token_agent:
+                self.frames[index] = _Frame.tokens(frame.token_agent, pending.content() + frame.content(), frame.seq)
+                return
+
+    def preload(self, frames: List[_Frame]) -> None:
+        """Queue replayed frames ahead of live ones, bypassing the size limit."""
+        if frames:
+            self.frames.extend(frames)
+            self._wakeup.set()
+
+    def _shed_oldest_tokens(self) -> bool:
+        for index, pending in enumerate(self.frames):
+            if pending.token_agent is not None:
+                del self.frames[index]
+                return True
+        return False
+
+    async def _write_loop(self) -> None:
+        try:
+            while True:
+                while not self.frames:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                frame = self.frames.popleft()
+                await asyncio.wait_for(self.ws.send_text(frame.text), timeout=self.stuck_timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Send failed or stalled: treat the socket as gone. Close it before dropping
+            # the subscriber, which would otherwise be cleaning up after its own task.
+            await self.manager.close_quietly(self.ws)
+            self.manager.disconnect(self.session_id, self.ws)
+
+    def close(self) -> None:
+        # Called from the write loop itself when its socket fails; that task is already finishing.
+        if asyncio.current_task() is not self._task:
+            self._task.cancel()
+
+
+class _ReplayLog:
+    """Bounded history of one session's recent frames, by sequence number."""
+
+    def __init__(self, max_frames: int) -> None:
+        self.frames: Deque[_Frame] = deque(maxlen=max_frames)
+        self.last_seq = 0
+
+    def record(self, frame: _Frame) -> None:
+        self.frames.append(frame)
+        self.last_seq = max(self.last_seq, frame.seq)
+
+    def since(self, seq: int, latest: Optional[int] = None) -> Optional[List[_Frame]]:
+        """Frames after ``seq`` up to ``latest``, or None if some of them are not held here."""
+        if latest is not None and latest > self.last_seq:
+            # Frames were numbered on another worker while this one was not subscribed.
+            return None
+        if seq == self.last_seq:
+            return []
+        if seq > self.last_seq or not self.frames or self.frames[0].seq > seq + 1:
+            return None
+        missed = [frame for frame in self.frames if frame.seq > seq]
+        # A worker only receives a session's frames while it has sockets for it, so the log can have gaps.
+        if any(frame.seq != seq + offset for offset, frame in enumerate(missed, 1)):
+            return None
+        return missed
+
+
+class ConnectionManager:
+    """Tracks sockets per session and streams events to them.
+
+    Token chunks are coalesced per (session, agent) and flushed as a single
+    ``agent_token`` frame every ``flush_interval_ms`` or once ``flush_bytes``
+    of text are pending. Any other event for the session flushes pending
+    tokens first, so frames keep their order. Each frame is JSON-encoded once
+    and handed to every subscriber's queue; broadcasting never waits on a
+    client's network, so agent progress is not gated on the slowest browser.
+
+    Frames travel through an ``EventBus``, which also routes them to sockets
+    for the same session held by other workers.
+
+    Every frame carries a per-session ``seq`` allocated by the bus. The last ``replay_frames``
+    frames of recently active sessions are kept so a client reconnecting with
+    ``resume_from`` gets what it missed; if that is no longer available it is
+    sent ``resync_required`` and reloads the session over REST.
+    """
+
+    def __init__(
+        self,
+        flush_interval_ms: float = TOKEN_FLUSH_MS,
+        flush_bytes: int = TOKEN_FLUSH_BYTES,
+        max_queue: int = OUTBOUND_QUEUE_SIZE,
+        slow_policy: str = SLOW_CONSUMER_POLICY,
+        stuck_timeout: float = STUCK_TIMEOUT_SECONDS,
+        bus: Optional[EventBus] = None,
+        replay_frames: int = REPLAY_FRAMES,
+        replay_sessions: int = REPLAY_SESSIONS,
+    ) -> None:
+        self.sessions: DefaultDict[str, Dict[WebSocket, _Subscriber]] = defaultdict(dict)
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_bytes = flush_bytes
+        self.max_queue = max_queue
+        self.slow_policy = slow_policy
+        self.stuck_timeout = stuck_timeout
+        self._token_buffers: DefaultDict[str, Dict[str, _TokenBuffer]] = defaultdict(dict)
+        self.replay_frames = replay_frames
+        self.replay_sessions = replay_sessions
+        self._replay: "OrderedDict[str, _ReplayLog]" = OrderedDict()
+        self.bus = bus or InProcessEventBus()
+        self.bus.bind(self._deliver, self._next_seq)
+
+    async def connect(self, session_id: str, ws: WebSocket, resume_from: Optional[int] = None) -> None:
+        """Register ``ws``; with ``resume_from``, first replay the frames after that seq."""
+        # Read before registering, so no live frame is queued ahead of the replayed ones.
+        latest = await self.bus.last_seq(session_id) if resume_from is not None else None
+        first = not self.sessions.get(session_id)
+        subscriber = _Subscriber(self, session_id, ws, self.max_queue, self.slow_policy, self.stuck_timeout)
+        self.sessions[session_id][ws] = subscriber
+        if resume_from is not None:
+            log = self._replay.get(session_id)
+            if log is not None:
+                missed = log.since(resume_from, latest)
+            else:
+                missed = [] if resume_from == (latest or 0) else None
+            if missed is None:
+                last_seq = max(log.last_seq if log else 0, latest or 0)
+                missed = [_Frame(json.dumps({"type": "resync_required", "seq": last_seq}), last_seq)]
+            subscriber.preload(missed)
+        if first:
+            await self.bus.subscribe(session_id)
+
+    def disconnect(self, session_id: str, ws: WebSocket) -> None:
+        subscribers = self.sessions.get(session_id)
+        if subscribers is None:
+            return
+        subscriber = subscribers.pop(ws, None)
+        if subscriber is not None:
+            subscriber.close()
+        if not subscribers:
+            self.sessions.pop(session_id, None)
+            self.bus.unsubscribe(session_id)
+
+    async def broadcast(self, session_id: str, message: dict) -> None:
+        self.flush_tokens(session_id)
+        self.bus.publish(session_id, json.dumps(message))
+
+    async def stream_token(self, session_id: str, agent_id: str, text: str) -> None:
+        """Queue a streamed chunk; it is sent with its neighbours in one frame."""
+        buffer = self._token_buffers[session_id].setdefault(agent_id, _TokenBuffer())
+        buffer.parts.append(text)
+        buffer.size += len(text)
+        if buffer.size >= self.flush_bytes or not self.flush_interval:
+            self._flush_buffer(session_id, agent_id)
+        elif buffer.timer is None:
+            loop = asyncio.get_running_loop()
+            buffer.timer = loop.call_later(self.flush_interval, self._flush_buffer, session_id, agent_id)
+
+    def flush_tokens(self, session_id: str) -> None:
+        for agent_id in list(self._token_buffers.get(session_id, {})):
+            self._flush_buffer(session_id, agent_id)
+
+    def _flush_buffer(self, session_id: str, agent_id: str) -> None:
+        buffers = self._token_buffers.get(session_id)
+        buffer = buffers.pop(agent_id, None) if buffers else None
+        if buffers is not None and not buffers:
+            self._token_buffers.pop(session_id, None)
+        if buffer is None:
+            return
+        if buffer.timer is not None:
+            buffer.timer.cancel()
+        self.bus.publish(session_id, _Frame.token_body(agent_id, "".join(buffer.parts)), agent_id)
+
+    def _replay_log(self, session_id: str) -> _ReplayLog:
+        log = self._replay.get(session_id)
+        if log is None:
+            log = self._replay[session_id] = _ReplayLog(self.replay_frames)
+            while len(self._replay) > self.replay_sessions:
+                self._replay.popitem(last=False)
+        self._replay.move_to_end(session_id)
+        return log
+
+    def _next_seq(self, session_id: str) -> int:
+        log = self._replay_log(session_id)
+        log.last_seq += 1
+        return log.last_seq
+
+    def _deliver(self, session_id: str, text: str, seq: int, token_agent: Optional[str]) -> None:
+        frame = _Frame(text, seq, token_agent)
+        self._replay_log(session_id).record(frame)
+        for ws, subscriber in list(self.sessions.get(session_id, {}).items()):
+            if not subscriber.offer(frame):
+                logger.warning("Disconnecting slow WebSocket consumer for session %s", session_id)
+                self.disconnect(session_id, ws)
+                asyncio.ensure_future(self.close_quietly(ws))
+
+    @staticmethod
+    async def close_quietly(ws: WebSocket) -> None:
+        try:
+            await ws.close(SLOW_CONSUMER_CLOSE_CODE)
+        except Exception:
+            pass
@@ -0,0 +1,126 @@
+"""Write-behind queue that group-commits session events from many sessions."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from database import ConnectionPool
+from repository import write_event_groups
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL_MS = float(os.getenv("CAREPATH_WRITE_FLUSH_MS", "5"))
+MAX_GROUPS_PER_COMMIT = int(os.getenv("CAREPATH_WRITE_MAX_BATCH", "256"))
+
+
+@dataclass
+class _PendingWrite:
+    session_id: str
+    user_id: str
+    events: List[Tuple[str, Dict[str, Any]]]
+    ack: asyncio.Future
+
+
+class EventWriteQueue:
+    """Collects event writes for a few milliseconds and commits them together.
+
+    ``submit`` resolves only after the transaction containing the events has
+    committed, so callers get a durability acknowledgement while the database
+    sees one commit per flush instead of one per event.
+    """
+
+    def __init__(
+        self,
+        pool: ConnectionPool,
+        flush_interval_ms: float = FLUSH_INTERVAL_MS,
+        max_groups: int = MAX_GROUPS_PER_COMMIT,
+    ) -> None:
+        self.pool = pool
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_groups = max_groups
+        self._queue: "asyncio.Queue[Optional[_PendingWrite]]" = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def submit_nowait(self, session_id: str, user_id: str, events: List[Tuple[str, Dict[str, Any]]]) -> asyncio.Future:
+        """Queue events and return a future that resolves once they are committed."""
+        ack = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(_PendingWrite(session_id, user_id, events, ack))
+        return ack
+
+    async def submit(self, session_id: str, user_id: str, events: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """Queue events and wait for the commit; raises SessionNotFound or UnsupportedEvent."""
+        await self.submit_nowait(session_id, user_id, events)
+
+    async def _run(self) -> None:
+        # A None item is the shutdown sentinel; everything queued before it is flushed.
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is None:
+                return
+            if self.flush_interval:
+                await asyncio.sleep(self.flush_interval)
+            batch = [first]
+            while len(batch) < self.max_groups and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[_PendingWrite]) -> None:
+        groups = [(item.session_id, item.user_id, item.events) for item in batch]
+        try:
+            results = await self.pool.run(lambda conn: write_event_groups(conn, groups))
+        except Exception as exc:
+            logger.exception("Failed to commit %s event groups", len(batch))
+            results = [exc] * len(batch)
+
+        for item, error in zip(batch, results):
+            if item.ack.done():
+                continue
+            if error is None:
+                item.ack.set_result(None)
+            else:
+                item.ack.set_exception(error)
+
+    async def close(self) -> None:
+        """Stop the flusher after committing anything still queued."""
+        if self._task is None:
+            return
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+
+
+class SessionEventSink:
+    """Persistence sink handed to an Agent: records workflow events for one session.
+
+    Writes are queued without waiting, so agent progress is never gated on the
+    database; the write queue group-commits them with everything else in flight.
+    """
+
+    def __init__(self, queue: EventWriteQueue, session_id: str, user_id: str) -> None:
+        self.queue = queue
+        self.session_id = session_id
+        self.user_id = user_id
+
+    def record(self, event_type: str, payload: Dict[str, Any]) -> None:
+        ack = self.queue.submit_nowait(self.session_id, self.user_id, [(event_type, payload)])
+        ack.add_done_callback(self._log_failure)
+
+    def _log_failure(self, ack: asyncio.Future) -> None:
+        if ack.cancelled():
+            return
+        error = ack.exception()
+        if error is not None:
+            logger.warning("Dropped workflow event for session %s: %r", self.session_id, error)
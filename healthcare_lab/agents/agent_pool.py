@@ -0,0 +1,102 @@
+"""
+Process-wide pool of Agent Framework clients and ChatAgents.
+
+The chat client and the ChatAgent instances carry no per-session state, so one
+set is created when the process starts and shared by every session. Conversation
+state lives in the per-session threads, which each Agent still creates from the
+state store on every turn.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from typing import Any, Dict, Optional
+
+from agent_framework import ChatAgent
+from agent_framework.azure import AzureOpenAIChatClient
+
+from .mcp_pool import MCPConnectionManager
+
+logger = logging.getLogger(__name__)
+
+
+class AgentPool:
+    """Long-lived Azure OpenAI client, MCP connections, and one entered ChatAgent per definition."""
+
+    def __init__(self, definitions: Dict[str, Dict[str, Any]]) -> None:
+        self.azure_deployment = os.getenv("AZURE_OPENAI_CHAT_DEPLOYMENT")
+        self.azure_openai_key = os.getenv("AZURE_OPENAI_API_KEY")
+        self.azure_openai_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
+        self.api_version = os.getenv("AZURE_OPENAI_API_VERSION")
+        self.openai_model_name = os.getenv("OPENAI_MODEL_NAME")
+
+        self._definitions = definitions
+        self.mcp = MCPConnectionManager()
+        self._chat_client: Optional[AzureOpenAIChatClient] = None
+        self._agents: Dict[str, ChatAgent] = {}
+        self._lock = asyncio.Lock()
+        self._ready = False
+
+    @property
+    def is_configured(self) -> bool:
+        return all([self.azure_openai_key, self.azure_deployment, self.azure_openai_endpoint, self.api_version])
+
+    @property
+    def chat_client(self) -> AzureOpenAIChatClient:
+        if self._chat_client is None:
+            raise RuntimeError("Agent pool has not been warmed up.")
+        return self._chat_client
+
+    async def warm_up(self) -> None:
+        """Create the shared client and enter every ChatAgent once."""
+        if self._ready:
+            return
+
+        async with self._lock:
+            if self._ready:
+                return
+
+            if not self.is_configured:
+                raise RuntimeError(
+                    "Azure OpenAI configuration is incomplete. Ensure AZURE_OPENAI_API_KEY, "
+                    "AZURE_OPENAI_CHAT_DEPLOYMENT, AZURE_OPENAI_ENDPOINT, and AZURE_OPENAI_API_VERSION are set."
+                )
+
+            self._chat_client = AzureOpenAIChatClient(
+                api_key=self.azure_openai_key,
+                deployment_name=self.azure_deployment,
+                endpoint=self.azure_openai_endpoint,
+                api_version=self.api_version,
+            )
+
+            for agent_id, config in self._definitions.items():
+                agent = ChatAgent(
+                    name=agent_id,
+                    description=config["description"],
+                    instructions=config["instructions"],
+                    chat_client=self._chat_client,
+                    model=self.openai_model_name,
+                )
+                await agent.__aenter__()
+                self._agents[agent_id] = agent
+
+            self._ready = True
+            logger.info("[HEALTHCARE] Agent pool ready with %s agents", len(self._agents))
+
+    async def get_agents(self) -> Dict[str, ChatAgent]:
+        await self.warm_up()
+        return self._agents
+
+    async def close(self) -> None:
+        async with self._lock:
+            for agent_id, agent in self._agents.items():
+                try:
+                    await agent.__aexit__(None, None, None)
+                except Exception:
+                    logger.exception("[HEALTHCARE] Failed to close agent %s", agent_id)
+            self._agents = {}
+            self._chat_client = None
+            self._ready = False
+        await self.mcp.close()
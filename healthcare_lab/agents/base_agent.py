@@ -37,5 +37,9 @@ class BaseAgent:
         """Allow backend to inject WebSocket manager for streaming events."""
         pass
 
+    def set_event_sink(self, sink: Any) -> None:
+        """Allow backend to inject a sink that persists messages, artifacts, and handoffs."""
+        pass
+
     async def chat_async(self, prompt: str) -> str:
         raise NotImplementedError("chat_async should be implemented in subclass")
@@ -15,16 +15,34 @@ import asyncio
 import json
 import logging
 import os
+from dataclasses import asdict
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
 
 from agent_framework import ChatAgent, MCPStreamableHTTPTool
-from agent_framework.azure import AzureOpenAIChatClient
 
+from .agent_pool import AgentPool
 from .base_agent import BaseAgent
+from .json_repair import Schema, extract_json, fixup_prompt, schema_from_instructions, validate
+from .prompt_context import ContextBlock, PromptContext, count_tokens
+from .streaming_json import RESET, StreamingJSONParser
+from .thread_codec import ThreadStateCodec
+from .workflow_dag import (
+    Speculation,
+    Speculator,
+    Step,
+    StepInputs,
+    StepResult,
+    TokenMeter,
+    WorkflowDAG,
+    payload,
+)
 
 logger = logging.getLogger(__name__)
 
+# (triage, diagnostics, coverage, coordination) payloads produced by every pattern.
+CasePayloads = Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any], Dict[str, Any]]
+
 
 AGENT_DEFINITIONS: Dict[str, Dict[str, Any]] = {
     "patient_companion": {
@@ -192,6 +210,13 @@ AGENT_DEFINITIONS: Dict[str, Dict[str, Any]] = {
     },
 }
 
+AGENT_POOL = AgentPool(AGENT_DEFINITIONS)
+
+# Keys each agent's JSON must contain, read from the skeleton in its instructions.
+AGENT_SCHEMAS: Dict[str, Schema] = {
+    agent_id: schema_from_instructions(definition["instructions"]) for agent_id, definition in AGENT_DEFINITIONS.items()
+}
+
 DEMO_EHR_CONTEXT = {
     "recent_visit_reason": "Fever and chills reported via patient portal",
     "recent_labs": ["WBC 6.2", "Hgb 12.1", "Platelets 210"],
@@ -213,67 +238,70 @@ DEMO_PAYER_CONTEXT = {
 class Agent(BaseAgent):
     """Healthcare handoff workflow orchestrator."""
 
-    def __init__(self, state_store: Dict[str, Any], session_id: str, access_token: str | None = None) -> None:
+    def __init__(
+        self,
+        state_store: Dict[str, Any],
+        session_id: str,
+        access_token: str | None = None,
+        pool: AgentPool | None = None,
+    ) -> None:
         super().__init__(state_store, session_id)
         self._access_token = access_token
+        self._pool = pool or AGENT_POOL
         self._ws_manager = None
+        self._event_sink = None
         self._agents: Dict[str, ChatAgent] = {}
         self._threads: Dict[str, Any] = {}
+        # Bumped whenever an agent's thread advances; a speculative fork only commits onto the version it forked.
+        self._thread_versions: Dict[str, int] = {}
+        self._forks: Dict[str, Tuple[Any, int, "asyncio.Task[str]", str]] = {}
+        # Background tasks finishing responses whose JSON was returned early, by agent.
+        self._drains: Dict[str, asyncio.Task] = {}
+        self._thread_codec = ThreadStateCodec(state_store, session_id)
+        self._prompt_context = PromptContext(state_store, session_id)
+        # Prompt tokens sent per agent this turn.
+        self._prompt_tokens: Dict[str, int] = {}
+        self._mcp_tool: MCPStreamableHTTPTool | None = None
         self._initialized = False
         self._turn_key = f"{session_id}_healthcare_turn"
         self._current_turn = int(state_store.get(self._turn_key, 0))
         self._lab_mode = os.getenv("HEALTHCARE_LAB_MODE", "demo").lower()
         self._brand = os.getenv("HEALTHCARE_LAB_BRAND", "CarePath")
+        self._speculation = os.getenv("HEALTHCARE_LAB_SPECULATION", "off").lower() == "on"
+        # Fix-up re-prompts allowed per turn when a reply is unusable even after local repair.
+        self._json_retry_budget = int(os.getenv("HEALTHCARE_LAB_JSON_RETRY_BUDGET", "2"))
+        self._json_retries_left = self._json_retry_budget
 
     def set_websocket_manager(self, manager: Any) -> None:
         self._ws_manager = manager
 
+    def set_event_sink(self, sink: Any) -> None:
+        self._event_sink = sink
+
+    def _persist(self, event_type: str, payload: Dict[str, Any]) -> None:
+        # The sink queues the write and returns immediately; it never blocks the workflow.
+        if self._event_sink:
+            self._event_sink.record(event_type, payload)
+
     async def _setup_agents(self) -> None:
+        if self._mcp_tool is None:
+            self._mcp_tool = await self._get_mcp_tool(self._build_headers())
         if self._initialized:
             return
 
-        if not all([self.azure_openai_key, self.azure_deployment, self.azure_openai_endpoint, self.api_version]):
-            raise RuntimeError(
-                "Azure OpenAI configuration is incomplete. Ensure AZURE_OPENAI_API_KEY, "
-                "AZURE_OPENAI_CHAT_DEPLOYMENT, AZURE_OPENAI_ENDPOINT, and AZURE_OPENAI_API_VERSION are set."
-            )
-
-        headers = self._build_headers()
-        base_mcp_tool = await self._create_mcp_tool(headers)
-
-        if base_mcp_tool:
-            await base_mcp_tool.__aenter__()
-            logger.info("[HEALTHCARE] Connected to MCP server, loaded %s tools", len(base_mcp_tool.functions))
-
-        chat_client = AzureOpenAIChatClient(
-            api_key=self.azure_openai_key,
-            deployment_name=self.azure_deployment,
-            endpoint=self.azure_openai_endpoint,
-            api_version=self.api_version,
-        )
-
-        for agent_id, config in AGENT_DEFINITIONS.items():
-            agent_kwargs: Dict[str, Any] = {
-                "name": agent_id,
-                "description": config["description"],
-                "instructions": config["instructions"],
-                "chat_client": chat_client,
-                "model": self.openai_model_name,
-            }
-
-            agent = ChatAgent(**agent_kwargs)
-            await agent.__aenter__()
-            self._agents[agent_id] = agent
+        # Agents and the chat client are shared process-wide; only threads are per session.
+        self._agents = await self._pool.get_agents()
 
+        for agent_id, agent in self._agents.items():
             thread_state_key = f"{self.session_id}_thread_{agent_id}"
-            thread_state = self.state_store.get(thread_state_key)
+            thread_state = self._thread_codec.decode(self.state_store.get(thread_state_key))
             if thread_state:
                 self._threads[agent_id] = await agent.deserialize_thread(thread_state)
             else:
                 self._threads[agent_id] = agent.get_new_thread()
 
         self._initialized = True
-        logger.info("[HEALTHCARE] Initialized %s agents", len(self._agents))
+        logger.info("[HEALTHCARE] Restored %s agent threads for session %s", len(self._threads), self.session_id)
 
     def _build_headers(self) -> Dict[str, str]:
         headers: Dict[str, str] = {"Content-Type": "application/json"}
@@ -281,19 +309,21 @@ class Agent(BaseAgent):
             headers["Authorization"] = f"Bearer {self._access_token}"
         return headers
 
-    async def _create_mcp_tool(self, headers: Dict[str, str]) -> MCPStreamableHTTPTool | None:
+    async def _get_mcp_tool(self, headers: Dict[str, str]) -> MCPStreamableHTTPTool | None:
         if not self.mcp_server_uri:
             return None
 
-        return MCPStreamableHTTPTool(
-            name="mcp-streamable",
-            url=self.mcp_server_uri,
-            headers=headers,
-            timeout=30,
-            request_timeout=30,
-        )
+        # Connections are pooled by URI + auth header; the lease is returned when the turn ends.
+        return await self._pool.mcp.acquire(self.mcp_server_uri, headers)
+
+    async def _release_mcp_tool(self) -> None:
+        if self._mcp_tool is None:
+            return
+        self._mcp_tool = None
+        await self._pool.mcp.release(self.mcp_server_uri, self._build_headers())
 
     async def _emit_orchestrator(self, kind: str, content: str) -> None:
+        self._persist("handoff", {"kind": kind, "content": content})
         if not self._ws_manager:
             return
         await self._ws_manager.broadcast(self.session_id, {"type": "orchestrator", "kind": kind, "content": content})
@@ -304,10 +334,25 @@ class Agent(BaseAgent):
         prompt: str,
         *,
         show_message_in_internal_process: bool = True,
+        structured: bool = False,
+        step_id: Optional[str] = None,
     ) -> str:
+        """Run one agent turn and return its response text.
+
+        The prompt's tokens are counted against ``step_id`` (default: the agent).
+
+        With ``structured`` the response is parsed while it streams: completed
+        fields are broadcast as ``agent_field`` events (``agent_field_reset``
+        withdraws those of an object that turned out malformed), and the step
+        returns the root JSON object as soon as it closes and parses. The rest
+        of the stream is drained in the background, and the agent's next step
+        waits for it.
+        """
+        await self._settle_agent(agent_id)
         agent = self._agents[agent_id]
         thread = self._threads[agent_id]
         agent_name = AGENT_DEFINITIONS[agent_id]["name"]
+        self._count_prompt(step_id or agent_id, prompt)
 
         if self._ws_manager:
             await self._ws_manager.broadcast(
@@ -320,35 +365,88 @@ class Agent(BaseAgent):
                 },
             )
 
-        full_response: List[str] = []
-        async for chunk in agent.run_stream(prompt, thread=thread):
-            if hasattr(chunk, "contents") and chunk.contents:
-                for content in chunk.contents:
-                    if getattr(content, "type", None) == "function_call":
-                        if self._ws_manager:
-                            await self._ws_manager.broadcast(
-                                self.session_id,
-                                {
-                                    "type": "tool_called",
-                                    "agent_id": agent_id,
-                                    "tool_name": content.name,
-                                    "turn": self._current_turn,
-                                },
-                            )
+        run_kwargs: Dict[str, Any] = {"thread": thread}
+        if self._mcp_tool:
+            run_kwargs["tools"] = self._mcp_tool
 
-            if hasattr(chunk, "text") and chunk.text:
-                full_response.append(chunk.text)
-                if self._ws_manager:
-                    await self._ws_manager.broadcast(
-                        self.session_id,
-                        {
-                            "type": "agent_token",
-                            "agent_id": agent_id,
-                            "content": chunk.text,
-                        },
-                    )
+        parser = StreamingJSONParser() if structured else None
+        full_response: List[str] = []
+        stream = agent.run_stream(prompt, **run_kwargs).__aiter__()
+        async for chunk in stream:
+            text = await self._consume_chunk(agent_id, chunk, full_response)
+            if not parser or not text:
+                continue
+            for field in parser.feed(text):
+                if not self._ws_manager:
+                    continue
+                if field == RESET:
+                    event = {"type": "agent_field_reset", "agent_id": agent_id}
+                else:
+                    event = {"type": "agent_field", "agent_id": agent_id, "path": field[0], "value": field[1]}
+                await self._ws_manager.broadcast(self.session_id, event)
+            if parser.done:
+                if agent_id == "diagnostics_orders":
+                    self._persist("artifact", {"artifact_type": "diagnostics", "data": parser.value})
+                self._drains[agent_id] = asyncio.create_task(
+                    self._drain_agent_step(agent_id, prompt, stream, full_response, thread)
+                )
+                # Exactly the object that parsed, so nothing earlier in the reply can be picked instead.
+                return parser.text[parser.start : parser.end]
 
         response_text = "".join(full_response)
+        await self._finish_agent_step(agent_id, prompt, response_text, thread)
+        return response_text
+
+    async def _consume_chunk(self, agent_id: str, chunk: Any, full_response: List[str]) -> Optional[str]:
+        if hasattr(chunk, "contents") and chunk.contents:
+            for content in chunk.contents:
+                if getattr(content, "type", None) == "function_call":
+                    self._persist("handoff", {"kind": "tool", "content": f"{agent_id}: {content.name}"})
+                    if self._ws_manager:
+                        await self._ws_manager.broadcast(
+                            self.session_id,
+                            {
+                                "type": "tool_called",
+                                "agent_id": agent_id,
+                                "tool_name": content.name,
+                                "turn": self._current_turn,
+                            },
+                        )
+
+        if hasattr(chunk, "text") and chunk.text:
+            full_response.append(chunk.text)
+            if self._ws_manager:
+                await self._ws_manager.stream_token(self.session_id, agent_id, chunk.text)
+            return chunk.text
+        return None
+
+    async def _drain_agent_step(
+        self, agent_id: str, prompt: str, stream: AsyncIterator[Any], full_response: List[str], thread: Any
+    ) -> None:
+        # The thread only records the exchange once the stream is exhausted.
+        try:
+            async for chunk in stream:
+                await self._consume_chunk(agent_id, chunk, full_response)
+            await self._finish_agent_step(agent_id, prompt, "".join(full_response), thread, record_artifact=False)
+        except Exception:
+            logger.exception("[HEALTHCARE] Failed to drain %s response for session %s", agent_id, self.session_id)
+
+    async def _settle_agent(self, agent_id: str) -> None:
+        drain = self._drains.pop(agent_id, None)
+        if drain:
+            await drain
+
+    async def _settle_agents(self) -> None:
+        for agent_id in list(self._drains):
+            await self._settle_agent(agent_id)
+
+    async def _finish_agent_step(
+        self, agent_id: str, prompt: str, response_text: str, thread: Any, record_artifact: bool = True
+    ) -> None:
+        if agent_id == "diagnostics_orders" and record_artifact:
+            artifact = self._extract_json(response_text)
+            if artifact:
+                self._persist("artifact", {"artifact_type": "diagnostics", "data": artifact})
 
         if self._ws_manager:
             await self._ws_manager.broadcast(
@@ -360,38 +458,98 @@ class Agent(BaseAgent):
                 },
             )
 
+        self._threads[agent_id] = thread
+        self._thread_versions[agent_id] = self._thread_versions.get(agent_id, 0) + 1
+        self._prompt_context.committed(agent_id, prompt)
         thread_state_key = f"{self.session_id}_thread_{agent_id}"
-        self.state_store[thread_state_key] = await thread.serialize()
+        self.state_store[thread_state_key] = self._thread_codec.encode(
+            await thread.serialize(), previous=self.state_store.get(thread_state_key)
+        )
 
-        return response_text
+    def _count_prompt(self, step_id: str, prompt: str) -> None:
+        # Only the text sent this call; the agent's thread history is not included.
+        tokens = count_tokens(prompt)
+        self._prompt_tokens[step_id] = self._prompt_tokens.get(step_id, 0) + tokens
+        logger.debug("[HEALTHCARE] %s prompt: %s tokens (new prompt text only)", step_id, tokens)
+
+    async def _speculate_step(self, step: Step, inputs: StepInputs, meter: TokenMeter) -> StepResult:
+        """Run ``step`` on a fork of its agent's thread without streaming anything to the UI.
+
+        Forks run without MCP tools: a discarded run must leave nothing behind.
+        """
+        await self._settle_agent(step.agent_id)
+        agent = self._agents[step.agent_id]
+        version = self._thread_versions.get(step.agent_id, 0)
+        fork = await agent.deserialize_thread(await self._threads[step.agent_id].serialize())
+        prompt = step.prompt(inputs)
+        meter.add(prompt)
+
+        parser = StreamingJSONParser()
+        full_response: List[str] = []
+        stream = agent.run_stream(prompt, thread=fork).__aiter__()
+        async for chunk in stream:
+            if hasattr(chunk, "text") and chunk.text:
+                full_response.append(chunk.text)
+                meter.add(chunk.text)
+                parser.feed(chunk.text)
+                if parser.done:
+                    break
 
-    @staticmethod
-    def _extract_json(text: str) -> Optional[Dict[str, Any]]:
-        if not text:
-            return None
+        rest = asyncio.create_task(self._drain_fork(stream, full_response, meter))
+        self._forks[step.id] = (fork, version, rest, prompt)
+        text = parser.text[parser.start : parser.end] if parser.done else "".join(full_response)
+        return StepResult(text, self._extract_json(text) or {})
 
-        json_candidate = None
-        if "```" in text:
-            fence_start = text.find("```")
-            fence_end = text.rfind("```")
-            if fence_end > fence_start:
-                json_candidate = text[fence_start + 3 : fence_end].strip()
-                if json_candidate.startswith("json"):
-                    json_candidate = json_candidate[4:].strip()
-        if not json_candidate:
-            start = text.find("{")
-            end = text.rfind("}")
-            if start != -1 and end != -1 and end > start:
-                json_candidate = text[start : end + 1]
-
-        if not json_candidate:
-            return None
+    @staticmethod
+    async def _drain_fork(stream: AsyncIterator[Any], full_response: List[str], meter: TokenMeter) -> str:
+        async for chunk in stream:
+            if hasattr(chunk, "text") and chunk.text:
+                full_response.append(chunk.text)
+                meter.add(chunk.text)
+        return "".join(full_response)
 
+    async def _finish_fork(self, agent_id: str, prompt: str, fork: Any, rest: "asyncio.Task[str]") -> None:
         try:
-            parsed = json.loads(json_candidate)
-            return parsed if isinstance(parsed, dict) else None
-        except json.JSONDecodeError:
-            return None
+            await self._finish_agent_step(agent_id, prompt, await rest, fork, record_artifact=False)
+        except Exception:
+            logger.exception("[HEALTHCARE] Failed to drain %s response for session %s", agent_id, self.session_id)
+
+    def _discard_speculation(self, step: Step) -> None:
+        fork = self._forks.pop(step.id, None)
+        if fork:
+            fork[2].cancel()
+
+    async def _commit_speculation(self, step: Step, result: StepResult) -> bool:
+        fork, version, rest, prompt = self._forks.pop(step.id)
+        # A response still draining into the agent's thread advances its version once it lands.
+        await self._settle_agent(step.agent_id)
+        if version != self._thread_versions.get(step.agent_id, 0) or validate(
+            result.payload or None, AGENT_SCHEMAS[step.agent_id] if step.schema is None else step.schema
+        ):
+            # Either the agent's thread moved on after the fork (replaying it would drop those messages),
+            # or the reply needs fixing, which the normal run handles.
+            rest.cancel()
+            return False
+        self._count_prompt(step.id, prompt)
+        if self._ws_manager:
+            await self._ws_manager.broadcast(
+                self.session_id,
+                {
+                    "type": "agent_start",
+                    "agent_id": step.agent_id,
+                    "agent_name": AGENT_DEFINITIONS[step.agent_id]["name"],
+                    "show_message_in_internal_process": step.show_message_in_internal_process,
+                },
+            )
+        if step.agent_id == "diagnostics_orders" and result.payload:
+            self._persist("artifact", {"artifact_type": "diagnostics", "data": result.payload})
+        # Like an early-returned structured step, the fork joins the agent's thread once its stream is drained.
+        self._drains[step.agent_id] = asyncio.create_task(self._finish_fork(step.agent_id, prompt, fork, rest))
+        return True
+
+    @staticmethod
+    def _extract_json(text: str) -> Optional[Dict[str, Any]]:
+        return extract_json(text)
 
     def _build_case_id(self) -> str:
         return f"HC-{self.session_id[:8]}-{self._current_turn}"
@@ -419,33 +577,49 @@ class Agent(BaseAgent):
             return DEMO_PAYER_CONTEXT
         return {"payer": "Not connected", "policy_notes": []}
 
+    def _ehr_block(self) -> ContextBlock:
+        return self._prompt_context.block("EHR context", self._ehr_context)
+
+    def _payer_block(self) -> ContextBlock:
+        return self._prompt_context.block("Payer context", self._payer_context)
+
+    # Prompts that carry reference context lead with it so their prefixes stay stable across steps and turns.
+
     def _triage_prompt(self, case_id: str, constraints: Dict[str, Any], intake_payload: Dict[str, Any]) -> str:
-        return (
-            f"Case: {case_id}\n"
-            f"EHR context: {json.dumps(self._ehr_context())}\n"
-            f"Symptom report: {json.dumps(intake_payload.get('symptom_report', {}))}\n"
-            f"Risk flags: {json.dumps(intake_payload.get('risk_flags', []))}\n"
-            f"Constraints: {json.dumps(constraints)}\n"
-            "Return triage JSON only."
+        return self._prompt_context.render(
+            "clinical_triage",
+            [self._ehr_block(), self._prompt_context.block("Constraints", lambda: constraints)],
+            [
+                f"Case: {case_id}",
+                f"Symptom report: {json.dumps(intake_payload.get('symptom_report', {}))}",
+                f"Risk flags: {json.dumps(intake_payload.get('risk_flags', []))}",
+                "Return triage JSON only.",
+            ],
         )
 
     def _diagnostics_prompt(self, case_id: str, triage_payload: Dict[str, Any]) -> str:
-        return (
-            f"Case: {case_id}\n"
-            f"Triage assessment: {json.dumps(triage_payload.get('triage_assessment', {}))}\n"
-            f"EHR context: {json.dumps(self._ehr_context())}\n"
-            "Return diagnostics/order JSON only."
+        return self._prompt_context.render(
+            "diagnostics_orders",
+            [self._ehr_block()],
+            [
+                f"Case: {case_id}",
+                f"Triage assessment: {json.dumps(triage_payload.get('triage_assessment', {}))}",
+                "Return diagnostics/order JSON only.",
+            ],
         )
 
     def _coverage_prompt(
         self, case_id: str, triage_payload: Dict[str, Any], diagnostics_payload: Dict[str, Any]
     ) -> str:
-        return (
-            f"Case: {case_id}\n"
-            f"Triage assessment: {json.dumps(triage_payload.get('triage_assessment', {}))}\n"
-            f"Order bundle: {json.dumps(diagnostics_payload.get('order_bundle', {}))}\n"
-            f"Payer context: {json.dumps(self._payer_context())}\n"
-            "Return coverage JSON only."
+        return self._prompt_context.render(
+            "coverage_prior_auth",
+            [self._payer_block()],
+            [
+                f"Case: {case_id}",
+                f"Triage assessment: {json.dumps(triage_payload.get('triage_assessment', {}))}",
+                f"Order bundle: {json.dumps(diagnostics_payload.get('order_bundle', {}))}",
+                "Return coverage JSON only.",
+            ],
         )
 
     def _coordination_prompt(
@@ -459,176 +633,368 @@ class Agent(BaseAgent):
             "Return coordination JSON only."
         )
 
-    async def _run_sequential(
-        self, case_id: str, constraints: Dict[str, Any], intake_payload: Dict[str, Any]
-    ) -> tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
-        await self._emit_orchestrator("progress", f"Intake complete for {case_id}. Handing off to Clinical Triage.")
-        triage_text = await self._run_agent_step("clinical_triage", self._triage_prompt(case_id, constraints, intake_payload))
-        triage_payload = self._extract_json(triage_text) or {}
-
-        await self._emit_orchestrator("progress", f"Triage proposal ready. Drafting diagnostics and orders for {case_id}.")
-        diagnostics_text = await self._run_agent_step("diagnostics_orders", self._diagnostics_prompt(case_id, triage_payload))
-        diagnostics_payload = self._extract_json(diagnostics_text) or {}
-
-        await self._emit_orchestrator("progress", f"Order draft complete. Checking coverage and prior auth for {case_id}.")
-        coverage_text = await self._run_agent_step(
-            "coverage_prior_auth", self._coverage_prompt(case_id, triage_payload, diagnostics_payload)
+    def _provisional_coordination_prompt(self, case_id: str, triage_payload: Dict[str, Any]) -> str:
+        return (
+            f"Case: {case_id}\n"
+            f"Triage assessment: {json.dumps(triage_payload.get('triage_assessment', {}))}\n"
+            "Draft a provisional coordination plan (scheduling + instructions) without waiting on orders.\n"
+            "Return coordination JSON only."
         )
-        coverage_payload = self._extract_json(coverage_text) or {}
-
-        await self._handle_documentation_addendum(case_id, diagnostics_payload, coverage_payload)
 
-        await self._emit_orchestrator("progress", f"Routing to Care Coordination for {case_id}.")
-        coordination_text = await self._run_agent_step(
-            "care_coordination", self._coordination_prompt(case_id, triage_payload, diagnostics_payload, coverage_payload)
+    def _triage_review_prompt(
+        self, case_id: str, triage_payload: Dict[str, Any], diagnostics_payload: Dict[str, Any]
+    ) -> str:
+        return (
+            f"Case: {case_id}\n"
+            f"Initial triage: {json.dumps(triage_payload.get('triage_assessment', {}))}\n"
+            f"Diagnostics draft: {json.dumps(diagnostics_payload)}\n"
+            "Review diagnostics and update triage assessment if needed. Return triage JSON only."
         )
-        coordination_payload = self._extract_json(coordination_text) or {}
-
-        return triage_payload, diagnostics_payload, coverage_payload, coordination_payload
 
-    async def _run_fanout_fanin(
-        self, case_id: str, constraints: Dict[str, Any], intake_payload: Dict[str, Any]
-    ) -> tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
-        await self._emit_orchestrator("progress", f"Intake complete for {case_id}. Starting triage.")
-        triage_text = await self._run_agent_step("clinical_triage", self._triage_prompt(case_id, constraints, intake_payload))
-        triage_payload = self._extract_json(triage_text) or {}
-
-        await self._emit_orchestrator("notice", f"Fan-out: diagnostics, coverage, and coordination planning in parallel.")
-        diagnostics_task = self._run_agent_step("diagnostics_orders", self._diagnostics_prompt(case_id, triage_payload))
-        coverage_task = self._run_agent_step(
-            "coverage_prior_auth", self._coverage_prompt(case_id, triage_payload, {"order_bundle": {}})
+    def _addendum_prompt(
+        self, case_id: str, diagnostics_payload: Dict[str, Any], coverage_payload: Dict[str, Any]
+    ) -> str:
+        return (
+            f"Case: {case_id}\n"
+            f"Documentation requested: {json.dumps(self._documentation_needed(coverage_payload))}\n"
+            f"Order bundle: {json.dumps(diagnostics_payload.get('order_bundle', {}))}\n"
+            "Provide a concise medical necessity addendum in JSON:\n"
+            '{ "medical_necessity_addendum": string }'
         )
-        coordination_task = self._run_agent_step(
-            "care_coordination",
-            (
-                f"Case: {case_id}\n"
-                f"Triage assessment: {json.dumps(triage_payload.get('triage_assessment', {}))}\n"
-                "Draft a provisional coordination plan (scheduling + instructions) without waiting on orders.\n"
-                "Return coordination JSON only."
-            ),
+
+    def _coverage_finalize_prompt(
+        self,
+        case_id: str,
+        triage_payload: Dict[str, Any],
+        diagnostics_payload: Dict[str, Any],
+        coverage_payload: Dict[str, Any],
+    ) -> str:
+        return self._prompt_context.render(
+            "coverage_prior_auth",
+            [self._payer_block()],
+            [
+                f"Case: {case_id}",
+                f"Triage assessment: {json.dumps(triage_payload.get('triage_assessment', {}))}",
+                f"Order bundle: {json.dumps(diagnostics_payload.get('order_bundle', {}))}",
+                f"Addendum: {coverage_payload.get('medical_necessity_addendum')}",
+                "Finalize coverage decision JSON only.",
+            ],
         )
 
-        diagnostics_text, coverage_text, coordination_text = await asyncio.gather(
-            diagnostics_task, coverage_task, coordination_task
+    def _followup_prompt(self, case_id: str, coordination_payload: Dict[str, Any]) -> str:
+        return (
+            f"Case: {case_id}\n"
+            f"Coordination plan: {json.dumps(coordination_payload.get('coordination_plan', {}))}\n"
+            "Draft patient-friendly follow-up messaging and monitoring schedule.\n"
+            "Return JSON: {\"follow_up_message\": string, \"monitoring_triggers\": [string]}"
         )
-        diagnostics_payload = self._extract_json(diagnostics_text) or {}
-        coverage_payload = self._extract_json(coverage_text) or {}
-        coordination_payload = self._extract_json(coordination_text) or {}
 
-        await self._handle_documentation_addendum(case_id, diagnostics_payload, coverage_payload)
+    @staticmethod
+    def _documentation_needed(coverage_payload: Dict[str, Any]) -> List[Any]:
+        return coverage_payload.get("coverage_decision", {}).get("documentation_needed", [])
 
-        await self._emit_orchestrator("notice", f"Fan-in: refining coordination with orders + coverage outputs.")
-        coordination_refine_text = await self._run_agent_step(
-            "care_coordination", self._coordination_prompt(case_id, triage_payload, diagnostics_payload, coverage_payload)
-        )
-        coordination_refine_payload = self._extract_json(coordination_refine_text) or {}
-        coordination_payload.update(coordination_refine_payload or {})
+    @staticmethod
+    def _section(step_payload: Dict[str, Any], key: str) -> Dict[str, Any]:
+        value = step_payload.get(key)
+        return value if isinstance(value, dict) else {}
 
-        return triage_payload, diagnostics_payload, coverage_payload, coordination_payload
+    @staticmethod
+    def _normalized(items: Any) -> List[str]:
+        """Order- and case-insensitive form of a list of model-written strings."""
+        return sorted({str(item).strip().lower() for item in items or []}) if isinstance(items, list) else []
 
-    async def _run_handoff(
-        self, case_id: str, constraints: Dict[str, Any], intake_payload: Dict[str, Any]
-    ) -> tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
-        await self._emit_orchestrator(
-            "notice",
-            "Handoff mode: rotating ownership with explicit review loops between agents.",
-        )
+    # Speculation bases: the decision fields a downstream step acts on, not the wording around them.
 
-        triage_text = await self._run_agent_step("clinical_triage", self._triage_prompt(case_id, constraints, intake_payload))
-        triage_payload = self._extract_json(triage_text) or {}
+    @classmethod
+    def _triage_basis(cls, triage_payload: Dict[str, Any]) -> str:
+        return str(cls._section(triage_payload, "triage_assessment").get("urgency_level", "")).strip().lower()
 
-        await self._emit_orchestrator("notice", "Handoff: Clinical Triage → Diagnostics & Orders")
-        diagnostics_text = await self._run_agent_step("diagnostics_orders", self._diagnostics_prompt(case_id, triage_payload))
-        diagnostics_payload = self._extract_json(diagnostics_text) or {}
+    @classmethod
+    def _orders_basis(cls, diagnostics_payload: Dict[str, Any]) -> Tuple[List[str], ...]:
+        bundle = cls._section(diagnostics_payload, "order_bundle")
+        return tuple(cls._normalized(bundle.get(kind)) for kind in ("labs", "imaging", "cultures"))
 
-        await self._emit_orchestrator("notice", "Handoff: Diagnostics & Orders → Clinical Triage (review loop)")
-        triage_review_prompt = (
-            f"Case: {case_id}\n"
-            f"Initial triage: {json.dumps(triage_payload.get('triage_assessment', {}))}\n"
-            f"Diagnostics draft: {json.dumps(diagnostics_payload)}\n"
-            "Review diagnostics and update triage assessment if needed. Return triage JSON only."
+    @classmethod
+    def _coverage_basis(cls, coverage_payload: Dict[str, Any]) -> Tuple[Any, ...]:
+        decision = cls._section(coverage_payload, "coverage_decision")
+        return (
+            str(decision.get("covered_pathway", "")).strip().lower(),
+            bool(decision.get("requires_prior_auth")),
+            cls._normalized(decision.get("documentation_needed")),
         )
-        triage_review_text = await self._run_agent_step("clinical_triage", triage_review_prompt)
-        triage_review_payload = self._extract_json(triage_review_text) or {}
-        if triage_review_payload:
-            triage_payload = triage_review_payload
-
-        await self._emit_orchestrator("notice", "Handoff: Clinical Triage → Coverage & Prior Auth")
-        coverage_text = await self._run_agent_step(
-            "coverage_prior_auth", self._coverage_prompt(case_id, triage_payload, diagnostics_payload)
+
+    @staticmethod
+    def _with_addendum(coverage_payload: Dict[str, Any], outputs: StepInputs) -> Dict[str, Any]:
+        coverage = dict(coverage_payload)
+        addendum = outputs.get("addendum")
+        if addendum is not None:
+            coverage["medical_necessity_addendum"] = addendum.payload.get("medical_necessity_addendum", addendum.text)
+        return coverage
+
+    def _addendum_step(self, case_id: str, notice: str) -> Step:
+        """Conditional node: drafts a medical necessity addendum when coverage asks for documentation."""
+        return Step(
+            "addendum",
+            "diagnostics_orders",
+            inputs=("diagnostics", "coverage"),
+            when=lambda r: bool(self._documentation_needed(payload(r, "coverage"))),
+            prompt=lambda r: self._addendum_prompt(case_id, payload(r, "diagnostics"), payload(r, "coverage")),
+            notice=("notice", notice),
+            schema={"medical_necessity_addendum": ()},
         )
-        coverage_payload = self._extract_json(coverage_text) or {}
-
-        documentation_needed = coverage_payload.get("coverage_decision", {}).get("documentation_needed", [])
-        if documentation_needed:
-            await self._emit_orchestrator("notice", "Handoff: Coverage → Diagnostics (documentation addendum)")
-            addendum_prompt = (
-                f"Case: {case_id}\n"
-                f"Documentation requested: {json.dumps(documentation_needed)}\n"
-                f"Order bundle: {json.dumps(diagnostics_payload.get('order_bundle', {}))}\n"
-                "Provide a concise medical necessity addendum in JSON:\n"
-                '{ "medical_necessity_addendum": string }'
-            )
-            addendum_text = await self._run_agent_step("diagnostics_orders", addendum_prompt)
-            addendum_payload = self._extract_json(addendum_text) or {}
-            coverage_payload["medical_necessity_addendum"] = addendum_payload.get(
-                "medical_necessity_addendum",
-                addendum_text,
-            )
 
-            await self._emit_orchestrator("notice", "Handoff: Diagnostics → Coverage (finalize)")
-            coverage_finalize_prompt = (
-                f"Case: {case_id}\n"
-                f"Triage assessment: {json.dumps(triage_payload.get('triage_assessment', {}))}\n"
-                f"Order bundle: {json.dumps(diagnostics_payload.get('order_bundle', {}))}\n"
-                f"Addendum: {coverage_payload.get('medical_necessity_addendum')}\n"
-                f"Payer context: {json.dumps(self._payer_context())}\n"
-                "Finalize coverage decision JSON only."
+    def _guess_from_last_case(self, step_id: str, key: str) -> Callable[[StepInputs], Optional[StepInputs]]:
+        """Speculation guess: ``step_id`` will produce the same payload as last turn's ``key``."""
+
+        def guess(inputs: StepInputs) -> Optional[StepInputs]:
+            previous = (self.state_store.get(f"{self.session_id}_last_case") or {}).get(key)
+            return {step_id: StepResult(json.dumps(previous), previous)} if previous else None
+
+        return guess
+
+    async def _run_structured_step(
+        self,
+        agent_id: str,
+        prompt: str,
+        schema: Optional[Schema] = None,
+        *,
+        show_message_in_internal_process: bool = True,
+        step_id: Optional[str] = None,
+    ) -> Tuple[str, Dict[str, Any]]:
+        """Run a step whose reply must be JSON matching ``schema`` (default: the agent's own).
+
+        Replies are repaired locally first; if they are still unusable the agent
+        is asked to fix them, while the turn's retry budget lasts.
+        """
+        schema = AGENT_SCHEMAS[agent_id] if schema is None else schema
+        text = await self._run_agent_step(
+            agent_id,
+            prompt,
+            show_message_in_internal_process=show_message_in_internal_process,
+            structured=True,
+            step_id=step_id,
+        )
+        parsed = self._extract_json(text)
+        problems = validate(parsed, schema)
+        while problems and self._json_retries_left > 0:
+            self._json_retries_left -= 1
+            logger.warning("[HEALTHCARE] Unusable %s reply (%s); re-prompting", agent_id, "; ".join(problems))
+            await self._emit_orchestrator(
+                "notice", f"Asking {AGENT_DEFINITIONS[agent_id]['name']} to fix its reply: {'; '.join(problems)}."
+            )
+            text = await self._run_agent_step(
+                agent_id,
+                fixup_prompt(problems, schema),
+                show_message_in_internal_process=show_message_in_internal_process,
+                structured=True,
+                step_id=step_id,
             )
-            coverage_finalize_text = await self._run_agent_step("coverage_prior_auth", coverage_finalize_prompt)
-            coverage_finalize_payload = self._extract_json(coverage_finalize_text) or {}
-            if coverage_finalize_payload:
-                coverage_payload.update(coverage_finalize_payload)
-
-        await self._emit_orchestrator("notice", "Handoff: Coverage & Prior Auth → Care Coordination")
-        coordination_text = await self._run_agent_step(
-            "care_coordination", self._coordination_prompt(case_id, triage_payload, diagnostics_payload, coverage_payload)
+            parsed = self._extract_json(text)
+            problems = validate(parsed, schema)
+        if problems:
+            logger.warning("[HEALTHCARE] Continuing with incomplete %s reply: %s", agent_id, "; ".join(problems))
+        return text, parsed or {}
+
+    async def _execute_step(self, step: Step, inputs: StepInputs) -> StepResult:
+        text, parsed = await self._run_structured_step(
+            step.agent_id,
+            step.prompt(inputs),
+            step.schema,
+            show_message_in_internal_process=step.show_message_in_internal_process,
+            step_id=step.id,
         )
-        coordination_payload = self._extract_json(coordination_text) or {}
+        return StepResult(text, parsed)
 
-        await self._emit_orchestrator("notice", "Handoff loop: Care Coordination → Patient Companion (close the loop)")
-        followup_prompt = (
-            f"Case: {case_id}\n"
-            f"Coordination plan: {json.dumps(coordination_payload.get('coordination_plan', {}))}\n"
-            "Draft patient-friendly follow-up messaging and monitoring schedule.\n"
-            "Return JSON: {\"follow_up_message\": string, \"monitoring_triggers\": [string]}"
+    def _sequential_dag(
+        self, case_id: str, constraints: Dict[str, Any], intake_payload: Dict[str, Any]
+    ) -> WorkflowDAG[CasePayloads]:
+        # Coordination only reads the coverage decision, so it runs alongside the addendum.
+        return WorkflowDAG(
+            "sequential",
+            [
+                Step(
+                    "triage",
+                    "clinical_triage",
+                    prompt=lambda r: self._triage_prompt(case_id, constraints, intake_payload),
+                    notice=("progress", f"Intake complete for {case_id}. Handing off to Clinical Triage."),
+                ),
+                Step(
+                    "diagnostics",
+                    "diagnostics_orders",
+                    inputs=("triage",),
+                    prompt=lambda r: self._diagnostics_prompt(case_id, payload(r, "triage")),
+                    notice=("progress", f"Triage proposal ready. Drafting diagnostics and orders for {case_id}."),
+                ),
+                Step(
+                    "coverage",
+                    "coverage_prior_auth",
+                    inputs=("triage", "diagnostics"),
+                    prompt=lambda r: self._coverage_prompt(case_id, payload(r, "triage"), payload(r, "diagnostics")),
+                    notice=("progress", f"Order draft complete. Checking coverage and prior auth for {case_id}."),
+                    # Follow-up turns often keep the same order bundle.
+                    speculation=Speculation(
+                        ("triage",),
+                        lambda r: self._orders_basis(payload(r, "diagnostics")),
+                        self._guess_from_last_case("diagnostics", "diagnostics"),
+                    ),
+                ),
+                self._addendum_step(case_id, "Coverage requires documentation. Generating medical necessity addendum."),
+                Step(
+                    "coordination",
+                    "care_coordination",
+                    inputs=("triage", "diagnostics", "coverage"),
+                    prompt=lambda r: self._coordination_prompt(
+                        case_id, payload(r, "triage"), payload(r, "diagnostics"), payload(r, "coverage")
+                    ),
+                    notice=("progress", f"Routing to Care Coordination for {case_id}."),
+                    speculation=Speculation(
+                        ("triage", "diagnostics"),
+                        lambda r: self._coverage_basis(payload(r, "coverage")),
+                        self._guess_from_last_case("coverage", "coverage"),
+                    ),
+                ),
+            ],
+            result=lambda r: (
+                payload(r, "triage"),
+                payload(r, "diagnostics"),
+                self._with_addendum(payload(r, "coverage"), r),
+                payload(r, "coordination"),
+            ),
         )
-        followup_text = await self._run_agent_step("patient_companion", followup_prompt, show_message_in_internal_process=False)
-        followup_payload = self._extract_json(followup_text) or {}
-        coordination_payload["follow_up_message"] = followup_payload.get("follow_up_message")
-
-        return triage_payload, diagnostics_payload, coverage_payload, coordination_payload
 
-    async def _handle_documentation_addendum(
-        self, case_id: str, diagnostics_payload: Dict[str, Any], coverage_payload: Dict[str, Any]
-    ) -> None:
-        documentation_needed = coverage_payload.get("coverage_decision", {}).get("documentation_needed", [])
-        if not documentation_needed:
-            return
-
-        await self._emit_orchestrator("notice", "Coverage requires documentation. Generating medical necessity addendum.")
-        addendum_prompt = (
-            f"Case: {case_id}\n"
-            f"Documentation requested: {json.dumps(documentation_needed)}\n"
-            f"Order bundle: {json.dumps(diagnostics_payload.get('order_bundle', {}))}\n"
-            "Provide a concise medical necessity addendum in JSON:\n"
-            '{ "medical_necessity_addendum": string }'
+    def _fanout_fanin_dag(
+        self, case_id: str, constraints: Dict[str, Any], intake_payload: Dict[str, Any]
+    ) -> WorkflowDAG[CasePayloads]:
+        # The addendum starts once diagnostics and coverage are in, without waiting on the coordination draft.
+        return WorkflowDAG(
+            "fanout_fanin",
+            [
+                Step(
+                    "triage",
+                    "clinical_triage",
+                    prompt=lambda r: self._triage_prompt(case_id, constraints, intake_payload),
+                    notice=("progress", f"Intake complete for {case_id}. Starting triage."),
+                ),
+                Step(
+                    "diagnostics",
+                    "diagnostics_orders",
+                    inputs=("triage",),
+                    prompt=lambda r: self._diagnostics_prompt(case_id, payload(r, "triage")),
+                    notice=("notice", "Fan-out: diagnostics, coverage, and coordination planning in parallel."),
+                ),
+                Step(
+                    "coverage",
+                    "coverage_prior_auth",
+                    inputs=("triage",),
+                    prompt=lambda r: self._coverage_prompt(case_id, payload(r, "triage"), {"order_bundle": {}}),
+                ),
+                Step(
+                    "coordination_draft",
+                    "care_coordination",
+                    inputs=("triage",),
+                    prompt=lambda r: self._provisional_coordination_prompt(case_id, payload(r, "triage")),
+                ),
+                self._addendum_step(case_id, "Coverage requires documentation. Generating medical necessity addendum."),
+                Step(
+                    "coordination",
+                    "care_coordination",
+                    inputs=("triage", "diagnostics", "coverage", "coordination_draft"),
+                    prompt=lambda r: self._coordination_prompt(
+                        case_id, payload(r, "triage"), payload(r, "diagnostics"), payload(r, "coverage")
+                    ),
+                    notice=("notice", "Fan-in: refining coordination with orders + coverage outputs."),
+                ),
+            ],
+            result=lambda r: (
+                payload(r, "triage"),
+                payload(r, "diagnostics"),
+                self._with_addendum(payload(r, "coverage"), r),
+                {**payload(r, "coordination_draft"), **payload(r, "coordination")},
+            ),
         )
-        addendum_text = await self._run_agent_step("diagnostics_orders", addendum_prompt)
-        addendum_payload = self._extract_json(addendum_text) or {}
-        coverage_payload["medical_necessity_addendum"] = addendum_payload.get(
-            "medical_necessity_addendum",
-            addendum_text,
+
+    def _handoff_dag(
+        self, case_id: str, constraints: Dict[str, Any], intake_payload: Dict[str, Any]
+    ) -> WorkflowDAG[CasePayloads]:
+        def triage(r: StepInputs) -> Dict[str, Any]:
+            # The reviewed assessment replaces the initial one when the review produced JSON.
+            return payload(r, "triage_review") or payload(r, "triage")
+
+        def coverage(r: StepInputs) -> Dict[str, Any]:
+            final = self._with_addendum(payload(r, "coverage"), r)
+            final.update(payload(r, "coverage_final"))
+            return final
+
+        def coordination(r: StepInputs) -> Dict[str, Any]:
+            plan = dict(payload(r, "coordination"))
+            plan["follow_up_message"] = payload(r, "followup").get("follow_up_message")
+            return plan
+
+        return WorkflowDAG(
+            "handoff",
+            [
+                Step(
+                    "triage",
+                    "clinical_triage",
+                    prompt=lambda r: self._triage_prompt(case_id, constraints, intake_payload),
+                ),
+                Step(
+                    "diagnostics",
+                    "diagnostics_orders",
+                    inputs=("triage",),
+                    prompt=lambda r: self._diagnostics_prompt(case_id, payload(r, "triage")),
+                    notice=("notice", "Handoff: Clinical Triage → Diagnostics & Orders"),
+                ),
+                Step(
+                    "triage_review",
+                    "clinical_triage",
+                    inputs=("triage", "diagnostics"),
+                    prompt=lambda r: self._triage_review_prompt(case_id, payload(r, "triage"), payload(r, "diagnostics")),
+                    notice=("notice", "Handoff: Diagnostics & Orders → Clinical Triage (review loop)"),
+                ),
+                Step(
+                    "coverage",
+                    "coverage_prior_auth",
+                    inputs=("triage", "triage_review", "diagnostics"),
+                    prompt=lambda r: self._coverage_prompt(case_id, triage(r), payload(r, "diagnostics")),
+                    notice=("notice", "Handoff: Clinical Triage → Coverage & Prior Auth"),
+                    # Bet that the review keeps the triage urgency unchanged.
+                    speculation=Speculation(("triage", "diagnostics"), lambda r: self._triage_basis(triage(r))),
+                ),
+                self._addendum_step(case_id, "Handoff: Coverage → Diagnostics (documentation addendum)"),
+                Step(
+                    "coverage_final",
+                    "coverage_prior_auth",
+                    inputs=("triage", "triage_review", "diagnostics", "coverage", "addendum"),
+                    when=lambda r: r["addendum"] is not None,
+                    prompt=lambda r: self._coverage_finalize_prompt(
+                        case_id, triage(r), payload(r, "diagnostics"), self._with_addendum(payload(r, "coverage"), r)
+                    ),
+                    notice=("notice", "Handoff: Diagnostics → Coverage (finalize)"),
+                ),
+                Step(
+                    "coordination",
+                    "care_coordination",
+                    inputs=("triage", "triage_review", "diagnostics", "coverage", "addendum", "coverage_final"),
+                    prompt=lambda r: self._coordination_prompt(case_id, triage(r), payload(r, "diagnostics"), coverage(r)),
+                    notice=("notice", "Handoff: Coverage & Prior Auth → Care Coordination"),
+                    # Bet that the addendum loop leaves the coverage decision as it is.
+                    speculation=Speculation(
+                        ("triage", "triage_review", "diagnostics", "coverage"), lambda r: self._coverage_basis(coverage(r))
+                    ),
+                ),
+                Step(
+                    "followup",
+                    "patient_companion",
+                    inputs=("coordination",),
+                    prompt=lambda r: self._followup_prompt(case_id, payload(r, "coordination")),
+                    notice=("notice", "Handoff loop: Care Coordination → Patient Companion (close the loop)"),
+                    show_message_in_internal_process=False,
+                    schema={"follow_up_message": ()},
+                ),
+            ],
+            result=lambda r: (triage(r), payload(r, "diagnostics"), coverage(r), coordination(r)),
+            notice=("notice", "Handoff mode: rotating ownership with explicit review loops between agents."),
         )
 
     async def _run_magentic(
@@ -674,10 +1040,7 @@ class Agent(BaseAgent):
                     await self._emit_orchestrator(event.kind, msg)
                 elif isinstance(event, MagenticAgentDeltaEvent):
                     if event.text:
-                        await self._ws_manager.broadcast(
-                            self.session_id,
-                            {"type": "agent_token", "agent_id": event.agent_id, "content": event.text},
-                        )
+                        await self._ws_manager.stream_token(self.session_id, event.agent_id, event.text)
                 elif isinstance(event, MagenticAgentMessageEvent):
                     msg = getattr(event.message, "text", "") if event.message else ""
                     await self._ws_manager.broadcast(
@@ -693,12 +1056,7 @@ class Agent(BaseAgent):
 
         manager_agent = ChatAgent(
             name="magentic_manager",
-            chat_client=AzureOpenAIChatClient(
-                api_key=self.azure_openai_key,
-                deployment_name=self.azure_deployment,
-                endpoint=self.azure_openai_endpoint,
-                api_version=self.api_version,
-            ),
+            chat_client=self._pool.chat_client,
             instructions=manager_instructions,
             model=self.openai_model_name,
         )
@@ -713,7 +1071,7 @@ class Agent(BaseAgent):
             f"Case: {case_id}\n"
             f"Patient statement: {prompt}\n"
             f"Intake: {json.dumps(intake_payload.get('symptom_report', {}))}\n"
-            f"EHR context: {json.dumps(self._ehr_context())}\n"
+            f"{self._ehr_block().text}\n"
             f"Constraints: {json.dumps(constraints)}\n"
             "Provide a structured patient update with headings and bullets."
         )
@@ -727,9 +1085,20 @@ class Agent(BaseAgent):
         return final_answer or "The Magentic workflow did not return a final response."
 
     async def chat_async(self, prompt: str) -> str:
+        try:
+            return await self._chat_turn(prompt)
+        finally:
+            # Responses still draining use the MCP tool; finish them before handing it back.
+            await self._settle_agents()
+            await self._release_mcp_tool()
+
+    async def _chat_turn(self, prompt: str) -> str:
         await self._setup_agents()
         self._current_turn += 1
         self.state_store[self._turn_key] = self._current_turn
+        self._json_retries_left = self._json_retry_budget
+        self._prompt_context.begin_turn()
+        self._prompt_tokens = {}
 
         pattern = self.state_store.get(f"{self.session_id}_pattern", "sequential")
 
@@ -737,6 +1106,7 @@ class Agent(BaseAgent):
         timestamp = datetime.utcnow().isoformat(timespec="seconds") + "Z"
         constraints = self._build_constraints()
 
+        self._persist("message", {"role": "user", "content": prompt})
         await self._emit_orchestrator("user_task", f"Case {case_id} intake received at {timestamp}.")
 
         intake_prompt = (
@@ -747,30 +1117,32 @@ class Agent(BaseAgent):
             "Do NOT assume oncology or chemotherapy unless explicitly stated.\n"
             "Produce the intake JSON now."
         )
-        intake_text = await self._run_agent_step("patient_companion", intake_prompt)
-        intake_payload = self._extract_json(intake_text) or {}
+        _, intake_payload = await self._run_structured_step("patient_companion", intake_prompt, step_id="intake")
 
-        if pattern == "sequential":
-            triage_payload, diagnostics_payload, coverage_payload, coordination_payload = await self._run_sequential(
-                case_id, constraints, intake_payload
-            )
-        elif pattern == "fanout_fanin":
-            triage_payload, diagnostics_payload, coverage_payload, coordination_payload = await self._run_fanout_fanin(
-                case_id, constraints, intake_payload
-            )
-        elif pattern == "handoff":
-            triage_payload, diagnostics_payload, coverage_payload, coordination_payload = await self._run_handoff(
-                case_id, constraints, intake_payload
-            )
-        elif pattern == "magentic":
+        workflows = {
+            "sequential": self._sequential_dag,
+            "fanout_fanin": self._fanout_fanin_dag,
+            "handoff": self._handoff_dag,
+        }
+        if pattern == "magentic":
             await self._emit_orchestrator("notice", "Magentic pattern is disabled in this demo. Using Sequential.")
-            triage_payload, diagnostics_payload, coverage_payload, coordination_payload = await self._run_sequential(
-                case_id, constraints, intake_payload
-            )
-        else:
-            triage_payload, diagnostics_payload, coverage_payload, coordination_payload = await self._run_sequential(
-                case_id, constraints, intake_payload
+        workflow = workflows.get(pattern, self._sequential_dag)(case_id, constraints, intake_payload)
+        speculator = (
+            Speculator(self._speculate_step, self._commit_speculation, self._discard_speculation)
+            if self._speculation
+            else None
+        )
+        try:
+            triage_payload, diagnostics_payload, coverage_payload, coordination_payload = await workflow.run(
+                self._execute_step, self._emit_orchestrator, speculator
             )
+        finally:
+            for _, _, rest, _ in self._forks.values():
+                rest.cancel()
+            self._forks.clear()
+        if speculator:
+            logger.info("[HEALTHCARE] %s %s", case_id, speculator.report.summary())
+            await self._emit_orchestrator("notice", speculator.report.summary())
 
         await self._emit_orchestrator("result", f"Workflow assembled for {case_id}. Preparing patient-facing summary.")
 
@@ -792,7 +1164,11 @@ class Agent(BaseAgent):
             f"Questions: {json.dumps(intake_payload.get('questions_for_patient', []))}\n"
             "Use bullet points where helpful. Keep sentences short and readable."
         )
-        final_response = await self._run_agent_step("patient_companion", final_prompt, show_message_in_internal_process=False)
+        final_response = await self._run_agent_step(
+            "patient_companion", final_prompt, show_message_in_internal_process=False, step_id="final"
+        )
+        self._persist("message", {"role": "assistant", "content": final_response})
+        await self._settle_agents()
 
         if self._ws_manager:
             await self._ws_manager.broadcast(self.session_id, {"type": "final_result", "content": final_response})
@@ -804,7 +1180,7 @@ class Agent(BaseAgent):
             ]
         )
 
-        self.state_store[f"{self.session_id}_last_case"] = {
+        last_case: Dict[str, Any] = {
             "case_id": case_id,
             "intake": intake_payload,
             "triage": triage_payload,
@@ -812,6 +1188,16 @@ class Agent(BaseAgent):
             "coverage": coverage_payload,
             "coordination": coordination_payload,
         }
+        if speculator:
+            last_case["speculation"] = asdict(speculator.report)
+        last_case["prompt_tokens"] = dict(self._prompt_tokens)
+        self.state_store[f"{self.session_id}_last_case"] = last_case
+        logger.info(
+            "[HEALTHCARE] %s prompt tokens per step (new prompt text only): %s total %s",
+            case_id,
+            sum(self._prompt_tokens.values()),
+            self._prompt_tokens,
+        )
 
         self._setstate({"mode": "healthcare_handoff", "case_id": case_id})
 
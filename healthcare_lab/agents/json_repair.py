@@ -0,0 +1,201 @@
+"""
+Recovery and validation of the JSON objects agents return.
+
+``extract_json`` pulls the object out of a response (fenced or bare) and, when
+it does not parse, applies cheap local repairs: single-quoted strings, Python
+literals, raw newlines inside strings, trailing commas, and output truncated
+mid-object. ``schema_from_instructions`` reads the JSON skeleton an agent's
+instructions ask for, and ``validate`` lists what a payload is missing from it,
+so the caller can re-prompt only when the local repairs were not enough.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Required top-level key -> child keys the skeleton lists for it (empty for non-objects).
+Schema = Dict[str, Tuple[str, ...]]
+
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_SKELETON_KEY = re.compile(r'^(\s*)"(\w+)"\s*:\s*(\{)?')
+
+
+def _candidate(text: str) -> Optional[str]:
+    if "```" in text:
+        fence_start = text.find("```")
+        fence_end = text.rfind("```")
+        if fence_end > fence_start:
+            fenced = text[fence_start + 3 : fence_end].strip()
+            if fenced.startswith("json"):
+                fenced = fenced[4:].strip()
+            if fenced:
+                return fenced
+    start = text.find("{")
+    if start == -1:
+        return None
+    end = text.rfind("}")
+    # No closing brace after the opening one: the response was cut off.
+    return text[start : end + 1] if end > start else text[start:]
+
+
+def _strip_trailing(out: List[str], chars: str) -> None:
+    while out and (out[-1].isspace() or out[-1] in chars):
+        out.pop()
+
+
+def _ends_with_key(out: List[str]) -> bool:
+    """True if ``out`` ends with an object key still waiting for its value."""
+    text = "".join(out).rstrip()
+    if not text.endswith('"'):
+        return False
+    i = len(text) - 2
+    while i >= 0 and not (text[i] == '"' and (i == 0 or text[i - 1] != "\\")):
+        i -= 1
+    before = text[:i].rstrip()
+    return before.endswith(("{", ","))
+
+
+def repair_json(candidate: str) -> str:
+    """Rewrite near-JSON into JSON; the result may still fail to parse."""
+    out: List[str] = []
+    closers: List[str] = []
+    quote: Optional[str] = None
+    i = 0
+    while i < len(candidate):
+        c = candidate[i]
+        if quote:
+            if c == "\\" and i + 1 < len(candidate):
+                escaped = candidate[i + 1]
+                out.append(escaped if escaped == "'" else c + escaped)
+                i += 2
+                continue
+            if c == quote:
+                quote = None
+                out.append('"')
+            elif c == '"':
+                out.append('\\"')
+            elif c == "\n":
+                out.append("\\n")
+            else:
+                out.append(c)
+        elif c in "\"'":
+            quote = c
+            out.append('"')
+        elif c in "{[":
+            closers.append("}" if c == "{" else "]")
+            out.append(c)
+        elif c in "}]":
+            _strip_trailing(out, ",")
+            if closers:
+                closers.pop()
+            out.append(c)
+            if not closers:
+                break
+        elif c.isalpha():
+            j = i
+            while j < len(candidate) and (candidate[j].isalnum() or candidate[j] == "_"):
+                j += 1
+            word = candidate[i:j]
+            out.append(_LITERALS.get(word, word))
+            i = j
+            continue
+        else:
+            out.append(c)
+        i += 1
+
+    if quote:
+        out.append('"')
+    if closers:
+        # Truncated: finish the member in progress, then close everything still open.
+        _strip_trailing(out, ",")
+        if out and out[-1] == ":":
+            out.append("null")
+        elif closers[-1] == "}" and _ends_with_key(out):
+            out.append(": null")
+        for closer in reversed(closers):
+            _strip_trailing(out, ",")
+            out.append(closer)
+    return "".join(out)
+
+
+def extract_json(text: str) -> Optional[Dict[str, Any]]:
+    """The JSON object in an agent response, repaired locally if needed; None if unrecoverable."""
+    if not text:
+        return None
+    candidate = _candidate(text)
+    if not candidate:
+        return None
+    try:
+        parsed = json.loads(candidate)
+    except json.JSONDecodeError:
+        try:
+            parsed = json.loads(repair_json(candidate))
+        except json.JSONDecodeError:
+            return None
+        logger.debug("Repaired malformed agent JSON")
+    return parsed if isinstance(parsed, dict) else None
+
+
+def schema_from_instructions(instructions: str, optional: Iterable[str] = ("handoff_contract",)) -> Schema:
+    """Required keys from the JSON skeleton in an agent's instructions.
+
+    The object-valued top-level fields are what the workflow consumes; scalar
+    fields and the ``optional`` envelope keys are not required.
+    """
+    lines = instructions.splitlines()
+    try:
+        start = lines.index("{")
+    except ValueError:
+        return {}
+    skipped = set(optional)
+    fields: Dict[str, List[str]] = {}
+    current: Optional[str] = None
+    top_indent: Optional[int] = None
+    for line in lines[start + 1 :]:
+        if line == "}":
+            break
+        match = _SKELETON_KEY.match(line)
+        if not match:
+            continue
+        indent, key, opens_object = len(match.group(1)), match.group(2), match.group(3)
+        if top_indent is None:
+            top_indent = indent
+        if indent == top_indent:
+            current = key if opens_object and key not in skipped else None
+            if current:
+                fields[current] = []
+        elif current and indent > top_indent:
+            fields[current].append(key)
+    return {key: tuple(children) for key, children in fields.items()}
+
+
+def validate(payload: Optional[Dict[str, Any]], schema: Schema) -> List[str]:
+    """Problems that make ``payload`` unusable against ``schema``; empty if it is fine."""
+    if payload is None:
+        return ["the reply did not contain a parseable JSON object"]
+    problems = []
+    for key, children in schema.items():
+        value = payload.get(key)
+        if value is None:
+            problems.append(f'missing "{key}"')
+        elif children and not isinstance(value, dict):
+            problems.append(f'"{key}" must be an object with {", ".join(children)}')
+        elif children and not value:
+            problems.append(f'"{key}" is empty')
+    return problems
+
+
+def fixup_prompt(problems: List[str], schema: Schema) -> str:
+    fields = "; ".join(
+        f'"{key}" ({", ".join(children)})' if children else f'"{key}"' for key, children in schema.items()
+    )
+    return (
+        f"Your previous reply could not be used: {'; '.join(problems)}.\n"
+        f"Reply again with ONLY the corrected JSON object. It must include {fields}.\n"
+        "Keep the same content; do not add commentary."
+    )
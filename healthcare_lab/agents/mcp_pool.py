@@ -0,0 +1,202 @@
+"""
+Pooled MCP connections for the healthcare agents.
+
+Each live MCPStreamableHTTPTool is keyed by server URI and Authorization header,
+so sessions with the same credentials reuse one connection and its tool
+catalogue instead of reconnecting and re-listing tools on every turn.
+
+Callers lease a tool with ``acquire`` and hand it back with ``release``. Only
+connections with no outstanding leases are evicted, so the pool may run over
+``MCP_POOL_SIZE`` while every connection is in use. Each connection is entered
+and exited by its own owner task, because the MCP client must be closed by the
+task that opened it.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+from agent_framework import MCPStreamableHTTPTool
+
+logger = logging.getLogger(__name__)
+
+PoolKey = Tuple[str, str]
+
+
+@dataclass
+class _MCPConnection:
+    tool: MCPStreamableHTTPTool
+    tools_loaded_at: float
+    last_used: float
+    leases: int = 0
+    owner: Optional["asyncio.Task[None]"] = None
+    closing: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class MCPConnectionManager:
+    """Bounded LRU pool of connected MCP tools with a TTL on the tool catalogue."""
+
+    def __init__(
+        self,
+        max_connections: int | None = None,
+        tool_cache_ttl: float | None = None,
+        idle_check_after: float | None = None,
+    ) -> None:
+        self.max_connections = max_connections or int(os.getenv("MCP_POOL_SIZE", "8"))
+        self.tool_cache_ttl = tool_cache_ttl if tool_cache_ttl is not None else float(os.getenv("MCP_TOOL_CACHE_TTL", "300"))
+        self.idle_check_after = (
+            idle_check_after if idle_check_after is not None else float(os.getenv("MCP_IDLE_CHECK_SECONDS", "60"))
+        )
+        self._connections: "OrderedDict[PoolKey, _MCPConnection]" = OrderedDict()
+        self._connect_locks: Dict[PoolKey, asyncio.Lock] = {}
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _key(url: str, headers: Dict[str, str]) -> PoolKey:
+        return url, headers.get("Authorization", "")
+
+    async def acquire(self, url: str, headers: Dict[str, str]) -> MCPStreamableHTTPTool:
+        """Lease a connected tool for ``url``, reusing a pooled session when possible.
+
+        Every successful call must be paired with ``release(url, headers)``.
+        """
+        key = self._key(url, headers)
+
+        async with self._lock:
+            connect_lock = self._connect_locks.setdefault(key, asyncio.Lock())
+
+        async with connect_lock:
+            conn = self._connections.get(key)
+            if conn is not None and not await self._is_healthy(conn):
+                await self._discard(key)
+                conn = None
+
+            if conn is None:
+                try:
+                    conn = await self._connect(url, headers)
+                except BaseException:
+                    async with self._lock:
+                        self._drop_connect_lock(key)
+                    raise
+                async with self._lock:
+                    self._connections[key] = conn
+            elif time.monotonic() - conn.tools_loaded_at > self.tool_cache_ttl:
+                await self._refresh_tools(conn)
+
+            conn.last_used = time.monotonic()
+            async with self._lock:
+                conn.leases += 1
+                self._connections.move_to_end(key)
+        await self._evict_overflow()
+        return conn.tool
+
+    async def release(self, url: str, headers: Dict[str, str]) -> None:
+        """Return a tool leased by ``acquire``; idle connections beyond the pool size are then closed."""
+        key = self._key(url, headers)
+        async with self._lock:
+            conn = self._connections.get(key)
+            if conn is not None and conn.leases > 0:
+                conn.leases -= 1
+                conn.last_used = time.monotonic()
+        await self._evict_overflow()
+
+    async def _connect(self, url: str, headers: Dict[str, str]) -> _MCPConnection:
+        tool = MCPStreamableHTTPTool(
+            name="mcp-streamable",
+            url=url,
+            headers=headers,
+            timeout=30,
+            request_timeout=30,
+        )
+        now = time.monotonic()
+        conn = _MCPConnection(tool=tool, tools_loaded_at=now, last_used=now)
+        ready: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        conn.owner = asyncio.create_task(self._own(url, conn, ready), name=f"mcp:{url}")
+        try:
+            await ready
+        except BaseException:
+            conn.owner.cancel()
+            raise
+        logger.info("[HEALTHCARE] Connected to MCP server, loaded %s tools", len(tool.functions))
+        return conn
+
+    @staticmethod
+    async def _own(url: str, conn: _MCPConnection, ready: "asyncio.Future[None]") -> None:
+        """Hold the connection open in this task until it is closed."""
+        try:
+            async with conn.tool:
+                ready.set_result(None)
+                await conn.closing.wait()
+        except BaseException as exc:
+            if not ready.done():
+                ready.set_exception(exc)
+            elif not isinstance(exc, asyncio.CancelledError):
+                logger.warning("[HEALTHCARE] Error while closing MCP connection to %s", url)
+
+    async def _is_healthy(self, conn: _MCPConnection) -> bool:
+        # Only ping connections that have sat idle; busy or leased ones are known good.
+        if conn.leases or time.monotonic() - conn.last_used < self.idle_check_after:
+            return True
+        session = getattr(conn.tool, "session", None)
+        if session is None:
+            return False
+        try:
+            await asyncio.wait_for(session.send_ping(), timeout=5)
+            return True
+        except Exception:
+            logger.warning("[HEALTHCARE] Idle MCP connection failed health check; reconnecting.")
+            return False
+
+    async def _refresh_tools(self, conn: _MCPConnection) -> None:
+        load_tools = getattr(conn.tool, "load_tools", None)
+        if load_tools is None:
+            return
+        try:
+            await load_tools()
+            conn.tools_loaded_at = time.monotonic()
+        except Exception:
+            logger.warning("[HEALTHCARE] Failed to refresh MCP tool catalogue; keeping cached tools.")
+
+    def _drop_connect_lock(self, key: PoolKey) -> None:
+        # Called under self._lock. A held lock belongs to a caller that is about to (re)connect.
+        lock = self._connect_locks.get(key)
+        if lock is not None and not lock.locked():
+            del self._connect_locks[key]
+
+    async def _evict_overflow(self) -> None:
+        async with self._lock:
+            overflow = len(self._connections) - self.max_connections
+            # Least recently used first; connections that are leased out are never closed under a caller.
+            idle = [key for key, conn in self._connections.items() if conn.leases == 0][: max(overflow, 0)]
+            evicted = [(key, self._connections.pop(key)) for key in idle]
+            for key in idle:
+                self._drop_connect_lock(key)
+        for key, conn in evicted:
+            await self._close_connection(key, conn)
+
+    async def _discard(self, key: PoolKey) -> None:
+        # Called with the key's connect lock held, so the lock itself is kept.
+        async with self._lock:
+            conn = self._connections.pop(key, None)
+        if conn is not None:
+            await self._close_connection(key, conn)
+
+    @staticmethod
+    async def _close_connection(key: PoolKey, conn: _MCPConnection) -> None:
+        conn.closing.set()
+        if conn.owner is not None:
+            await asyncio.gather(conn.owner, return_exceptions=True)
+
+    async def close(self) -> None:
+        async with self._lock:
+            connections = list(self._connections.items())
+            self._connections.clear()
+            self._connect_locks.clear()
+        for key, conn in connections:
+            await self._close_connection(key, conn)
@@ -0,0 +1,96 @@
+"""
+Prompt assembly for the care workflow steps.
+
+Patient and payer context used to be re-serialized for every step and pasted
+in full into each agent's thread on every turn, although the thread already
+held it. ``PromptContext``:
+
+- serializes each context block once per turn, as canonical JSON, so the same
+  content always renders to the same bytes;
+- puts context blocks ahead of the case-specific lines, so consecutive prompts
+  share a stable prefix that endpoint prompt caching can reuse;
+- replaces a block that an agent's thread already contains with a short
+  reference, tracked by content hash per agent in the session state;
+- counts prompt tokens (with ``tiktoken`` when installed, otherwise about four
+  characters per token).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+try:
+    import tiktoken
+except ImportError:  # optional: approximate counts
+    tiktoken = None
+
+_HASH_CHARS = 12
+
+
+@lru_cache(maxsize=1)
+def _encoding() -> Any:
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:  # encoding files unavailable (e.g. offline)
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+
+@dataclass(frozen=True)
+class ContextBlock:
+    label: str
+    text: str
+    digest: str
+
+
+class PromptContext:
+    def __init__(self, state_store: Dict[str, Any], session_id: str) -> None:
+        self.state_store = state_store
+        self._sent_key = f"{session_id}_context_sent"
+        self._blocks: Dict[str, ContextBlock] = {}
+
+    def begin_turn(self) -> None:
+        """Forget this turn's serialized blocks; context may have changed since the last turn."""
+        self._blocks.clear()
+
+    def block(self, label: str, value: Callable[[], Any]) -> ContextBlock:
+        block = self._blocks.get(label)
+        if block is None:
+            serialized = json.dumps(value(), sort_keys=True, separators=(",", ":"))
+            digest = hashlib.blake2b(serialized.encode(), digest_size=_HASH_CHARS // 2).hexdigest()
+            block = self._blocks[label] = ContextBlock(label, f"{label}: {serialized}", digest)
+        return block
+
+    def _sent(self) -> Dict[str, List[str]]:
+        return self.state_store.get(self._sent_key) or {}
+
+    def render(self, agent_id: Optional[str], blocks: Sequence[ContextBlock], lines: Sequence[str]) -> str:
+        """Context blocks, then ``lines``; blocks already in ``agent_id``'s thread are referenced, not repeated."""
+        sent = self._sent().get(agent_id, []) if agent_id else []
+        parts = [
+            f"{block.label}: unchanged from earlier in this conversation (ref {block.digest})."
+            if block.digest in sent
+            else block.text
+            for block in blocks
+        ]
+        return "\n".join([*parts, *lines])
+
+    def committed(self, agent_id: str, prompt: str) -> None:
+        """Record the blocks ``prompt`` carried in full, now that it is part of ``agent_id``'s thread."""
+        sent = self._sent()
+        known = sent.get(agent_id, [])
+        added = [block.digest for block in self._blocks.values() if block.digest not in known and block.text in prompt]
+        if added:
+            self.state_store[self._sent_key] = {**sent, agent_id: [*known, *added]}
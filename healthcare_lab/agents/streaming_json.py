@@ -0,0 +1,170 @@
+"""
+Incremental extraction of the JSON object an agent streams back.
+
+Agents answer with one JSON object, sometimes inside a code fence or followed
+by prose. ``StreamingJSONParser`` is fed the response chunk by chunk and
+reports each field (up to ``max_depth`` levels deep, outside arrays) as soon as
+its value is complete and parses. If the object those fields came from turns
+out to be malformed, a ``RESET`` entry tells the caller to drop them. Once the
+root object's closing brace arrives and the object parses, ``value`` holds it
+and ``text[start:end]`` is its source, so callers can stop waiting on whatever
+the model writes afterwards.
+"""
+
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+# (path, value); ``RESET`` withdraws every field reported since the previous reset.
+Field = Tuple[Optional[str], Any]
+RESET: Field = (None, None)
+
+
+@dataclass
+class _Frame:
+    kind: str  # "{" or "["
+    path: Tuple[str, ...]
+    # Whether this object's members are reported (objects inside arrays are not).
+    reports: bool
+    key: Optional[str] = None
+    value_start: Optional[int] = None
+    expect_key: bool = True
+
+
+class StreamingJSONParser:
+    def __init__(self, max_depth: int = 2) -> None:
+        self.max_depth = max_depth
+        self.text = ""
+        self.value: Optional[Dict[str, Any]] = None
+        self.start: Optional[int] = None
+        self.end: Optional[int] = None
+        # Whether fields of the root object being read have been reported.
+        self._reported = False
+        self._pos = 0
+        self._root: Optional[int] = None
+        self._frames: List[_Frame] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+
+    @property
+    def done(self) -> bool:
+        return self.value is not None
+
+    def feed(self, chunk: str) -> List[Field]:
+        """Consume ``chunk`` and return the fields completed by it as ``("a.b", value)`` pairs (or ``RESET``)."""
+        if self.done:
+            return []
+        self.text += chunk
+        fields: List[Field] = []
+        text = self.text
+        while self._pos < len(text) and not self.done:
+            i = self._pos
+            self._pos += 1
+            c = text[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._string_closed(i, fields)
+                continue
+
+            if self._root is None:
+                if c == "{":
+                    self._root = i
+                    self._frames = [_Frame("{", (), reports=True)]
+                continue
+
+            frame = self._frames[-1]
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+                self._value_starts(frame, i)
+            elif c == ":" and frame.kind == "{":
+                frame.expect_key = False
+            elif c in "{[":
+                self._value_starts(frame, i)
+                if frame.kind == "{":
+                    path, reports = frame.path + (frame.key or "",), frame.reports
+                else:
+                    path, reports = frame.path, False
+                self._frames.append(_Frame(c, path, reports=reports and c == "{"))
+            elif c in "}]":
+                self._frames.pop()
+                if frame.kind == "{":
+                    self._scalar_ends(frame, i, fields)
+                if not self._frames:
+                    self._root_closed(i, fields)
+                else:
+                    parent = self._frames[-1]
+                    if parent.kind == "{" and parent.key is not None:
+                        self._emit(parent, text[parent.value_start : i + 1], fields)
+            elif c == ",":
+                if frame.kind == "{":
+                    self._scalar_ends(frame, i, fields)
+                    frame.expect_key = True
+            elif not c.isspace():
+                self._value_starts(frame, i)
+        return fields
+
+    def _value_starts(self, frame: _Frame, i: int) -> None:
+        if frame.kind == "{" and not frame.expect_key and frame.key is not None and frame.value_start is None:
+            frame.value_start = i
+
+    def _string_closed(self, i: int, fields: List[Field]) -> None:
+        if not self._frames:
+            return
+        frame = self._frames[-1]
+        if frame.kind != "{":
+            return
+        raw = self.text[self._string_start : i + 1]
+        if frame.expect_key:
+            try:
+                frame.key = json.loads(raw)
+            except json.JSONDecodeError:
+                frame.key = None
+        elif frame.value_start == self._string_start:
+            self._emit(frame, raw, fields)
+
+    def _scalar_ends(self, frame: _Frame, i: int, fields: List[Field]) -> None:
+        if frame.key is not None and frame.value_start is not None:
+            self._emit(frame, self.text[frame.value_start : i].strip(), fields)
+        frame.key = None
+        frame.value_start = None
+
+    def _emit(self, frame: _Frame, raw: str, fields: List[Field]) -> None:
+        path = frame.path + (frame.key or "",)
+        frame.key = None
+        frame.value_start = None
+        if not frame.reports or len(path) > self.max_depth:
+            return
+        try:
+            fields.append((".".join(path), json.loads(raw)))
+        except json.JSONDecodeError:
+            return
+        self._reported = True
+
+    def _root_closed(self, i: int, fields: List[Field]) -> None:
+        try:
+            parsed = json.loads(self.text[self._root or 0 : i + 1])
+        except json.JSONDecodeError:
+            parsed = None
+        if isinstance(parsed, dict):
+            self.value = parsed
+            self.start = self._root
+            self.end = i + 1
+            return
+        # Not the answer (braces in leading prose, or malformed JSON left for the caller to repair):
+        # look for another object after this one rather than inside it.
+        self._pos = i + 1
+        self._root = None
+        self._frames = []
+        if self._reported:
+            fields.append(RESET)
+            self._reported = False
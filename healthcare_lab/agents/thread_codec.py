@@ -0,0 +1,138 @@
+"""
+Compact encoding for serialized ChatAgent threads.
+
+Every agent step used to store the full ``thread.serialize()`` output for its
+agent, so a session held five ever-growing message histories that were rewritten
+after each step. The codec instead keeps one message table per session
+(``{session_id}_thread_messages``) keyed by content hash and stores each thread
+as a list of references into it:
+
+- identical messages are stored once, whichever agent's thread they belong to;
+- threads only grow, so an encode hashes and stores just the messages appended
+  since the previous encode;
+- large messages are zlib-compressed and kept as base64 text so the state stays
+  JSON-serializable for the shared state stores.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import zlib
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+CODEC_VERSION = 1
+COMPRESS_MIN_BYTES = 512
+_HASH_CHARS = 16
+
+Path = Tuple[str, ...]
+
+
+def _canonical(message: Any) -> str:
+    return json.dumps(message, sort_keys=True, separators=(",", ":"))
+
+
+def _hash(canonical: str) -> str:
+    return hashlib.blake2b(canonical.encode(), digest_size=_HASH_CHARS // 2).hexdigest()
+
+
+def _pack(canonical: str) -> str:
+    raw = canonical.encode()
+    if len(raw) < COMPRESS_MIN_BYTES:
+        return "j:" + canonical
+    return "z:" + base64.b64encode(zlib.compress(raw, 6)).decode("ascii")
+
+
+@lru_cache(maxsize=4096)
+def _unpack(packed: str) -> str:
+    # Cached by packed text, so restoring five threads that share messages
+    # decompresses each shared message once.
+    if packed.startswith("z:"):
+        return zlib.decompress(base64.b64decode(packed[2:])).decode()
+    return packed[2:]
+
+
+def _find_messages(node: Any, path: Path = ()) -> Optional[Path]:
+    if isinstance(node, dict):
+        if isinstance(node.get("messages"), list):
+            return path + ("messages",)
+        for key, value in node.items():
+            found = _find_messages(value, path + (key,))
+            if found is not None:
+                return found
+    return None
+
+
+def _get(node: Dict[str, Any], path: Path) -> Any:
+    for key in path:
+        node = node[key]
+    return node
+
+
+def _with_value(node: Dict[str, Any], path: Path, value: Any) -> Dict[str, Any]:
+    """Shallow-copy the dicts along ``path`` and set the leaf to ``value``."""
+    copy = dict(node)
+    if len(path) == 1:
+        copy[path[0]] = value
+    else:
+        copy[path[0]] = _with_value(node[path[0]], path[1:], value)
+    return copy
+
+
+class ThreadStateCodec:
+    """Encodes and decodes thread states against a session's shared message table."""
+
+    def __init__(self, state_store: Dict[str, Any], session_id: str) -> None:
+        self.state_store = state_store
+        self.table_key = f"{session_id}_thread_messages"
+
+    @property
+    def _table(self) -> Dict[str, str]:
+        return self.state_store.setdefault(self.table_key, {})
+
+    @staticmethod
+    def is_encoded(value: Any) -> bool:
+        return isinstance(value, dict) and value.get("codec") == CODEC_VERSION
+
+    def encode(self, thread_state: Dict[str, Any], previous: Any = None) -> Dict[str, Any]:
+        """Encode ``thread_state``; ``previous`` is the last encoding of the same thread."""
+        path = _find_messages(thread_state)
+        if path is None:
+            return {"codec": CODEC_VERSION, "path": None, "refs": [], "state": thread_state}
+
+        messages: List[Any] = _get(thread_state, path)
+        refs: List[str] = []
+        start = 0
+        if self.is_encoded(previous) and previous.get("path") == list(path):
+            old_refs: List[str] = previous["refs"]
+            # Threads are append-only; confirm by re-hashing the last known message.
+            if old_refs and len(old_refs) <= len(messages) and _hash(_canonical(messages[len(old_refs) - 1])) == old_refs[-1]:
+                refs = list(old_refs)
+                start = len(old_refs)
+
+        table = self._table
+        for message in messages[start:]:
+            canonical = _canonical(message)
+            digest = _hash(canonical)
+            if digest not in table:
+                table[digest] = _pack(canonical)
+            refs.append(digest)
+
+        return {
+            "codec": CODEC_VERSION,
+            "path": list(path),
+            "refs": refs,
+            "state": _with_value(thread_state, path, []),
+        }
+
+    def decode(self, value: Any) -> Any:
+        """Rebuild a ``thread.serialize()`` result; passes through unencoded states."""
+        if not self.is_encoded(value):
+            return value
+        if value["path"] is None:
+            return value["state"]
+        table = self._table
+        messages = [json.loads(_unpack(table[digest])) for digest in value["refs"]]
+        return _with_value(value["state"], tuple(value["path"]), messages)
@@ -0,0 +1,265 @@
+"""
+Declarative, dependency-driven workflows for the care team agents.
+
+A workflow is a set of steps, each naming the agent it runs, the steps whose
+outputs it needs, and how to build its prompt from them. Every step starts as
+soon as its inputs have resolved, so independent steps overlap without the
+pattern having to say so. Conditional steps (``when``) are ordinary nodes:
+when the condition is false the step is skipped and its output is ``None``.
+
+Steps that use the same agent share that agent's thread, so they never run at
+the same time; they run in the order they become ready.
+
+With a ``Speculator``, steps that declare a ``Speculation`` start early on a
+guess for their slowest inputs. The early result is kept only if the fields
+the step's result depends on (its speculation ``basis``) are equal for the
+guessed and the real inputs; otherwise it is cancelled and the step runs
+normally. Prompts are not compared: they embed model-written JSON, which
+almost never repeats byte for byte. The ``SpeculationReport`` records the
+wall-clock time saved by hits and the tokens spent on misses.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Generic, List, Optional, Sequence, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class StepResult:
+    text: str
+    payload: Dict[str, Any]
+
+
+# Outputs of a step's declared inputs, by step id; None for skipped steps.
+StepInputs = Dict[str, Optional[StepResult]]
+
+
+@dataclass(frozen=True)
+class Speculation:
+    """Start a step once ``after`` has resolved, guessing the rest of its inputs.
+
+    ``guess`` returns predicted outputs for the inputs not in ``after`` (any it
+    leaves out count as skipped), or None when there is nothing worth betting on.
+    ``basis`` picks, from a step's inputs, the values its result depends on;
+    the early result is kept when they compare equal for the guessed and the
+    resolved inputs.
+    """
+
+    after: Tuple[str, ...]
+    basis: Callable[[StepInputs], Any]
+    guess: Callable[[StepInputs], Optional[StepInputs]] = lambda inputs: {}
+
+
+@dataclass
+class Step:
+    id: str
+    agent_id: str
+    prompt: Callable[[StepInputs], str]
+    inputs: Tuple[str, ...] = ()
+    # Run only if this returns True for the resolved inputs.
+    when: Optional[Callable[[StepInputs], bool]] = None
+    # (kind, message) broadcast to the orchestrator timeline when the step starts.
+    notice: Optional[Tuple[str, str]] = None
+    show_message_in_internal_process: bool = True
+    speculation: Optional[Speculation] = None
+    # Keys the step's JSON must contain (see json_repair.Schema); None uses the agent's schema.
+    schema: Optional[Dict[str, Tuple[str, ...]]] = None
+
+
+def payload(inputs: StepInputs, step_id: str) -> Dict[str, Any]:
+    """Parsed JSON output of ``step_id``, or an empty dict if it was skipped or unparsable."""
+    result = inputs.get(step_id)
+    return result.payload if result else {}
+
+
+class TokenMeter:
+    """Approximate token count (four characters per token) of a speculative run."""
+
+    def __init__(self) -> None:
+        self.chars = 0
+
+    def add(self, text: str) -> None:
+        self.chars += len(text)
+
+    @property
+    def tokens(self) -> int:
+        return self.chars // 4
+
+
+@dataclass
+class SpeculationReport:
+    hits: List[str] = field(default_factory=list)
+    misses: List[str] = field(default_factory=list)
+    seconds_saved: float = 0.0
+    tokens_wasted: int = 0
+
+    def summary(self) -> str:
+        return (
+            f"Speculation: {len(self.hits)} kept, {len(self.misses)} discarded; "
+            f"saved {self.seconds_saved:.1f}s, wasted ~{self.tokens_wasted} tokens."
+        )
+
+
+StepExecutor = Callable[[Step, StepInputs], Awaitable[StepResult]]
+Announcer = Callable[[str, str], Awaitable[None]]
+
+
+@dataclass
+class Speculator:
+    # Runs a step off the record (no UI streaming, no thread updates), metering its tokens.
+    execute: Callable[[Step, StepInputs, TokenMeter], Awaitable[StepResult]]
+    # Publishes an accepted result as if the step had just run; False if it can no longer be applied.
+    commit: Callable[[Step, StepResult], Awaitable[bool]]
+    # Releases whatever ``execute`` kept for a result that will not be committed.
+    discard: Optional[Callable[[Step], None]] = None
+    report: SpeculationReport = field(default_factory=SpeculationReport)
+
+
+class _SpeculativeRun:
+    def __init__(self, step: Step, speculation: Speculation, inputs: StepInputs, speculator: Speculator) -> None:
+        self.step = step
+        self.speculation = speculation
+        self.basis = speculation.basis(inputs)
+        self.meter = TokenMeter()
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        self.task = asyncio.create_task(self._run(speculator, inputs), name=f"speculate:{step.id}")
+
+    async def _run(self, speculator: Speculator, inputs: StepInputs) -> StepResult:
+        try:
+            return await speculator.execute(self.step, inputs, self.meter)
+        finally:
+            self.finished = time.monotonic()
+
+    async def settle(self, inputs: StepInputs, ready: float, speculator: Speculator) -> Optional[StepResult]:
+        """Return the early result if it still applies to ``inputs``; otherwise discard it."""
+        if self.speculation.basis(inputs) == self.basis:
+            try:
+                result = await self.task
+            except Exception:
+                logger.warning("Speculative run of %s failed", self.step.id, exc_info=True)
+            else:
+                if await speculator.commit(self.step, result):
+                    speculator.report.hits.append(self.step.id)
+                    speculator.report.seconds_saved += min(ready, self.finished or ready) - self.started
+                    return result
+        await self.discard(speculator)
+        return None
+
+    async def discard(self, speculator: Speculator) -> None:
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        if speculator.discard is not None:
+            speculator.discard(self.step)
+        speculator.report.misses.append(self.step.id)
+        speculator.report.tokens_wasted += self.meter.tokens
+
+
+@dataclass
+class WorkflowDAG(Generic[T]):
+    name: str
+    steps: Sequence[Step]
+    # Builds the workflow's result from every step's output.
+    result: Callable[[StepInputs], T]
+    notice: Optional[Tuple[str, str]] = None
+    _order: List[Step] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self._order = self._topological_order()
+
+    def _topological_order(self) -> List[Step]:
+        by_id: Dict[str, Step] = {}
+        for step in self.steps:
+            if step.id in by_id:
+                raise ValueError(f"Workflow {self.name!r} defines step {step.id!r} twice")
+            by_id[step.id] = step
+        for step in self.steps:
+            for dependency in step.inputs:
+                if dependency not in by_id:
+                    raise ValueError(f"Step {step.id!r} depends on unknown step {dependency!r}")
+            if step.speculation and not set(step.speculation.after) <= set(step.inputs):
+                raise ValueError(f"Step {step.id!r} speculates after steps it does not depend on")
+
+        order: List[Step] = []
+        state: Dict[str, int] = {}  # 1 = visiting, 2 = done
+
+        def visit(step: Step) -> None:
+            if state.get(step.id) == 2:
+                return
+            if state.get(step.id) == 1:
+                raise ValueError(f"Workflow {self.name!r} has a dependency cycle through {step.id!r}")
+            state[step.id] = 1
+            for dependency in step.inputs:
+                visit(by_id[dependency])
+            state[step.id] = 2
+            order.append(step)
+
+        for step in self.steps:
+            visit(step)
+        return order
+
+    async def run(self, execute: StepExecutor, announce: Announcer, speculator: Optional[Speculator] = None) -> T:
+        """Run every step as soon as its inputs are ready and return ``result``."""
+        if self.notice:
+            await announce(*self.notice)
+
+        agent_locks: Dict[str, asyncio.Lock] = {}
+        tasks: Dict[str, asyncio.Task] = {}
+        speculative_runs: List[_SpeculativeRun] = []
+
+        async def resolve(step_ids: Sequence[str]) -> StepInputs:
+            return dict(zip(step_ids, await asyncio.gather(*(tasks[step_id] for step_id in step_ids))))
+
+        async def speculate(step: Step, speculation: Speculation) -> Optional[_SpeculativeRun]:
+            known = await resolve(speculation.after)
+            guessed = speculation.guess(known)
+            if guessed is None:
+                return None
+            inputs: StepInputs = {step_id: None for step_id in step.inputs}
+            inputs.update({step_id: value for step_id, value in guessed.items() if step_id in inputs})
+            inputs.update(known)
+            if step.when is not None and not step.when(inputs):
+                return None
+            early = _SpeculativeRun(step, speculation, inputs, speculator)
+            speculative_runs.append(early)
+            return early
+
+        async def run_step(step: Step) -> Optional[StepResult]:
+            early = None
+            if speculator is not None and step.speculation is not None:
+                early = await speculate(step, step.speculation)
+            inputs = await resolve(step.inputs)
+            ready = time.monotonic()
+            if step.when is not None and not step.when(inputs):
+                if early is not None:
+                    await early.discard(speculator)
+                return None
+            async with agent_locks.setdefault(step.agent_id, asyncio.Lock()):
+                if step.notice:
+                    await announce(*step.notice)
+                if early is not None:
+                    result = await early.settle(inputs, ready, speculator)
+                    if result is not None:
+                        return result
+                return await execute(step, inputs)
+
+        # Topological order guarantees every dependency's task exists before its dependents.
+        for step in self._order:
+            tasks[step.id] = asyncio.create_task(run_step(step), name=f"{self.name}:{step.id}")
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            pending = [*tasks.values(), *(early.task for early in speculative_runs)]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            raise
+        return self.result({step_id: task.result() for step_id, task in tasks.items()})
@@ -0,0 +1,31 @@
+from healthcare_lab.agents.streaming_json import RESET, StreamingJSONParser
+
+
+def feed_in_chunks(parser, text, size=4):
+    events = []
+    for i in range(0, len(text), size):
+        events.append((parser.done, parser.feed(text[i : i + size])))
+    return events
+
+
+def test_field_is_reported_before_the_object_closes():
+    parser = StreamingJSONParser()
+    text = '```json\n{"triage_assessment": {"urgency_level": "urgent", "rationale": ["chest pain"]}, "sbar_note": "x"}\n```'
+    events = feed_in_chunks(parser, text)
+
+    reported_at = next(
+        index for index, (_, fields) in enumerate(events) if ("triage_assessment.urgency_level", "urgent") in fields
+    )
+    assert not events[reported_at][0]
+    assert not any(done for done, _ in events[: reported_at + 1])
+    assert parser.done
+    assert parser.text[parser.start : parser.end].startswith('{"triage_assessment"')
+
+
+def test_fields_of_a_malformed_object_are_withdrawn():
+    parser = StreamingJSONParser()
+    fields = [field for _, batch in feed_in_chunks(parser, '{"a": 1,}  {"b": 2} trailing', size=3) for field in batch]
+
+    assert fields == [("a", 1), RESET, ("b", 2)]
+    assert parser.value == {"b": 2}
+    assert parser.text[parser.start : parser.end] == '{"b": 2}'
@@ -108,7 +108,6 @@ let notificationsEnabled = true;
 let toastTimer = null;
 const conversationLog = [];
 let lastMobileTab = "chat";
-let suppressPersist = false;
 
 /* ─── Dark Mode ─── */
 function initTheme() {
@@ -484,9 +483,6 @@ function appendTimeline(kind, content) {
   item.appendChild(meta);
   item.appendChild(body);
   handoffList.prepend(item);
-  if (!suppressPersist) {
-    persistEvent("handoff", { kind, content });
-  }
 }
 
 function appendMessage(role, content) {
@@ -513,9 +509,7 @@ function appendMessage(role, content) {
     chatMessages.scrollTop = chatMessages.scrollHeight;
   }
   updateScrollButton();
-  if (!suppressPersist) {
-    persistEvent("message", { role, content });
-  }
+  return item;
 }
 
 function formatMessage(text) {
@@ -626,6 +620,7 @@ function renderSectionBody(lines) {
 
 async function resetSession() {
   sessionId = crypto.randomUUID();
+  historyBefore = null;
   agentState = {};
   currentAgents = new Set();
   handoffList.innerHTML = "";
@@ -642,6 +637,7 @@ async function resetSession() {
     }
     connectWebSocket();
   } else {
+    sessionCache.clear();
     if (typeof setPreviewMode === "function") {
       setPreviewMode(true);
     }
@@ -649,6 +645,10 @@ async function resetSession() {
 }
 
 let ws;
+// Last event seq seen for streamSessionId; sent as resume_from on reconnect.
+let lastSeq = 0;
+let streamSessionId = null;
+
 function getSelectedPattern() {
   const active = patternOptions?.querySelector(".pattern-btn.active");
   return active?.dataset?.pattern || "sequential";
@@ -672,10 +672,20 @@ function connectWebSocket() {
   ws = new WebSocket(wsUrl);
   ws.onopen = () => {
     removeSkeleton();
-    ws.send(JSON.stringify({ session_id: sessionId, access_token: getToken(), pattern: getSelectedPattern() }));
+    const hello = { session_id: sessionId, access_token: getToken(), pattern: getSelectedPattern() };
+    if (streamSessionId === sessionId) {
+      hello.resume_from = lastSeq;
+    } else {
+      streamSessionId = sessionId;
+      lastSeq = 0;
+    }
+    ws.send(JSON.stringify(hello));
   };
   ws.onmessage = (event) => {
     const payload = JSON.parse(event.data);
+    if (typeof payload.seq === "number" && payload.type !== "resync_required") {
+      lastSeq = Math.max(lastSeq, payload.seq);
+    }
     handleEvent(payload);
   };
   ws.onclose = (event) => {
@@ -707,6 +717,7 @@ function handleEvent(event) {
       break;
     case "agent_message":
       currentAgents.delete(event.agent_id);
+      provisionalSnapshots.delete(event.agent_id);
       if (!agentState[event.agent_id]) agentState[event.agent_id] = {};
       agentState[event.agent_id].finalMessage = event.content || "";
       agentState[event.agent_id].complete = true;
@@ -723,6 +734,24 @@ function handleEvent(event) {
       renderStages();
       updateRiskFromText(event.content || "");
       break;
+    case "agent_field":
+      // Structured fields arrive as soon as they are complete, ahead of agent_message.
+      if (!provisionalSnapshots.has(event.agent_id)) {
+        provisionalSnapshots.set(event.agent_id, snapshotProvisional());
+      }
+      if (event.path === "triage_assessment.urgency_level") {
+        updateRiskFromText(String(event.value || ""));
+      } else if (event.agent_id === "diagnostics_orders" && !event.path.includes(".")) {
+        updateArtifacts(JSON.stringify({ [event.path]: event.value }));
+      }
+      break;
+    case "agent_field_reset":
+      // The fields came from a malformed object: put the panels back as they were before them.
+      if (provisionalSnapshots.has(event.agent_id)) {
+        restoreProvisional(provisionalSnapshots.get(event.agent_id));
+        provisionalSnapshots.delete(event.agent_id);
+      }
+      break;
     case "tool_called":
       appendTimeline("tool", `${event.agent_id}: ${event.tool_name}`);
       break;
@@ -739,6 +768,17 @@ function handleEvent(event) {
       removeTypingIndicator();
       if (typeof handleTokenExpired === "function") handleTokenExpired();
       break;
+    case "queue":
+      if (event.position > 0 && typeof showToast === "function") {
+        showToast(`Queued behind ${event.position} workflow${event.position === 1 ? "" : "s"}...`, { icon: "&#8987;" });
+      }
+      break;
+    case "resync_required":
+      // Missed events are no longer buffered server-side; reload the session instead.
+      lastSeq = event.seq || 0;
+      removeTypingIndicator();
+      loadSessionById(sessionId);
+      break;
     default:
       break;
   }
@@ -813,17 +853,113 @@ async function fetchSessions() {
   }
 }
 
+// Session histories already loaded, by id: { data, cursor, etag }. Revisits
+// only fetch what was added since `cursor`.
+const sessionCache = new Map();
+const SESSION_PAGE_SIZE = 200;
+
+function cacheSessionPage(id, data, etag) {
+  sessionCache.set(id, { data, cursor: data.cursor, etag });
+}
+
+async function fetchSessionHistory(id) {
+  const cached = sessionCache.get(id);
+  const url = cached
+    ? `/api/sessions/${id}?since=${encodeURIComponent(cached.cursor)}`
+    : `/api/sessions/${id}?limit=${SESSION_PAGE_SIZE}`;
+  const headers = { Authorization: "Bearer " + getToken() };
+  if (cached?.etag) headers["If-None-Match"] = cached.etag;
+  const res = await fetch(url, { headers });
+  if (res.status === 304 && cached) return cached.data;
+  if (!res.ok) return null;
+  const page = await res.json();
+  const data = cached
+    ? {
+        ...cached.data,
+        session: page.session,
+        messages: [...(cached.data.messages || []), ...(page.messages || [])],
+        artifacts: [...(cached.data.artifacts || []), ...(page.artifacts || [])],
+        handoffs: [...(cached.data.handoffs || []), ...(page.handoffs || [])],
+        cursor: page.cursor,
+      }
+    : page;
+  cacheSessionPage(id, data, res.headers.get("ETag"));
+  return data;
+}
+
+// Cursor for the next older page of the session shown; null once it is all loaded.
+let historyBefore = null;
+
+function renderLoadEarlier() {
+  chatMessages.querySelector(".load-earlier")?.remove();
+  if (!historyBefore) return;
+  const button = document.createElement("button");
+  button.type = "button";
+  button.className = "load-earlier";
+  button.textContent = "Load earlier messages";
+  button.addEventListener("click", loadEarlierHistory);
+  chatMessages.prepend(button);
+}
+
+async function loadEarlierHistory(event) {
+  const id = sessionId;
+  const before = historyBefore;
+  if (!id || !before || typeof getToken !== "function" || !getToken()) return;
+  const button = event?.currentTarget;
+  if (button) button.disabled = true;
+  try {
+    const res = await fetch(
+      `/api/sessions/${id}?before=${encodeURIComponent(before)}&limit=${SESSION_PAGE_SIZE}`,
+      { headers: { Authorization: "Bearer " + getToken() } }
+    );
+    if (!res.ok || id !== sessionId) return;
+    const page = await res.json();
+    prependHistory(page);
+    const cached = sessionCache.get(id);
+    if (cached) {
+      cached.data = {
+        ...cached.data,
+        messages: [...(page.messages || []), ...(cached.data.messages || [])],
+        artifacts: [...(page.artifacts || []), ...(cached.data.artifacts || [])],
+        handoffs: [...(page.handoffs || []), ...(cached.data.handoffs || [])],
+        before: page.before,
+        has_more: page.has_more,
+      };
+    }
+  } catch {
+    // ignore
+  } finally {
+    if (button) button.disabled = false;
+  }
+}
+
+function prependHistory(page) {
+  const anchor = chatMessages.querySelector(".message");
+  const previousHeight = chatMessages.scrollHeight;
+  const previousTop = chatMessages.scrollTop;
+  const messages = page.messages || [];
+  messages.forEach((msg) => {
+    chatMessages.insertBefore(appendMessage(msg.role || "assistant", msg.content || ""), anchor);
+  });
+  conversationLog.unshift(...messages.map((msg) => ({ role: msg.role || "assistant", content: msg.content || "" })));
+  // The timeline lists newest first, so older handoffs go below the ones shown.
+  [...(page.handoffs || [])].reverse().forEach((item) => {
+    appendTimeline(item.kind || "info", item.content || "");
+    handoffList.appendChild(handoffList.firstElementChild);
+  });
+  // Older artifacts are not replayed: the panel already shows the newest ones.
+  historyBefore = page.has_more ? page.before : null;
+  renderLoadEarlier();
+  // Keep the messages that were on screen where they were.
+  chatMessages.scrollTop = previousTop + (chatMessages.scrollHeight - previousHeight);
+}
+
 async function loadSessionById(id) {
   if (typeof getToken !== "function" || !getToken()) return;
   try {
-    const res = await fetch(`/api/sessions/${id}`, {
-      headers: { Authorization: "Bearer " + getToken() },
-    });
-    if (res.ok) {
-      const data = await res.json();
-      if (typeof hydrateSession === "function") {
-        hydrateSession(data);
-      }
+    const data = await fetchSessionHistory(id);
+    if (data && typeof hydrateSession === "function") {
+      hydrateSession(data);
     }
   } catch {
     // ignore
@@ -848,25 +984,8 @@ async function createRemoteSession() {
   }
 }
 
-async function persistEvent(eventType, payload) {
-  if (typeof getToken !== "function" || !getToken()) return;
-  try {
-    await fetch(`/api/sessions/${sessionId}/events`, {
-      method: "POST",
-      headers: {
-        "Content-Type": "application/json",
-        Authorization: "Bearer " + getToken(),
-      },
-      body: JSON.stringify({ event_type: eventType, payload }),
-    });
-  } catch {
-    // ignore persistence failures in demo
-  }
-}
-
 function hydrateSession(data) {
   if (!data || !data.session) return;
-  suppressPersist = true;
   sessionId = data.session.id;
   agentState = {};
   currentAgents = new Set();
@@ -894,12 +1013,13 @@ function hydrateSession(data) {
     }
   });
 
+  historyBefore = data.has_more ? data.before : null;
+  renderLoadEarlier();
   renderStages();
   if (memoryDrawerBody && data.session.summary) {
     memoryDrawerBody.textContent = data.session.summary;
     memoryPill?.classList.remove("hidden");
   }
-  suppressPersist = false;
 }
 
 function updateRiskFromText(text) {
@@ -953,9 +1073,6 @@ function updateArtifacts(messageText) {
       orderList.appendChild(row);
     });
   }
-  if (!suppressPersist) {
-    persistEvent("artifact", { artifact_type: "diagnostics", data: json });
-  }
 }
 
 function extractJson(text) {
@@ -974,6 +1091,37 @@ function truncate(text, maxLen) {
   return text.length > maxLen ? `${text.slice(0, maxLen)}...` : text;
 }
 
+// Risk and artifact panel state from before an agent's first provisional field, by agent.
+const provisionalSnapshots = new Map();
+
+function snapshotProvisional() {
+  return {
+    riskText: riskPill?.textContent,
+    riskDanger: riskPill?.classList.contains("danger"),
+    riskSummary: riskSummary?.textContent,
+    sbarBackground: sbarBackground?.textContent,
+    sbarRecommendation: sbarRecommendation?.textContent,
+    orders: orderList?.innerHTML,
+    hidden: ["artifact-empty", "artifact-sbar", "artifact-orders"].map((id) =>
+      document.getElementById(id).classList.contains("hidden")
+    ),
+  };
+}
+
+function restoreProvisional(snapshot) {
+  if (riskPill) {
+    riskPill.textContent = snapshot.riskText;
+    riskPill.classList.toggle("danger", snapshot.riskDanger);
+  }
+  if (riskSummary) riskSummary.textContent = snapshot.riskSummary;
+  if (sbarBackground) sbarBackground.textContent = snapshot.sbarBackground;
+  if (sbarRecommendation) sbarRecommendation.textContent = snapshot.sbarRecommendation;
+  if (orderList) orderList.innerHTML = snapshot.orders;
+  ["artifact-empty", "artifact-sbar", "artifact-orders"].forEach((id, index) => {
+    document.getElementById(id).classList.toggle("hidden", snapshot.hidden[index]);
+  });
+}
+
 function resetArtifacts() {
   document.getElementById("artifact-empty").classList.remove("hidden");
   document.getElementById("artifact-sbar").classList.add("hidden");
@@ -1175,6 +1323,7 @@ function initApp() {
 // Allow auth module to reset UI on logout
 window.resetSession = resetSession;
 window.hydrateSession = hydrateSession;
+window.cacheSessionPage = cacheSessionPage;
 window.fetchSessions = fetchSessions;
 function showSessionModal(sessions) {
   if (!sessionModal || !sessionModalList) return;
@@ -1185,13 +1334,7 @@ function showSessionModal(sessions) {
       el.className = "session-item";
       el.innerHTML = `<strong>${s.title || "Session"} · ${s.id.slice(0, 6)}</strong><small>${s.updated_at || ""}</small>`;
       el.addEventListener("click", () => {
-        if (typeof hydrateSession === "function") {
-          fetch(`/api/sessions/${s.id}`, {
-            headers: { Authorization: "Bearer " + getToken() },
-          })
-            .then((r) => r.json())
-            .then((data) => hydrateSession(data));
-        }
+        loadSessionById(s.id);
         sessionModal.classList.add("hidden");
       });
       sessionModalList.appendChild(el);
@@ -1211,11 +1354,12 @@ sessionNewBtn?.addEventListener("click", async () => {
 sessionResumeBtn?.addEventListener("click", async () => {
   if (sessionModal) sessionModal.classList.add("hidden");
   try {
-    const res = await fetch("/api/sessions/latest", {
+    const res = await fetch(`/api/sessions/latest?limit=${SESSION_PAGE_SIZE}`, {
       headers: { Authorization: "Bearer " + getToken() },
     });
     if (res.ok) {
       const data = await res.json();
+      cacheSessionPage(data.session.id, data, res.headers.get("ETag"));
       hydrateSession(data);
     } else {
       await resetSession();
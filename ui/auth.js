@@ -297,11 +297,15 @@ async function handleRegister(e) {
 
 async function resumeLatestSession() {
   try {
-    const res = await fetch("/api/sessions/latest", {
+    const res = await fetch("/api/sessions/latest?limit=200", {
       headers: { Authorization: "Bearer " + getToken() },
     });
     if (res.ok) {
       const data = await res.json();
+      // Cached so that revisits fetch only deltas and "Load earlier messages" can page further back.
+      if (data.session && typeof window.cacheSessionPage === "function") {
+        window.cacheSessionPage(data.session.id, data, res.headers.get("ETag"));
+      }
       if (typeof window.hydrateSession === "function") {
         window.hydrateSession(data);
       } else if (typeof initApp === "function") {